@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import os
+import os.path
+import sys
+import glob
+import time
+import traceback
+import multiprocessing
+from optparse import OptionParser
+import simplejson as json
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from lightning_svg import LightningSvg
+
+EXTENSIONS = ('.xml', '.swf')
+
+def find_inputs(patterns):
+    """(input, relative output name) for directories, glob patterns and files.
+
+    files under a directory keep their path relative to it, and files
+    matched by a glob pattern their path relative to the directory the
+    pattern starts with, so files in different directories keep apart.
+    """
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() in EXTENSIONS:
+                        filepath = os.path.join(dirpath, filename)
+                        inputs.append((filepath, os.path.relpath(filepath, pattern)))
+        else:
+            basedir = os.path.dirname(pattern)
+            while glob.has_magic(basedir):
+                basedir = os.path.dirname(basedir)
+            for filepath in sorted(glob.glob(pattern)):
+                if os.path.isfile(filepath):
+                    inputs.append((filepath, os.path.relpath(filepath, basedir or os.curdir)))
+    return inputs
+
+def convert(inputpath, outputpath, options):
+    """converts one file to html and returns the size written"""
+    with open(inputpath, 'rb') as fp:
+        result = LightningSvg().xml2svg(fp, **options)
+    html = result[0]
+
+    dirname = os.path.dirname(outputpath)
+    if dirname and not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            if not os.path.isdir(dirname):
+                raise
+    with open(outputpath, 'w') as fp:
+        fp.write(html)
+    return len(html)
+
+def current_rss():
+    """resident set size of this process in bytes, None if unknown"""
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return peak_rss()
+
+def peak_rss():
+    """peak resident set size of this process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+def _worker(conn, max_jobs, max_rss, options):
+    # messages go through a pipe without a feeder thread, so everything
+    # sent before the process dies reaches the parent
+    pid = os.getpid()
+    jobs = 0
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        index, inputpath, outputpath = task
+
+        start = time.time()
+        size = None
+        error = None
+        try:
+            size = convert(inputpath, outputpath, options)
+        except Exception:
+            error = traceback.format_exc()
+        wall_time = time.time() - start
+
+        conn.send(('done', index, {'status': 'failed' if error else 'ok',
+                                   'wall_time': wall_time,
+                                   'worker_peak_rss': peak_rss(),
+                                   'output_bytes': size,
+                                   'error': error,
+                                   'worker': pid}))
+        jobs += 1
+        if max_jobs and jobs >= max_jobs:
+            break
+        if max_rss:
+            rss = current_rss()
+            if rss is not None and rss > max_rss:
+                break
+    conn.send(('exit', None, None))
+    conn.close()
+
+class _Worker(object):
+    def __init__(self, max_jobs, max_rss, options):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker,
+                                               args=(child_conn, max_jobs, max_rss, options))
+        self.process.start()
+        child_conn.close()
+        self.index = None
+        self.retired = False
+
+    def send(self, task):
+        self.index = task[0]
+        self.conn.send(task)
+
+    def receive(self):
+        """next message, or None when there is none or the process is gone"""
+        try:
+            if self.conn.poll():
+                return self.conn.recv()
+        except (EOFError, IOError):
+            pass
+        return None
+
+    def close(self):
+        if not self.retired and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except IOError:
+                pass
+        self.process.join()
+        self.conn.close()
+
+class BatchConverter(object):
+    """converts files to html on worker processes.
+
+    a worker is replaced after max_jobs files, or once its resident set
+    grows over max_rss bytes. a file which raises, or whose worker dies,
+    is recorded as failed and the rest of the batch goes on. so is a file
+    whose output is the one of a file before it, such as x.xml and x.swf,
+    without being converted. worker_peak_rss is the peak of the worker
+    over every file it has converted so far, not of the file alone.
+    """
+
+    POLL = 0.01
+
+    def __init__(self, outdirname, processes=None, max_jobs=100, max_rss=None, **options):
+        self.outdirname = outdirname
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.options = options
+
+    def run(self, inputs):
+        """converts (input, relative name) pairs and returns the manifest"""
+        start = time.time()
+        files = []
+        tasks = []
+        written = {}
+        for index, (inputpath, name) in enumerate(inputs):
+            outputpath = os.path.join(self.outdirname, os.path.splitext(name)[0] + '.html')
+            key = os.path.normcase(os.path.abspath(outputpath))
+            if key in written:
+                files.append({'input': inputpath, 'output': outputpath, 'status': 'failed',
+                              'error': 'output is also written for %s' % inputs[written[key]][0]})
+                continue
+            written[key] = index
+            files.append({'input': inputpath, 'output': outputpath, 'status': None})
+            tasks.append((index, inputpath, outputpath))
+        tasks.reverse()
+
+        workers = []
+        remaining = len(tasks)
+
+        while remaining > 0:
+            while tasks and len(workers) < self.processes:
+                workers.append(_Worker(self.max_jobs, self.max_rss, self.options))
+
+            for worker in workers:
+                if worker.index is None and not worker.retired and tasks:
+                    worker.send(tasks.pop())
+
+            received = False
+            for worker in workers[:]:
+                # checked before reading, so nothing sent before the exit is missed
+                alive = worker.process.is_alive()
+                message = worker.receive()
+                while message is not None:
+                    received = True
+                    kind, index, info = message
+                    if kind == 'done':
+                        files[index].update(info)
+                        worker.index = None
+                        remaining -= 1
+                    elif kind == 'exit':
+                        worker.retired = True
+                    message = worker.receive()
+
+                if worker.retired or not alive:
+                    if worker.index is not None:
+                        files[worker.index].update({'status': 'failed',
+                                                    'error': 'worker exited with %s' % worker.process.exitcode,
+                                                    'worker': worker.process.pid})
+                        remaining -= 1
+                        worker.index = None
+                    worker.close()
+                    workers.remove(worker)
+
+            if not received:
+                time.sleep(self.POLL)
+
+        for worker in workers:
+            worker.close()
+
+        return {'outdir': self.outdirname,
+                'processes': self.processes,
+                'wall_time': time.time() - start,
+                'succeeded': len([f for f in files if f['status'] == 'ok']),
+                'failed': len([f for f in files if f['status'] != 'ok']),
+                'files': files}
+
+def main(argv):
+    parser = OptionParser(usage='usage: python %prog [options] output_directory input(dir|glob|file)...')
+    parser.add_option('-j', '--processes', type='int', default=None,
+                      help='number of worker processes (default: number of cpus)')
+    parser.add_option('--max-jobs', type='int', default=100,
+                      help='files converted by a worker before it is replaced (0: no limit)')
+    parser.add_option('--max-rss', type='int', default=0,
+                      help='resident set size in MB above which a worker is replaced (0: no limit)')
+    parser.add_option('-m', '--manifest', default=None,
+                      help='path of the json manifest (default: output_directory/manifest.json)')
+    parser.add_option('--mcname', default=None, help='name of the movie clip to convert')
+    parser.add_option('--key-prefix', default='', help='prefix of the css class names')
+    parser.add_option('--use-symbols', action='store_true', default=False,
+                      help='emit each shape once and reference it with use')
+    parser.add_option('--cache-dir', default=None, help='directory of the rendered shape cache')
+    parser.add_option('--streaming', action='store_true', default=False,
+                      help='parse xml input incrementally')
+    options, args = parser.parse_args(argv)
+
+    if len(args) < 2:
+        parser.print_usage()
+        return 1
+
+    outdirname = args[0]
+    inputs = find_inputs(args[1:])
+
+    converter = BatchConverter(outdirname,
+                               processes=options.processes,
+                               max_jobs=options.max_jobs,
+                               max_rss=options.max_rss * 1024 * 1024,
+                               mcname=options.mcname,
+                               key_prefix=options.key_prefix,
+                               use_symbols=options.use_symbols,
+                               cache_dir=options.cache_dir,
+                               streaming=options.streaming)
+    manifest = converter.run(inputs)
+
+    manifestpath = options.manifest or os.path.join(outdirname, 'manifest.json')
+    if not os.path.exists(os.path.dirname(os.path.abspath(manifestpath))):
+        os.makedirs(os.path.dirname(os.path.abspath(manifestpath)))
+    with open(manifestpath, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+
+    print '%d converted, %d failed in %.2fs' % (manifest['succeeded'], manifest['failed'], manifest['wall_time'])
+    if manifest['failed'] > 0:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
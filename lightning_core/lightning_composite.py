@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+from copy import deepcopy
+from lxml import etree
+
+from lightning_svg import LightningSvg
+
+class LightningElement(object):
+    def __init__(self, html, css, div, anims):
+        self.html = html
+        self.css = css
+        self.div = div
+        self.anims = anims
+
+def get_lightning_element(filepath, mcname=None, key_prefix='', scale=1.0, short_names=False):
+    with open(filepath, 'r') as f:
+        return LightningElement(*(LightningSvg().xml2svg(f, mcname=mcname, key_prefix=key_prefix, has_anim_name=False, scale=scale, short_names=short_names)))
+
+class Compositor(object):
+    """puts converted parts into the divs of a base by id.
+
+    the base is converted once. a combination maps slot ids to parts,
+    given as (filepath, mcname, key_prefix), and each part is converted
+    once. for each set of slots, the base is serialized once around
+    them, so making a combination only joins strings.
+
+    with short_names, parts need key prefixes different from each other
+    and from the base to keep their class names apart.
+    """
+
+    MARKER = 'lightning-slot'
+
+    def __init__(self, basepath, mcname=None, key_prefix='base', scale=1.0, short_names=False):
+        self.scale = scale
+        self.short_names = short_names
+        self.base = get_lightning_element(basepath, mcname, key_prefix, scale, short_names)
+        self._tree = etree.fromstring(self.base.div)
+
+        # paths of the slot divs, in document order
+        self._slots = {}
+        for elm in self._tree.iterfind('.//div'):
+            slot_id = elm.get('id')
+            if slot_id is not None:
+                self._slots.setdefault(slot_id, []).append(self._get_path(elm))
+
+        self._parts = {}
+        self._templates = {}
+
+    def _get_path(self, elm):
+        path = []
+        while elm.getparent() is not None:
+            path.append(elm.getparent().index(elm))
+            elm = elm.getparent()
+        path.reverse()
+        return tuple(path)
+
+    def _find(self, tree, path):
+        elm = tree
+        for i in path:
+            elm = elm[i]
+        return elm
+
+    @property
+    def slots(self):
+        return sorted(self._slots.keys())
+
+    def get_part(self, filepath, mcname=None, key_prefix=''):
+        key = (filepath, mcname, key_prefix)
+        part = self._parts.get(key)
+        if part is None:
+            part = get_lightning_element(filepath, mcname, key_prefix, self.scale, self.short_names)
+            # serialized as it is inside the base
+            part.div = etree.tostring(etree.fromstring(part.div))
+            self._parts[key] = part
+        return part
+
+    def _get_template(self, slot_ids):
+        # (fragments of the base, slot id between each of them)
+        slot_ids = frozenset(slot_ids)
+        template = self._templates.get(slot_ids)
+        if template is not None:
+            return template
+
+        for slot_id in slot_ids:
+            if slot_id not in self._slots:
+                raise ValueError('no div with id %s' % slot_id)
+
+        tree = deepcopy(self._tree)
+        elms = [(path, self._find(tree, path), slot_id)
+                for slot_id in slot_ids for path in self._slots[slot_id]]
+        elms.sort()
+
+        order = []
+        for path, elm, slot_id in elms:
+            # a slot inside another one is replaced with it
+            if any(path[:len(p)] == p for p, s in order):
+                continue
+            marker = etree.Element(self.MARKER)
+            elm.getparent().replace(elm, marker)
+            order.append((path, slot_id))
+
+        fragments = etree.tostring(tree).split('<%s/>' % self.MARKER)
+        template = (fragments, [slot_id for path, slot_id in order])
+        self._templates[slot_ids] = template
+        return template
+
+    def make_html(self, combination):
+        """html of the base with the parts of combination, a dict of slot
+        id to (filepath, mcname, key_prefix)"""
+        parts = dict((slot_id, self.get_part(*part)) for slot_id, part in combination.iteritems())
+        fragments, order = self._get_template(parts.keys())
+
+        div = [fragments[0]]
+        for slot_id, fragment in zip(order, fragments[1:]):
+            div.append(parts[slot_id].div)
+            div.append(fragment)
+
+        used = []
+        for slot_id in order:
+            if parts[slot_id] not in used:
+                used.append(parts[slot_id])
+        css = self.base.css + ''.join(part.css for part in used)
+        anims = ','.join(part.anims for part in used if part.anims)
+        return LightningSvg().make_html(''.join(div), css, anims)
+
+    def write(self, output_path, combination):
+        with open(output_path, 'w') as f:
+            f.write(self.make_html(combination))
+
+    def write_all(self, combinations):
+        """writes (output_path, combination) pairs, returns how many"""
+        count = 0
+        for output_path, combination in combinations:
+            self.write(output_path, combination)
+            count += 1
+        return count
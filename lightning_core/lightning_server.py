@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import os
+import sys
+import logging
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from collections import OrderedDict
+from optparse import OptionParser
+import simplejson as json
+
+from lightning_service import *
+
+def parse_options(query):
+    """xml2svg options from a query string, ValueError if one is wrong"""
+    options = {}
+    for k, values in urlparse.parse_qs(query, keep_blank_values=True).iteritems():
+        value = values[-1]
+        if k in ('mcname', 'key_prefix'):
+            options[k] = value
+        elif k == 'scale':
+            options[k] = float(value)
+        elif k == 'has_anim_name':
+            if value.lower() not in ('1', 'true', '0', 'false'):
+                raise ValueError('has_anim_name must be true or false')
+            options[k] = value.lower() in ('1', 'true')
+        else:
+            raise ValueError('unknown option %s' % k)
+    return options
+
+class ResultCache(object):
+    """the least recently used results are dropped above max_entries"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        # from the least recently used
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.pop(key, None)
+            if result is not None:
+                self._entries[key] = result
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class ConversionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """POST /convert?option=value... with the file as body.
+
+    the response is a json object with html, css and div, and anims when
+    has_anim_name is false. its ETag depends only on the body and the
+    options, so If-None-Match is answered without converting.
+    """
+
+    PATH = '/convert'
+
+    def do_POST(self):
+        if 'Content-Length' not in self.headers:
+            self.send_error(411)
+            return
+        data = self.rfile.read(int(self.headers['Content-Length']))
+
+        url = urlparse.urlparse(self.path)
+        if url.path != self.PATH:
+            self.send_error(404)
+            return
+        try:
+            options = parse_options(url.query)
+        except ValueError, e:
+            self.send_error(400, str(e))
+            return
+
+        key = make_key(data, options)
+        etag = '"%s"' % key
+        if self._matches(etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        result = self.server.cache.get(key)
+        cache_status = 'hit'
+        if result is None:
+            cache_status = 'miss'
+            try:
+                result = self.server.convert(data, options)
+            except ServiceBusy:
+                self.send_response(503)
+                self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            except ConversionTimeout:
+                self.send_error(504)
+                return
+            except ConversionError, e:
+                logging.error('conversion failed: %s' % e)
+                self.send_error(422, 'conversion failed')
+                return
+            self.server.cache.put(key, result)
+
+        body = json.dumps(result)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('X-Cache', cache_status)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _matches(self, etag):
+        header = self.headers.get('If-None-Match')
+        if header is None:
+            return False
+        tags = [t.strip() for t in header.split(',')]
+        return '*' in tags or etag in tags or ('W/' + etag) in tags
+
+    def address_string(self):
+        # unix sockets have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug('%s %s' % (self.address_string(), format % args))
+
+def _close_fd(fd):
+    # run in each worker, which is forked with the listening socket open
+    try:
+        os.close(fd)
+    except OSError:
+        pass
+
+class ConversionServerMixin:
+    """converts on a pool of processes forked once at start up, so each
+    request skips the interpreter and library start up. simultaneous
+    requests for the same file share one conversion."""
+
+    # a classic class like the other SocketServer mixins
+
+    daemon_threads = True
+
+    def start_workers(self, processes=None, cache_entries=128, max_jobs=100, max_pending=64, timeout=None):
+        self.cache = ResultCache(cache_entries)
+        # workers replacing others after max_jobs are forked while the
+        # server listens, so every worker closes the socket
+        self.service = ConversionService(processes, max_pending, max_jobs, _close_fd, (self.fileno(),))
+        self.convert_timeout = timeout
+
+    def convert(self, data, options):
+        return self.service.convert(data, options, self.convert_timeout)
+
+    def stop_workers(self):
+        self.service.close()
+
+class ConversionServer(ConversionServerMixin, SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.stop_workers()
+
+class UnixConversionServer(ConversionServerMixin, SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        self.stop_workers()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+def make_server(address, processes=None, cache_entries=128, max_jobs=100, max_pending=64, timeout=None):
+    """a tcp server for a (host, port) address, a unix socket server for a path"""
+    if isinstance(address, basestring):
+        if os.path.exists(address):
+            os.remove(address)
+        server = UnixConversionServer(address, ConversionHandler, bind_and_activate=False)
+    else:
+        server = ConversionServer(address, ConversionHandler, bind_and_activate=False)
+    # the workers are started before the socket listens
+    server.start_workers(processes, cache_entries, max_jobs, max_pending, timeout)
+    try:
+        server.server_bind()
+        server.server_activate()
+    except:
+        server.server_close()
+        raise
+    return server
+
+def main(argv):
+    parser = OptionParser(usage='usage: python %prog [options]')
+    parser.add_option('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_option('-p', '--port', type='int', default=8080, help='port to listen on (default: 8080)')
+    parser.add_option('-s', '--socket', default=None, help='listen on this unix socket instead of a port')
+    parser.add_option('-j', '--processes', type='int', default=None,
+                      help='number of worker processes (default: number of cpus)')
+    parser.add_option('--max-jobs', type='int', default=100,
+                      help='conversions done by a worker before it is replaced (0: no limit)')
+    parser.add_option('--cache-entries', type='int', default=128,
+                      help='number of results kept in memory')
+    parser.add_option('--max-pending', type='int', default=64,
+                      help='conversions queued before requests are refused with 503')
+    parser.add_option('--timeout', type='float', default=None,
+                      help='seconds a request waits for its conversion before 504')
+    options, args = parser.parse_args(argv)
+
+    address = options.socket or (options.host, options.port)
+    server = make_server(address, options.processes, options.cache_entries, options.max_jobs,
+                         options.max_pending, options.timeout)
+    print 'serving on %s' % (address if options.socket else '%s:%d' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import os
+import errno
+import hashlib
+import logging
+import threading
+import multiprocessing
+import Queue
+from StringIO import StringIO
+import simplejson as json
+
+from lightning_svg import LightningSvg
+from vg.shapecache import VERSION
+
+RESULT_KEYS = ('html', 'css', 'div', 'anims')
+
+class ConversionError(Exception):
+    pass
+
+class ServiceBusy(Exception):
+    """too many conversions are pending, try again later"""
+    pass
+
+class ConversionTimeout(Exception):
+    pass
+
+def make_key(data, options):
+    """hash of an input and the options it is converted with"""
+    m = hashlib.sha1()
+    m.update(VERSION)
+    m.update('\0')
+    m.update(json.dumps(options, sort_keys=True))
+    m.update('\0')
+    m.update(data)
+    return m.hexdigest()
+
+def convert(data, options):
+    """converts an xml or swf string, and names the parts of the result"""
+    try:
+        return dict(zip(RESULT_KEYS, LightningSvg().xml2svg(StringIO(data), **options)))
+    except Exception, e:
+        # exceptions of lxml can not be sent back from a pool process
+        raise ConversionError('%s: %s' % (e.__class__.__name__, e))
+
+# pids of the pool processes running the job of each feeder thread, set
+# in every process of a pool by _init_worker
+_running = None
+
+def _init_worker(running, initializer, initargs):
+    global _running
+    _running = running
+    if initializer is not None:
+        initializer(*initargs)
+
+def _convert_job(slot, data, options):
+    _running[slot] = os.getpid()
+    try:
+        return convert(data, options)
+    finally:
+        _running[slot] = 0
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno != errno.ESRCH
+    return True
+
+class _Job(object):
+    QUEUED, RUNNING, DONE, CANCELLED = range(4)
+
+    def __init__(self, key, data, options):
+        self.key = key
+        self.data = data
+        self.options = options
+        self.state = self.QUEUED
+        self.waiters = 0
+        self.result = None
+        self.error = None
+        self.callbacks = []
+        self.finished = threading.Event()
+
+class Request(object):
+    """a caller's handle on a conversion, which may be shared with others"""
+
+    def __init__(self, service, job):
+        self._service = service
+        self._job = job
+        self._cancelled = False
+
+    @property
+    def key(self):
+        return self._job.key
+
+    def done(self):
+        return self._job.finished.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """stops waiting. the conversion is dropped if it has not started and
+        nobody else waits for it. returns False when it has already finished"""
+        return self._service._cancel(self)
+
+    def add_done_callback(self, fn):
+        """calls fn(request) once the conversion finishes, from a thread of
+        the service, or at once when it already has"""
+        self._service._add_callback(self, fn)
+
+    def result(self, timeout=None):
+        """the result of convert, raises ConversionTimeout after timeout
+        seconds and cancels the request"""
+        if self._cancelled:
+            raise ConversionTimeout('cancelled')
+        if not self._job.finished.wait(timeout):
+            self.cancel()
+            raise ConversionTimeout('no result in %s seconds' % timeout)
+        if self._cancelled:
+            raise ConversionTimeout('cancelled')
+        if self._job.error is not None:
+            raise self._job.error
+        return self._job.result
+
+class ConversionService(object):
+    """converts on a process pool, fed by a fixed number of threads.
+
+    requests for the same input and options made while a conversion of
+    them is pending share it. submit raises ServiceBusy once max_pending
+    different conversions are queued or running. initializer is called
+    with initargs in every process of the pool, including the ones which
+    replace a process after max_jobs conversions. a conversion whose
+    process dies, killed or crashed, fails with ConversionError.
+    """
+
+    # seconds between the checks of the process running a conversion
+    POLL = 0.1
+
+    def __init__(self, processes=None, max_pending=64, max_jobs=100, initializer=None, initargs=()):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_pending = max_pending
+        self._running = multiprocessing.Array('i', self.processes, lock=False)
+        self.pool = multiprocessing.Pool(self.processes, _init_worker, (self._running, initializer, initargs),
+                                         maxtasksperchild=max_jobs or None)
+
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._threads = []
+        for i in xrange(self.processes):
+            thread = threading.Thread(target=self._run, args=(i,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def pending(self):
+        """number of different conversions queued or running"""
+        return len(self._jobs)
+
+    def submit(self, data, options={}):
+        key = make_key(data, options)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                if len(self._jobs) >= self.max_pending:
+                    raise ServiceBusy('%d conversions pending' % len(self._jobs))
+                job = _Job(key, data, dict(options))
+                self._jobs[key] = job
+                self._queue.put(job)
+            job.waiters += 1
+            return Request(self, job)
+
+    def convert(self, data, options={}, timeout=None):
+        return self.submit(data, options).result(timeout)
+
+    def close(self):
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self.pool.terminate()
+        self.pool.join()
+
+    def _run(self, slot):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            with self._lock:
+                if job.state == _Job.CANCELLED:
+                    continue
+                job.state = _Job.RUNNING
+
+            try:
+                job.result = self._apply(slot, job)
+            except Exception, e:
+                job.error = e
+
+            with self._lock:
+                del self._jobs[job.key]
+                job.state = _Job.DONE
+                job.data = None
+                callbacks = job.callbacks
+                job.callbacks = []
+            job.finished.set()
+            for request, fn in callbacks:
+                self._call(request, fn)
+
+    def _apply(self, slot, job):
+        # Pool.apply never returns when the process running the job dies
+        self._running[slot] = 0
+        result = self.pool.apply_async(_convert_job, (slot, job.data, job.options))
+        while True:
+            try:
+                return result.get(self.POLL)
+            except multiprocessing.TimeoutError:
+                pid = self._running[slot]
+                if pid != 0 and not _is_alive(pid):
+                    raise ConversionError('worker %d exited' % pid)
+
+    def _cancel(self, request):
+        job = request._job
+        with self._lock:
+            if job.state == _Job.DONE:
+                return False
+            if request._cancelled:
+                return True
+            request._cancelled = True
+            job.callbacks = [(r, fn) for r, fn in job.callbacks if r is not request]
+            job.waiters -= 1
+            if job.waiters == 0 and job.state == _Job.QUEUED:
+                job.state = _Job.CANCELLED
+                del self._jobs[job.key]
+            return True
+
+    def _add_callback(self, request, fn):
+        with self._lock:
+            if request._job.state != _Job.DONE:
+                request._job.callbacks.append((request, fn))
+                return
+        self._call(request, fn)
+
+    def _call(self, request, fn):
+        try:
+            fn(request)
+        except Exception:
+            logging.exception('callback of %s failed' % request.key)
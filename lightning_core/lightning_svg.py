@@ -23,7 +23,7 @@
 from __future__ import with_statement
 import sys
 
-from vg.cssanim import AnimationManager
+from vg.cssanim import AnimationManager, ClassNames
 from vg.parser import SvgBuilder
 
 class LightningSvg(object):
@@ -51,21 +51,32 @@ class LightningSvg(object):
     ''' % (div, css, self.make_webkit_css(anim))
 
     def make_webkit_css(self, anims, sp='\n'):
-        return sp.join(['.%s {-webkit-animation-name: %s;}' % (anim, anim) for anim in anims.split(',') if anim != ""])
-
-    def xml2svg(self, filepath, mcname=None, key_prefix='', has_anim_name=True, scale=1.0):
+        # anims are keys, or key:name for keys sharing the keyframes of another
+        rules = []
+        for anim in anims.split(','):
+            if anim != "":
+                key, sep, name = anim.partition(':')
+                rules.append('.%s {-webkit-animation-name: %s;}' % (key, name or key))
+        return sp.join(rules)
+
+    def xml2svg(self, filepath, mcname=None, key_prefix='', has_anim_name=True, scale=1.0, streaming=False, cache_dir=None, use_symbols=False, processes=None, keyframe_tolerance=None, fit_easing=False, group_rules=False, short_names=False, names_path=None,
+                minify=False, precision=AnimationManager.PRECISION, twips=False, share_keyframes=False):
         def make_tables(manager, filepath, key_prefix, mcname):
-            builder = SvgBuilder(filepath, key_prefix, scale)
-
-            shape_table = manager.get_shapes(builder.get_shapes().split('\n'))
-            anim_table  = manager.get_animation(builder.get_animation())
-
-            structure_table, structure_tree = manager.get_structure(builder.get_structure(),
-                                                                    shape_table, anim_table,
-                                                                    [], 
-                                                                    builder.get_shapes_as_dict(),
-                                                                    mcname,
-                                                                    key_prefix)
+            builder = SvgBuilder(filepath, key_prefix, scale, streaming, cache_dir, processes, twips, mcname)
+
+            shape_table = manager.get_shapes_from_parser(builder.get_shapes_as_dict())
+            anim_table  = manager.get_animation_from_parser(builder.get_animations(mcname))
+
+            structure_table, structure_tree = manager.get_structure_from_tree(builder.get_tree(),
+                                                                              shape_table, anim_table,
+                                                                              [],
+                                                                              builder.get_shapes_as_dict(),
+                                                                              mcname,
+                                                                              key_prefix,
+                                                                              use_symbols)
+            if mcname is not None:
+                # keyframes only for the parts of the named clip
+                anim_table = dict((k, v) for k, v in anim_table.iteritems() if k in structure_table)
 
             return shape_table, anim_table, structure_table, structure_tree
 
@@ -74,14 +85,22 @@ class LightningSvg(object):
         dir_path = '.'
         file_path = ''
 
-        manager = AnimationManager(dir_path, file_path)
+        class_names = ClassNames(key_prefix) if short_names else None
+        manager = AnimationManager(dir_path, file_path, keyframe_tolerance, fit_easing, group_rules, class_names, minify, precision,
+                                   share_keyframes)
 
         shape_table, anim_table, structure_table, structure_tree = make_tables(manager, filepath, key_prefix, mcname)
 
-        css   = manager.write_css(structure_table, shape_table, anim_table, key_prefix, has_anim_name)
+        css   = manager.write_css(structure_table, shape_table, anim_table, key_prefix, has_anim_name, structure_tree=structure_tree)
         div   = manager.write_div(structure_tree)
-        anims = ','.join(anim_table.keys())
+        # with share_keyframes, keys sharing the keyframes of another are
+        # written as key:name
+        names = manager.get_animation_names(anim_table)
+        anims = ','.join(manager.get_name(key) if name == key else '%s:%s' % (manager.get_name(key), manager.get_name(name))
+                         for key, name in names.iteritems())
         html = self.make_html(div, css, anims)
+        if class_names is not None and names_path is not None:
+            class_names.save(names_path)
 
         if has_anim_name:
             return html, css, div
@@ -91,11 +110,11 @@ class LightningSvg(object):
 if __name__ == '__main__':
 
     if len(sys.argv) < 3:
-        print 'usage: python %s input.xml output.xml' % sys.argv[0]
+        print 'usage: python %s input.(xml|swf) output.xml' % sys.argv[0]
         sys.exit(1)
     inputfilepath = sys.argv[1]
     outputfilepath = sys.argv[2]
-    fp = open(inputfilepath, 'r')
+    fp = open(inputfilepath, 'rb')
     html, css, div = LightningSvg().xml2svg(fp, mcname=None, key_prefix='', scale=1.0)
     with open(outputfilepath, 'w') as f:
         f.write(html)
@@ -20,8 +20,12 @@
 # AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import re
 import unittest
 from lightning_core.vg.cssanim import *
+from lightning_core.vg.parser import SvgBuilder
+from lightning_core.test.testparser import duplicate_shape
+from StringIO import StringIO
 from lxml import etree
 
 class TestSvgShape(unittest.TestCase):
@@ -37,6 +41,18 @@ class TestSvgShape(unittest.TestCase):
         self.assertEqual(svgShape.symbol,'')
         self.assertEqual(svgShape.edges ,[])
 
+    def test_from_shape(self):
+        shape = Shape()
+        shape.symbol = 'obj1'
+        shape.name = 'hash'
+        shape.left = -10.5
+        shape.right = 200.7
+        shape.top = 3.0
+        shape.bottom = 40.0
+        svgShape = SvgShape.from_shape(shape)
+        self.assertEqual((svgShape.obj, svgShape.hash), ('obj1', 'hash'))
+        self.assertEqual((svgShape.left, svgShape.top, svgShape.width, svgShape.height), (-10, 3, 211, 37))
+
 class TestSvgTransform(unittest.TestCase):
     def make_sample_constructor(self):
         hoge = etree.Element('hoge')
@@ -65,6 +81,21 @@ class TestSvgTransform(unittest.TestCase):
         st1.name='st1'
         st1.clipDepth = 100
         self.assertTrue(st1 == st2)
+        self.assertFalse(st1 != st2)
+        self.assertEqual(hash(st1), hash(st2))
+        self.assertEqual(len(set([st1, st2, self.make_sample_constructor()])), 2)
+
+        self.assertTrue(st1 == list(st1.get_key()))
+        self.assertFalse(st1 == None)
+        self.assertTrue(st1 != None)
+        self.assertFalse(st1 == 1.0)
+
+    def test_write_short_matrix(self):
+        st = self.make_sample_constructor()
+        self.assertEqual(st.write_short_matrix(4, 2), 'matrix(100,0,220,200,5.05,10.1)')
+        st.sx = 0.123456
+        st.tx = -1.0
+        self.assertEqual(st.write_short_matrix(3, 1), 'matrix(.123,0,220,200,-.1,10.1)')
 
     def test_constructor(self):
         hoge = etree.Element('hoge')
@@ -92,6 +123,21 @@ class TestSvgTransform(unittest.TestCase):
         self.assertEqual(st2.clipDepth,88)
         self.assertEqual(st2.visible,False)
 
+    def test_from_transform(self):
+        tree = Tree()
+        tree.set_items({'sx':100.0, 'sy':200, 'wy':220.0, 'tx':101.0, 'ty':202.0,
+                        'depth':8, 'ctf':[10,20,-30,40,50,60,70,80], 'clipDepth':88, 'visible':False})
+        st = SvgTransform.from_transform(tree)
+        st2 = self.make_sample_constructor()
+        for k in ('sx', 'sy', 'wx', 'wy', 'tx', 'ty', 'depth', 'ctf', 'clipDepth', 'visible'):
+            self.assertEqual(getattr(st, k), getattr(st2, k))
+        self.assertTrue(isinstance(st.ctf, ColorTransform))
+
+        st = SvgTransform.from_transform(Tree())
+        self.assertEqual(st.ctf, [])
+        self.assertEqual(st.clipDepth, None)
+        self.assertEqual(st.visible, True)
+
     def test_write_matrix(self):
         st = self.make_sample_constructor()
         result = st.write_matrix()
@@ -108,6 +154,21 @@ class TestSvgTransform(unittest.TestCase):
         st.visible=True
         self.assertEqual(st.write_visible(),'opacity: 0.468750;')
 
+class TestClassNames(unittest.TestCase):
+    def test_get(self):
+        names = ClassNames('a')
+        self.assertEqual([names.get(k) for k in ('a-obj1-1', 'a-obj2-1', 'a-obj1-1')], ['a_0', 'a_1', 'a_0'])
+        for i in xrange(40):
+            names.get('a-obj%d-shape' % i)
+        self.assertEqual(names.get('a-obj39-shape'), 'a_15')
+        self.assertNotEqual(ClassNames('a_1').get('a-obj1-1'), names.get('a-obj1-1'))
+
+    def test_dumps(self):
+        names = ClassNames()
+        names.get('-obj1-1')
+        names.get('-obj1-shape')
+        self.assertEqual(json.loads(names.dumps()), {'_0': '-obj1-1', '_1': '-obj1-shape'})
+
 class TestAnimationManager(unittest.TestCase):
     def setUp(self):
         self.dir_path = ''
@@ -118,7 +179,10 @@ class TestAnimationManager(unittest.TestCase):
         self.anim_table = self.manager.get_animation(self.animation_tree())
         svg = etree.Element('svg')
         svg.set('name', 'dummy svg shape')
-        parser_shapes = {'15':self.shape_table['obj15']}
+        shape = Shape()
+        shape.name = 'hash'
+        shape.right, shape.bottom = 200, 300
+        parser_shapes = {'15':shape}
         self.structure_table, self.structure_tree = self.manager.get_structure(self.structure_root(), self.shape_table, self.anim_table, [], parser_shapes)
 
     def test_constructor(self):
@@ -262,6 +326,96 @@ class TestAnimationManager(unittest.TestCase):
         self.assertEqual(shape.get('version'), '1.1')
         self.assertEqual(shape.get('viewBox'), '0.000000 0.000000 10.000000 15.000000')
 
+    def test_get_structure_duplicated_shapes(self):
+        xml = duplicate_shape(open('./lightning_core/test/testfiles/simplesample.xml', 'r').read())
+        builder = SvgBuilder(StringIO(xml))
+        shape_table = self.manager.get_shapes(builder.get_shapes().split('\n'))
+        anim_table = self.manager.get_animation(builder.get_animation())
+        structure_table, structure_tree = self.manager.get_structure(builder.get_structure(), shape_table, anim_table, [],
+                                                                     builder.get_shapes_as_dict())
+        svgs = [etree.tostring(svg) for svg in structure_tree.iter('svg')]
+        self.assertEqual(len(svgs), 2)
+        self.assertEqual(svgs[0], svgs[1])
+
+    def test_get_structure_use_symbols(self):
+        xml = duplicate_shape(open('./lightning_core/test/testfiles/simplesample.xml', 'r').read())
+        builder = SvgBuilder(StringIO(xml))
+        shape_table = self.manager.get_shapes(builder.get_shapes().split('\n'))
+        anim_table = self.manager.get_animation(builder.get_animation())
+        structure_table, structure_tree = self.manager.get_structure(builder.get_structure(), shape_table, anim_table, [],
+                                                                     builder.get_shapes_as_dict(), use_symbols=True)
+        symbol_id = 'shape' + builder.parser.shapes['1'].name
+
+        symbols = structure_tree[0]
+        self.assertEqual(symbols.tag, 'svg')
+        self.assertEqual(symbols.get('width'), '0')
+        self.assertEqual([s.get('id') for s in symbols.iter('symbol')], [symbol_id])
+        self.assertEqual(len(list(symbols.iter('path'))), 1)
+
+        uses = list(structure_tree.iter('use'))
+        self.assertEqual([u.get('{http://www.w3.org/1999/xlink}href') for u in uses], ['#' + symbol_id] * 2)
+        for use in uses:
+            self.assertEqual(use.getparent().get('viewBox'), '0.000000 0.000000 26.750000 9.100000')
+        self.assertEqual(len(list(structure_tree.iter('path'))), 1)
+
+    def _assert_same_transform(self, t1, t2):
+        # the string round trip keeps 12 digits only
+        for k, v in t2.__dict__.iteritems():
+            if isinstance(v, float):
+                self.assertAlmostEqual(t1.__dict__[k], v, places=9)
+            else:
+                self.assertEqual(t1.__dict__[k], v)
+        self.assertEqual(sorted(t1.__dict__.keys()), sorted(t2.__dict__.keys()))
+
+    def _assert_same_tables(self, filename, mcname=None):
+        builder = SvgBuilder(open(filename, 'r'))
+        shape_table = self.manager.get_shapes(builder.get_shapes().split('\n'))
+        anim_table = self.manager.get_animation(builder.get_animation())
+        structure_table, structure_tree = self.manager.get_structure(builder.get_structure(), shape_table, anim_table, [],
+                                                                     builder.get_shapes_as_dict(), mcname)
+
+        builder = SvgBuilder(open(filename, 'r'))
+        shape_table2 = self.manager.get_shapes_from_parser(builder.get_shapes_as_dict())
+        anim_table2 = self.manager.get_animation_from_parser(builder.get_animations())
+        structure_table2, structure_tree2 = self.manager.get_structure_from_tree(builder.get_tree(), shape_table2, anim_table2, [],
+                                                                                 builder.get_shapes_as_dict(), mcname)
+
+        self.assertEqual(sorted(shape_table2.keys()), sorted(shape_table.keys()))
+        for k, v in shape_table.iteritems():
+            self.assertEqual(shape_table2[k].__dict__, v.__dict__)
+        self.assertEqual(sorted(anim_table2.keys()), sorted(anim_table.keys()))
+        for k, v in anim_table.iteritems():
+            self.assertEqual(len(anim_table2[k]), len(v))
+            for f2, f in zip(anim_table2[k], v):
+                self._assert_same_transform(f2, f)
+        self.assertEqual(sorted(structure_table2.keys()), sorted(structure_table.keys()))
+        for k, v in structure_table.iteritems():
+            self._assert_same_transform(structure_table2[k], v)
+        self.assertEqual(self.manager.write_div(structure_tree2), self.manager.write_div(structure_tree))
+
+    def test_get_tables_from_parser(self):
+        self._assert_same_tables('./lightning_core/test/testfiles/simplesample.xml')
+        self._assert_same_tables('./lightning_core/sample/sample1.xml')
+        self._assert_same_tables('./lightning_core/sample/sample1.xml', 'body')
+        self._assert_same_tables('./lightning_core/sample/sample_base.xml', 'body')
+
+    def test_get_structure_from_tree_mcname(self):
+        builder = SvgBuilder(open('./lightning_core/sample/sample_base.xml', 'r'))
+        shape_table = self.manager.get_shapes_from_parser(builder.get_shapes_as_dict())
+        structure_table, structure_tree = self.manager.get_structure_from_tree(builder.get_tree(), shape_table, {}, [],
+                                                                               builder.get_shapes_as_dict())
+        body_table, body_tree = self.manager.get_structure_from_tree(builder.get_tree(), shape_table, {}, [],
+                                                                     builder.get_shapes_as_dict(), 'body')
+
+        body = [e for e in structure_tree.iter('div') if e.get('id') == 'body'][0]
+        self.assertEqual(etree.tostring(body_tree), etree.tostring(body))
+        # only the parts under body are in the table
+        self.assertEqual(sorted(body_table.keys()), sorted(e.get('class') for e in body.iter('div')))
+        self.assertTrue(len(body_table) < len(structure_table))
+
+        self.assertRaises(IndexError, self.manager.get_structure_from_tree, builder.get_tree(), shape_table, {}, [],
+                          builder.get_shapes_as_dict(), 'hoge')
+
     def test__remove_deplicated_keyframes(self):
         elements = [(0.0 , 'hoge'),
                     (10.0, 'hoge'),
@@ -274,6 +428,71 @@ class TestAnimationManager(unittest.TestCase):
         result = self.manager._remove_deplicated_keyframes(elements)
         self.assertEqual(result, [(0.0, 'hoge'),(50.0, 'hoge'),(60.0,'hige'),(70.0,'hoge')])
 
+    def test__remove_linear_keyframes(self):
+        def svg(**attrib):
+            return SvgTransform(dict((k, str(v)) for k, v in attrib.iteritems()))
+        elements = [(0.0 , svg(tx=0)),
+                    (25.0, svg(tx=205)),
+                    (50.0, svg(tx=400)),
+                    (75.0, svg(tx=400, sx=1.5, sy=1.5)),
+                    (100.0, svg(tx=400, sx=2, sy=2))]
+        result = self.manager._remove_linear_keyframes(elements, 0.001)
+        self.assertEqual(result, [elements[0], elements[1], elements[2], elements[4]])
+        result = self.manager._remove_linear_keyframes(elements, 0.5)
+        self.assertEqual(result, [elements[0], elements[2], elements[4]])
+
+        # rotations are not interpolated linearly by browsers
+        elements = [(0.0, svg(wx=0.0)),
+                    (50.0, svg(wx=0.5, wy=-0.5)),
+                    (100.0, svg(wx=1.0, wy=-1.0))]
+        self.assertEqual(self.manager._remove_linear_keyframes(elements, 0.001), elements)
+
+        # nor fades across a keyframe which is not visible
+        def alpha(a, visible=True):
+            return svg(ctf=[256, 256, 256, a, 0, 0, 0, 0], visible=visible)
+        elements = [(0.0, alpha(0, False)), (20.0, alpha(85)), (40.0, alpha(171)), (60.0, alpha(256)), (80.0, alpha(256))]
+        expected = [elements[0], elements[1], elements[3], elements[4]]
+        self.assertEqual(self.manager._remove_linear_keyframes(elements, 0.001), expected)
+        self.assertEqual(self.manager._fit_timing_functions(elements, 0.001)[0][:2], elements[:2])
+        manager = AnimationManager(self.dir_path, self.basefilename, keyframe_tolerance=0.001)
+        keyframes = manager._make_keyframes({'-obj1-1': [t for p, t in elements]})
+        self.assertTrue('20.000000% { -webkit-transform: matrix3d(1.0,0.0,0,0,0.0,1.0,0,0,0,0,1,0,0.0,0.0,0,1); opacity: 0.332031; }' in keyframes)
+
+    def test__fit_timing_functions(self):
+        def svg(**attrib):
+            return SvgTransform(dict((k, str(v)) for k, v in attrib.iteritems()))
+        # an ease-in of 30 frames held for 10 frames
+        elements = [(100.0 * i / 40, svg(tx=round(2000 * (i / 29.0) ** 2), sx=1 + (i / 29.0) ** 2)) for i in xrange(30)]
+        elements += [(100.0 * i / 40, svg(tx=2000, sx=2)) for i in xrange(30, 40)]
+        elements = self.manager._remove_deplicated_keyframes(elements)
+        result, timings = self.manager._fit_timing_functions(elements, 0.001)
+        self.assertEqual([p for p, t in result], [0.0, 72.5, 97.5])
+        self.assertEqual(timings.keys(), [0.0])
+        x1, y1, x2, y2 = timings[0.0]
+        for p, t in elements[:30]:
+            y = self.manager._cubic_bezier(x1, y1, x2, y2, p / 72.5)
+            self.assertTrue(abs(y * 100 - t.tx / 20) <= 0.051)
+            self.assertTrue(abs(1 + y - t.sx) <= 0.001)
+
+        # straight lines are left to the linear timing function
+        elements = [(0.0, svg(tx=0)), (50.0, svg(tx=100)), (75.0, svg(tx=150)), (90.0, svg(tx=0))]
+        self.assertEqual(self.manager._fit_timing_functions(elements, 0.001), ([elements[0], elements[2], elements[3]], {}))
+
+        # runs which go back and forth are not fitted
+        fits = []
+        manager = AnimationManager(self.dir_path, self.basefilename)
+        manager._fit_cubic_bezier = lambda points: fits.append(points)
+        elements = [(float(i), svg(tx=100 * (i % 2))) for i in xrange(100)]
+        self.assertEqual(manager._fit_timing_functions(elements, 0.001), (elements, {}))
+        self.assertEqual(fits, [])
+
+        # nor over more than MAX_EASED_KEYFRAMES keyframes
+        elements = [(100.0 * i / 130, svg(tx=round(20000 * (i / 129.0) ** 2))) for i in xrange(130)]
+        result, timings = self.manager._fit_timing_functions(elements, 0.001)
+        indexes = [elements.index(e) for e in result]
+        self.assertTrue(len(timings) > 0)
+        self.assertTrue(max(b - a for a, b in zip(indexes, indexes[1:])) < AnimationManager.MAX_EASED_KEYFRAMES)
+
     def test__interpolate_keyframes(self):
         self.animation_tree()
         elm = etree.Element('hoge')
@@ -346,6 +565,20 @@ left: 0px;
 '''
         self.assertEqual(css, expected)
 
+    def test_write_css_minify(self):
+        manager = AnimationManager(self.dir_path, self.basefilename, group_rules=True, minify=True)
+        css = manager.write_css(self.structure_table, self.shape_table, self.anim_table, structure_tree=self.structure_tree)
+        self.assertTrue(css.startswith('svg{display:block}@-webkit-keyframes -obj16-33{0%{-webkit-transform:matrix(1,356,-44,1,0,0);opacity:0}'))
+        self.assertTrue('49.9999%{-webkit-transform:matrix(1.1,329,-77,1.2,0,0);opacity:0}50%{' in css)
+        self.assertTrue('.-obj15-1{-webkit-transform-origin:0 0;-webkit-transform:matrix(2,.5,0,2,-.05,-.1)}' in css)
+        self.assertTrue('-webkit-animation-duration:.333333s' in css)
+        self.assertFalse('\n' in css)
+
+        # keyframes stay apart at the precision of the percents
+        manager = AnimationManager(self.dir_path, self.basefilename, minify=True, precision=(2, 1, 2))
+        keyframes = manager._make_keyframes(self.anim_table)
+        self.assertTrue('49.99%{-webkit-transform:matrix(1.1,329,-77,1.2,0,0);opacity:0}' in keyframes)
+
     def test__make_keyframes(self):
         keyframes = self.manager._make_keyframes(self.anim_table)
         expected = '''@-webkit-keyframes -obj16-33 {
@@ -359,6 +592,103 @@ left: 0px;
 }'''
         self.assertEqual(keyframes, expected)
 
+        # keyframes are only dropped with a tolerance
+        anim_table = {'-obj1-1': [SvgTransform({'tx': str(i * 20)}) for i in xrange(4)]}
+        self.assertEqual(self.manager._make_keyframes(anim_table).count('%'), 5)
+        manager = AnimationManager(self.dir_path, self.basefilename, keyframe_tolerance=AnimationManager.KEYFRAME_TOLERANCE)
+        self.assertEqual(manager._make_keyframes(anim_table).count('%'), 3)
+
+    def test_get_animation_names(self):
+        anim_table = dict(self.anim_table)
+        anim_table['-obj16-34'] = [deepcopy(t) for t in anim_table['-obj16-33']]
+        anim_table['-obj16-2'] = anim_table['-obj16-33'][:2]
+        # keyframes are only shared with share_keyframes
+        self.assertEqual(self.manager.get_animation_names(anim_table), dict((key, key) for key in anim_table))
+        manager = AnimationManager(self.dir_path, self.basefilename, share_keyframes=True)
+        names = manager.get_animation_names(anim_table)
+        self.assertEqual(names, {'-obj16-33': '-obj16-33', '-obj16-34': '-obj16-33', '-obj16-2': '-obj16-2'})
+
+        keyframes = manager._make_keyframes(anim_table)
+        self.assertEqual(keyframes.count('@-webkit-keyframes'), 2)
+        self.assertTrue('@-webkit-keyframes -obj16-34 ' not in keyframes)
+
+        structure_table = {'-obj16-34': self.structure_table['-obj16-33']}
+        transforms = manager._make_transform(structure_table, self.shape_table, anim_table)
+        self.assertTrue('-webkit-animation-name: -obj16-33;' in transforms)
+
+    def test_get_shared_animations(self):
+        frames = self.anim_table['-obj16-33']
+        anim_table = {'-obj16-33': frames,
+                      '-obj16-34': frames[2:] + frames[:2],
+                      '-obj16-35': frames[3:] + frames[:3]}
+        manager = AnimationManager(self.dir_path, self.basefilename, share_keyframes=True)
+        shared = manager.get_shared_animations(anim_table)
+        self.assertEqual(shared, {'-obj16-33': ('-obj16-33', 0), '-obj16-34': ('-obj16-33', 2), '-obj16-35': ('-obj16-33', 3)})
+        for key, (name, offset) in shared.iteritems():
+            self.assertEqual(anim_table[key], frames[offset:] + frames[:offset])
+
+        # an invisible frame is not shared with a visible one of opacity 0
+        def alpha(a, visible=True):
+            return SvgTransform({'ctf': str([256, 256, 256, a, 0, 0, 0, 0]), 'visible': str(visible)})
+        fades = {'-obj1-1': [alpha(0, False), alpha(128), alpha(256)],
+                 '-obj1-2': [alpha(0), alpha(128), alpha(256)]}
+        self.assertNotEqual(fades['-obj1-1'][0], fades['-obj1-2'][0])
+        self.assertEqual(manager.get_shared_animations(fades), {'-obj1-1': ('-obj1-1', 0), '-obj1-2': ('-obj1-2', 0)})
+        keyframes = manager._make_keyframes(fades)
+        self.assertTrue('@-webkit-keyframes -obj1-1 ' in keyframes and '@-webkit-keyframes -obj1-2 ' in keyframes)
+
+        self.assertEqual(manager._make_keyframes(anim_table).count('@-webkit-keyframes'), 1)
+        structure_table = {'-obj16-34': self.structure_table['-obj16-33']}
+        transforms = manager._make_transform(structure_table, self.shape_table, anim_table)
+        self.assertTrue('-webkit-animation-name: -obj16-33;' in transforms)
+        self.assertTrue('-webkit-animation-delay: -0.166667s;' in transforms)
+
+    def test__get_least_rotation(self):
+        self.assertEqual(self.manager._get_least_rotation([3, 1, 2, 1, 1]), 3)
+        self.assertEqual(self.manager._get_least_rotation([1, 2, 1, 2]), 0)
+        self.assertEqual(self.manager._get_least_rotation([]), 0)
+
+    def test__group_rules(self):
+        def rule(title, anim_length=None, matrix='matrix(1.0,0.0,0.0,1.0,0.0,0.0)'):
+            elem = CssElement(title=title)
+            if anim_length is not None:
+                elem.add_anims_element(title[1:], anim_length, True)
+            elem.add_origin_element(matrix)
+            return elem
+        elems = [rule('.a'), rule('.b', 4), rule('.c'), rule('.d', matrix='matrix(2.0,0.0,0.0,2.0,0.0,0.0)')]
+        result = self.manager._group_rules(elems, 'structure div')
+        self.assertEqual([elem.title for elem in result], ['structure div', '.a, .c', '.b', '.d'])
+        self.assertEqual(result[0], {'position': 'absolute',
+                                     '-webkit-transform-origin': '0.0px 0.0px',
+                                     '-webkit-animation-timing-function': 'linear',
+                                     '-webkit-animation-iteration-count': 'infinite'})
+        self.assertEqual(result[2], {'-webkit-animation-name': 'b',
+                                     '-webkit-animation-duration': '0.333333s',
+                                     '-webkit-transform': 'matrix(1.0,0.0,0.0,1.0,0.0,0.0)'})
+        # the base rule may be more specific than the others, so none of
+        # them may be left with a property of it
+        for elem in result[1:]:
+            self.assertEqual(set(elem) & set(result[0]), set())
+
+        elems = [rule('.a'), rule('.c')]
+        self.assertEqual([str(elem) for elem in self.manager._group_rules(elems)],
+                         [str(rule('.a, .c'))])
+
+    def test_class_names(self):
+        manager = AnimationManager(self.dir_path, self.basefilename, class_names=ClassNames())
+        css = manager.write_css(self.structure_table, self.shape_table, self.anim_table, structure_tree=self.structure_tree)
+        div = manager.write_div(self.structure_tree)
+        self.assertFalse('obj' in css)
+        self.assertFalse('obj' in div)
+        self.assertTrue('@-webkit-keyframes %s ' % manager.get_name('-obj16-33') in css)
+        self.assertTrue('class="%s"' % manager.get_name('-obj16-33') in div)
+        # the tree is left as it is
+        self.assertTrue('class="-obj16-33"' in self.manager.write_div(self.structure_tree))
+
+    def test_get_base_selector(self):
+        self.assertEqual(self.manager.get_base_selector(etree.Element('structure')), 'structure div')
+        self.assertEqual(self.manager.get_base_selector(etree.Element('div', {'class': 'a-obj1-1'})), '.a-obj1-1, .a-obj1-1 div')
+
     def test__make_transform(self):
         transforms = self.manager._make_transform(self.structure_table, self.shape_table, self.anim_table)
         expected = '''.-obj15-1 {
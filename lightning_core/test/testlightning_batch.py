@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+from lightning_core.lightning_batch import *
+
+class TestLightningBatch(unittest.TestCase):
+    def setUp(self):
+        self.sampledir = './lightning_core/sample'
+        self.dirname = tempfile.mkdtemp()
+        self.outdirname = os.path.join(self.dirname, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_find_inputs(self):
+        inputs = find_inputs([self.sampledir])
+        self.assertEqual([name for path, name in inputs],
+                         ['sample1.swf', 'sample1.xml', 'sample2.swf', 'sample2.xml', 'sample_base.swf', 'sample_base.xml'])
+        inputs = find_inputs([os.path.join(self.sampledir, 'sample1.*'), './lightning_core/test/testfiles/simplesample.xml'])
+        self.assertEqual([name for path, name in inputs], ['sample1.swf', 'sample1.xml', 'simplesample.xml'])
+        self.assertEqual(find_inputs([os.path.join(self.sampledir, 'nothing*')]), [])
+        # files matched in different directories keep apart
+        inputs = find_inputs([os.path.join('./lightning_core', '*', 'sample1.xml')])
+        self.assertEqual([name for path, name in inputs], [os.path.join('sample', 'sample1.xml')])
+
+    def test_run(self):
+        broken = os.path.join(self.dirname, 'broken.xml')
+        with open(broken, 'w') as fp:
+            fp.write('<swf>')
+        inputs = [(os.path.join(self.sampledir, 'sample1.xml'), 'sample1.xml'),
+                  (broken, 'broken.xml'),
+                  (os.path.join(self.sampledir, 'sample_base.swf'), os.path.join('swf', 'sample_base.swf'))]
+
+        manifest = BatchConverter(self.outdirname, processes=2, max_jobs=1).run(inputs)
+        self.assertEqual(manifest['succeeded'], 2)
+        self.assertEqual(manifest['failed'], 1)
+
+        files = manifest['files']
+        self.assertEqual([f['input'] for f in files], [path for path, name in inputs])
+        self.assertEqual([f['status'] for f in files], ['ok', 'failed', 'ok'])
+        self.assertEqual(files[2]['output'], os.path.join(self.outdirname, 'swf', 'sample_base.html'))
+        self.assertEqual(os.path.getsize(files[0]['output']), files[0]['output_bytes'])
+        self.assertTrue(files[1]['error'] is not None)
+        self.assertEqual(files[1]['output_bytes'], None)
+        # every worker converts one file
+        self.assertEqual(len(set(f['worker'] for f in files)), 3)
+        for f in files:
+            self.assertTrue(f['wall_time'] >= 0)
+
+        with open(files[0]['output']) as fp:
+            html = fp.read()
+        with open(inputs[0][0], 'rb') as fp:
+            self.assertEqual(html, LightningSvg().xml2svg(fp)[0])
+
+    def test_run_worker_dies(self):
+        import lightning_core.lightning_batch as batch
+        def crash(inputpath, outputpath, options):
+            if inputpath.endswith('.swf'):
+                os._exit(3)
+            return convert(inputpath, outputpath, options)
+
+        inputs = [(os.path.join(self.sampledir, 'sample1.xml'), 'sample1.xml'),
+                  (os.path.join(self.sampledir, 'sample_base.swf'), 'sample_base.swf'),
+                  (os.path.join(self.sampledir, 'sample2.xml'), 'sample2.xml')]
+        batch.convert = crash
+        try:
+            manifest = BatchConverter(self.outdirname, processes=1).run(inputs)
+        finally:
+            batch.convert = convert
+        self.assertEqual([f['status'] for f in manifest['files']], ['ok', 'failed', 'ok'])
+        self.assertEqual(manifest['files'][1]['error'], 'worker exited with 3')
+
+    def test_run_same_output(self):
+        inputs = find_inputs([os.path.join(self.sampledir, 'sample1.*')])
+        manifest = BatchConverter(self.outdirname, processes=1).run(inputs)
+        files = manifest['files']
+        self.assertEqual([f['status'] for f in files], ['ok', 'failed'])
+        self.assertEqual(files[0]['output'], files[1]['output'])
+        self.assertEqual(files[1]['error'], 'output is also written for %s' % files[0]['input'])
+        self.assertTrue(files[0]['worker_peak_rss'] is None or files[0]['worker_peak_rss'] > 0)
+        self.assertFalse('worker' in files[1])
+
+    def test_main(self):
+        manifestpath = os.path.join(self.dirname, 'manifest.json')
+        status = main(['-j', '1', '-m', manifestpath, self.outdirname, os.path.join(self.sampledir, 'sample_base.xml')])
+        self.assertEqual(status, 0)
+        with open(manifestpath) as fp:
+            manifest = json.load(fp)
+        self.assertEqual(manifest['succeeded'], 1)
+        self.assertTrue(os.path.exists(os.path.join(self.outdirname, 'sample_base.html')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+import unittest
+from lxml import etree
+from lightning_core.lightning_composite import *
+
+def composite_html(base, part):
+    # what sample/composite.py did for each combination
+    baseElm = etree.fromstring(base.div)
+    for elm in baseElm.iterfind('.//div'):
+        if elm.get('id') == 'body':
+            elm.getparent().replace(elm, etree.fromstring(part.div))
+    return LightningSvg().make_html(etree.tostring(baseElm), base.css+part.css, part.anims)
+
+class TestCompositor(unittest.TestCase):
+    def setUp(self):
+        self.sampledir = './lightning_core/sample'
+        self.basename = os.path.join(self.sampledir, 'sample_base.xml')
+        self.part1 = (os.path.join(self.sampledir, 'sample1.xml'), 'body', 'myobj1')
+        self.part2 = (os.path.join(self.sampledir, 'sample2.xml'), 'body', 'myobj2')
+        self.compositor = Compositor(self.basename)
+
+    def test_make_html(self):
+        self.assertEqual(self.compositor.slots, ['base', 'body', 'myobj'])
+        base = get_lightning_element(self.basename, key_prefix='base')
+        for part in (self.part1, self.part2):
+            self.assertEqual(self.compositor.make_html({'body': part}),
+                             composite_html(base, get_lightning_element(*part)))
+
+        # parts and serialized bases are reused
+        self.assertTrue(self.compositor.get_part(*self.part1) is self.compositor.get_part(*self.part1))
+        self.assertEqual(len(self.compositor._templates), 1)
+
+    def test_make_html_slots(self):
+        html = self.compositor.make_html({'base': self.part1, 'body': self.part2})
+        part1 = self.compositor.get_part(*self.part1)
+        self.assertTrue(part1.div in html)
+        self.assertTrue(self.compositor.get_part(*self.part2).div in html)
+
+        # body is inside myobj, so it goes away with it
+        html = self.compositor.make_html({'myobj': self.part1, 'body': self.part2})
+        self.assertTrue(part1.div in html)
+        self.assertFalse(self.compositor.get_part(*self.part2).div in html)
+        self.assertEqual(html.count('@-webkit-keyframes'), part1.css.count('@-webkit-keyframes'))
+
+        self.assertRaises(ValueError, self.compositor.make_html, {'hoge': self.part1})
+
+    def test_write_all(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            combinations = [(os.path.join(dirname, 'merged%d.html' % i), {'body': part})
+                            for i, part in enumerate((self.part1, self.part2))]
+            self.assertEqual(self.compositor.write_all(combinations), 2)
+            for output_path, combination in combinations:
+                with open(output_path) as f:
+                    self.assertEqual(f.read(), self.compositor.make_html(combination))
+        finally:
+            shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+    unittest.main()
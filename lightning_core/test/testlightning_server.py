@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import httplib
+import unittest
+import simplejson as json
+from lightning_core.lightning_server import *
+
+class TestResultCache(unittest.TestCase):
+    def test_get_and_put(self):
+        cache = ResultCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+class TestOptions(unittest.TestCase):
+    def test_parse_options(self):
+        self.assertEqual(parse_options(''), {})
+        self.assertEqual(parse_options('mcname=hoge&key_prefix=a_&scale=0.5&has_anim_name=false'),
+                         {'mcname': 'hoge', 'key_prefix': 'a_', 'scale': 0.5, 'has_anim_name': False})
+        self.assertRaises(ValueError, parse_options, 'scale=large')
+        self.assertRaises(ValueError, parse_options, 'has_anim_name=maybe')
+        self.assertRaises(ValueError, parse_options, 'hoge=fuga')
+
+class TestConversionServer(unittest.TestCase):
+    def setUp(self):
+        self.samplename = './lightning_core/sample/sample1.xml'
+        with open(self.samplename, 'rb') as fp:
+            self.data = fp.read()
+        self.server = make_server(('127.0.0.1', 0), processes=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def _post(self, path, body, headers={}):
+        conn = httplib.HTTPConnection(*self.server.server_address[:2])
+        try:
+            conn.request('POST', path, body, headers)
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            conn.close()
+
+    def test_convert(self):
+        status, headers, body = self._post('/convert?key_prefix=a_&has_anim_name=0', self.data)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['x-cache'], 'miss')
+        html, css, div, anims = LightningSvg().xml2svg(open(self.samplename, 'rb'), key_prefix='a_', has_anim_name=False)
+        self.assertEqual(json.loads(body), {'html': html, 'css': css, 'div': div, 'anims': anims})
+
+        status, cached_headers, cached_body = self._post('/convert?key_prefix=a_&has_anim_name=0', self.data)
+        self.assertEqual(status, 200)
+        self.assertEqual(cached_headers['x-cache'], 'hit')
+        self.assertEqual(cached_headers['etag'], headers['etag'])
+        self.assertEqual(cached_body, body)
+
+        status, other_headers, body = self._post('/convert', self.data)
+        self.assertEqual(sorted(json.loads(body).keys()), ['css', 'div', 'html'])
+        self.assertNotEqual(other_headers['etag'], headers['etag'])
+
+    def test_not_modified(self):
+        etag = '"%s"' % make_key(self.data, {})
+        status, headers, body = self._post('/convert', self.data, {'If-None-Match': etag})
+        self.assertEqual(status, 304)
+        self.assertEqual(headers['etag'], etag)
+        self.assertEqual(len(self.server.cache), 0)
+
+    def test_errors(self):
+        self.assertEqual(self._post('/hoge', self.data)[0], 404)
+        self.assertEqual(self._post('/convert?hoge=fuga', self.data)[0], 400)
+        self.assertEqual(self._post('/convert', '<swf>')[0], 422)
+        self.assertEqual(len(self.server.cache), 0)
+
+        self.server.service.max_pending = 0
+        status, headers, body = self._post('/convert', self.data)
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['retry-after'], '1')
+
+    def test_workers_close_socket(self):
+        server = make_server(('127.0.0.1', 0), processes=1, max_jobs=1)
+        try:
+            # the second call runs on a worker forked after the socket listens
+            for i in xrange(2):
+                self.assertRaises(OSError, server.service.pool.apply, os.fstat, (server.fileno(),))
+        finally:
+            server.server_close()
+
+class TestUnixConversionServer(unittest.TestCase):
+    def test_convert(self):
+        dirname = tempfile.mkdtemp()
+        socketpath = os.path.join(dirname, 'lightning.sock')
+        server = make_server(socketpath, processes=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            data = open('./lightning_core/sample/sample_base.swf', 'rb').read()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(socketpath)
+            sock.sendall('POST /convert HTTP/1.0\r\nContent-Length: %d\r\n\r\n%s' % (len(data), data))
+            response = ''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            sock.close()
+
+            headers, body = response.split('\r\n\r\n', 1)
+            self.assertTrue(headers.startswith('HTTP/1.0 200'))
+            html = LightningSvg().xml2svg(open('./lightning_core/sample/sample_base.swf', 'rb'))[0]
+            self.assertEqual(json.loads(body)['html'], html)
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+            self.assertFalse(os.path.exists(socketpath))
+            shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+    unittest.main()
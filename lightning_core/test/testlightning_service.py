@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from __future__ import with_statement
+import os
+import threading
+import unittest
+import multiprocessing
+from lightning_core.lightning_service import *
+
+class BlockingResult(object):
+    def __init__(self, pool, args):
+        self.pool = pool
+        self.args = args
+
+    def get(self, timeout=None):
+        self.pool.released.wait(timeout)
+        if not self.pool.released.is_set():
+            raise multiprocessing.TimeoutError()
+        return convert(*self.args)
+
+class BlockingPool(object):
+    # runs the conversions in the calling thread once released
+    def __init__(self):
+        self.released = threading.Event()
+        self.calls = []
+
+    def apply_async(self, func, args):
+        slot, data, options = args
+        self.calls.append((data, options))
+        return BlockingResult(self, (data, options))
+
+    def terminate(self):
+        self.released.set()
+
+    def join(self):
+        pass
+
+class TestConvert(unittest.TestCase):
+    def test_make_key(self):
+        self.assertEqual(make_key('<swf/>', {'scale': 1.0, 'mcname': 'a'}), make_key('<swf/>', {'mcname': 'a', 'scale': 1.0}))
+        self.assertNotEqual(make_key('<swf/>', {}), make_key('<swf/>', {'mcname': 'a'}))
+        self.assertNotEqual(make_key('<swf/>', {}), make_key('<swf />', {}))
+
+class TestConversionService(unittest.TestCase):
+    def setUp(self):
+        self.samplename = './lightning_core/sample/sample_base.xml'
+        with open(self.samplename, 'rb') as fp:
+            self.data = fp.read()
+        self.service = ConversionService(processes=1, max_pending=2)
+
+    def tearDown(self):
+        self.service.close()
+
+    def _block(self):
+        self.service.pool.terminate()
+        self.service.pool.join()
+        self.service.pool = BlockingPool()
+        return self.service.pool
+
+    def test_convert(self):
+        result = self.service.convert(self.data, {'key_prefix': 'a_'})
+        html, css, div = LightningSvg().xml2svg(open(self.samplename, 'rb'), key_prefix='a_')
+        self.assertEqual(result, {'html': html, 'css': css, 'div': div})
+        self.assertEqual(self.service.pending, 0)
+        self.assertRaises(ConversionError, self.service.convert, '<swf>')
+
+    def test_worker_dies(self):
+        import lightning_core.lightning_service as service
+        def crash(data, options):
+            if data == 'crash':
+                os._exit(3)
+            return convert(data, options)
+
+        self.service.close()
+        # the workers are forked with crash, their replacements without it
+        service.convert = crash
+        try:
+            self.service = ConversionService(processes=1)
+        finally:
+            service.convert = convert
+        try:
+            self.service.convert('crash', {}, 10)
+            self.fail()
+        except ConversionError, e:
+            self.assertTrue(str(e).startswith('worker '))
+        self.assertEqual(self.service.pending, 0)
+        self.assertEqual(self.service.convert(self.data, {}, 10)['html'],
+                         LightningSvg().xml2svg(open(self.samplename, 'rb'))[0])
+
+    def test_coalesce(self):
+        pool = self._block()
+        first = self.service.submit(self.data, {'scale': 1.0})
+        second = self.service.submit(self.data, {'scale': 1.0})
+        other = self.service.submit(self.data)
+        self.assertEqual(first.key, second.key)
+        self.assertNotEqual(first.key, other.key)
+        self.assertEqual(self.service.pending, 2)
+        self.assertRaises(ServiceBusy, self.service.submit, self.data, {'mcname': 'hoge'})
+
+        done = []
+        second.add_done_callback(done.append)
+        pool.released.set()
+        self.assertEqual(first.result(10), second.result(10))
+        self.assertEqual(other.result(10)['html'], first.result()['html'])
+        self.assertEqual(done, [second])
+        self.assertEqual(len(pool.calls), 2)
+        self.assertEqual(self.service.pending, 0)
+
+        second.add_done_callback(done.append)
+        self.assertEqual(done, [second, second])
+        self.assertFalse(second.cancel())
+
+    def test_cancel(self):
+        pool = self._block()
+        running = self.service.submit(self.data)
+        queued = self.service.submit(self.data, {'key_prefix': 'a_'})
+        shared = self.service.submit(self.data, {'key_prefix': 'a_'})
+
+        self.assertRaises(ConversionTimeout, queued.result, 0.01)
+        self.assertTrue(queued.cancelled())
+        self.assertEqual(self.service.pending, 2)
+        self.assertTrue(shared.cancel())
+        self.assertEqual(self.service.pending, 1)
+        self.assertRaises(ConversionTimeout, shared.result)
+
+        pool.released.set()
+        running.result(10)
+        self.service.convert(self.data, {'scale': 1.0}, 10)
+        # the cancelled conversion was never started
+        self.assertEqual([options for data, options in pool.calls], [{}, {'scale': 1.0}])
+
+if __name__ == '__main__':
+    unittest.main()
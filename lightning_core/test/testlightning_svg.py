@@ -20,7 +20,12 @@
 # AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION 
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import os
+import re
+import shutil
+import tempfile
 import unittest
+import simplejson as json
 from lightning_core.lightning_svg import *
 
 class TestLightningSvg(unittest.TestCase):
@@ -31,3 +36,55 @@ class TestLightningSvg(unittest.TestCase):
         x1.hoge = 'fuga'
         self.assertEqual('fuga', x2.hoge)
 
+    def test_make_webkit_css(self):
+        self.assertEqual(LightningSvg().make_webkit_css('a,b:a,'),
+                         '.a {-webkit-animation-name: a;}\n.b {-webkit-animation-name: a;}')
+
+    def test_xml2svg_processes(self):
+        samplename = './lightning_core/sample/sample1.xml'
+        for use_symbols in (False, True):
+            result = LightningSvg().xml2svg(open(samplename, 'rb'), use_symbols=use_symbols)
+            self.assertEqual(LightningSvg().xml2svg(open(samplename, 'rb'), use_symbols=use_symbols, processes=2), result)
+
+    def test_xml2svg_short_names(self):
+        samplename = './lightning_core/sample/sample1.xml'
+        dirname = tempfile.mkdtemp()
+        try:
+            names_path = os.path.join(dirname, 'names.json')
+            html, css, div, anims = LightningSvg().xml2svg(open(samplename, 'rb'), key_prefix='k', has_anim_name=False,
+                                                           short_names=True, names_path=names_path)
+            long_div = LightningSvg().xml2svg(open(samplename, 'rb'), key_prefix='k')[2]
+            names = json.load(open(names_path))
+        finally:
+            shutil.rmtree(dirname)
+        self.assertFalse('-obj' in html)
+        self.assertEqual(re.sub('class="([^"]+)"', lambda m: 'class="%s"' % names[m.group(1)], div), long_div)
+        for anim in anims.split(','):
+            self.assertTrue(names[anim].startswith('k-obj'))
+
+    def test_xml2svg_twips(self):
+        samplename = './lightning_core/sample/sample1.xml'
+        html, css, div = LightningSvg().xml2svg(open(samplename, 'rb'), twips=True)
+        self.assertEqual(re.findall(' d="[^"]*\.', html), [])
+        pixels = LightningSvg().xml2svg(open(samplename, 'rb'))
+        # only the svgs change, their divs are placed in pixels as before
+        self.assertEqual(css, pixels[1])
+        self.assertEqual(re.findall('class="([^"]+)"', div), re.findall('class="([^"]+)"', pixels[2]))
+        self.assertEqual(re.findall('viewBox="[^"]*\.', div), [])
+
+    def test_xml2svg_mcname(self):
+        samplename = './lightning_core/sample/sample_base.xml'
+        html, css, div = LightningSvg().xml2svg(open(samplename, 'rb'), key_prefix='base')
+        body_html, body_css, body_div = LightningSvg().xml2svg(open(samplename, 'rb'), mcname='myobj', key_prefix='base')
+        self.assertTrue(re.match('<div class="[^"]+" id="myobj">', body_div))
+        # only the rules of the divs in myobj are written
+        rules = [r.strip().split(' ')[0] for r in body_css.split('\n\n') if r.strip().startswith('.')]
+        self.assertEqual(sorted(rules), sorted(set('.' + c for c in re.findall('class="([^"]+)"', body_div))))
+        for rule in body_css.split('\n\n'):
+            self.assertTrue(rule in css)
+
+        body_css = LightningSvg().xml2svg(open(samplename, 'rb'), mcname='myobj', key_prefix='base', group_rules=True)[1]
+        selectors = [selector for r in body_css.split('\n\n') if r.strip().startswith('.')
+                     for selector in r.strip().split(' {')[0].split(', ') if ' ' not in selector]
+        self.assertEqual(sorted(set(selectors)), sorted(set('.' + c for c in re.findall('class="([^"]+)"', body_div))))
+        self.assertTrue('.base-obj7-1, .base-obj7-1 div {' in body_css)
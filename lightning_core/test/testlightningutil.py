@@ -66,6 +66,14 @@ class TestLUtil(unittest.TestCase):
         objectID = '13'
         self.assertEqual(LUtil.make_key_string('13', 'hoge', 'fuga'),'hoge-13-fuga')
 
+    def test_shortest_number(self):
+        self.assertEqual([LUtil.shortest_number(v, 3) for v in (0.0, -0.0001, 1.5, -0.25, 100.0, 0.12345)],
+                         ['0', '0', '1.5', '-.25', '100', '.123'])
+
+    def test_to_base36(self):
+        self.assertEqual([LUtil.to_base36(n) for n in (0, 9, 10, 35, 36, 1295, 1296)],
+                         ['0', '9', 'a', 'z', '10', 'zz', '100'])
+
     def test_objectID_from_key(self):
         self.assertEqual(LUtil.objectID_from_key('hoge-13-fuga'), '13')
 
@@ -23,7 +23,26 @@
 import unittest
 from lightning_core.vg.parser import *
 from lxml import etree
-import hashlib
+import os
+import shutil
+import tempfile
+from copy import deepcopy
+from StringIO import StringIO
+import simplejson as json
+
+def duplicate_shape(xml):
+    # adds obj4, a copy of obj1, and places it next to obj1
+    root = etree.fromstring(xml)
+    tags = root.find('Header/tags')
+    shape = deepcopy(tags.find('DefineShape'))
+    shape.set('objectID', '4')
+    tags.insert(tags.index(tags.find('DefineSprite')), shape)
+    sprite_tags = tags.find('DefineSprite/tags')
+    place = deepcopy(sprite_tags.find('PlaceObject2'))
+    place.set('depth', '2')
+    place.set('objectID', '4')
+    sprite_tags.insert(1, place)
+    return etree.tostring(root)
 
 class TestSvgBuilder(unittest.TestCase):
     def setUp(self):
@@ -32,15 +51,110 @@ class TestSvgBuilder(unittest.TestCase):
     def test_get_shapes(self):
         simplefile = open(self.simplexmlfilename,'r')
         builder = SvgBuilder(simplefile)
-        m = hashlib.sha1()
-        m.update(builder.parser.shapes['1'].symbol)
-        self.assertEqual(builder.get_shapes(),'1\nobj1 %s 0 0 535 182\n' % m.hexdigest())
+        name = builder.parser.shapes['1'].generate_name()
+        self.assertEqual(builder.get_shapes(),'1\nobj1 %s 0 0 535 182\n' % name)
+
+    def test_save_svgs(self):
+        xml = duplicate_shape(open(self.simplexmlfilename,'r').read())
+        builder = SvgBuilder(StringIO(xml))
+        dirname = tempfile.mkdtemp()
+        try:
+            builder._save_svgs(dirname)
+            self.assertEqual(os.listdir(dirname), ['%s.svg' % builder.parser.shapes['1'].name])
+        finally:
+            shutil.rmtree(dirname)
 
     def test_get_structure(self):
         simplefile = open(self.simplexmlfilename,'r')
         builder = SvgBuilder(simplefile)
         self.assertEqual(builder.get_structure().tag,'structure')
 
+    def test_save_incremental(self):
+        samplename = './lightning_core/sample/sample1.xml'
+        dirname = tempfile.mkdtemp()
+        try:
+            SvgBuilder(open(samplename,'r')).save(dirname)
+            expected = dict((f, open(os.path.join(dirname, f)).read()) for f in os.listdir(dirname))
+            self.assertTrue(SvgBuilder.DEPENDENCIES in expected)
+
+            # unchanged outputs are kept as they are
+            builder = SvgBuilder(open(samplename,'r'))
+            svg_path = os.path.join(dirname, '%s.svg' % builder.parser.shapes['1'].name)
+            with open(svg_path, 'w') as fp:
+                fp.write('kept')
+            animation = etree.parse(os.path.join(dirname, 'animation.xml'))
+            expected_tx = animation.find('.//frame').get('tx')
+            animation.find('.//frame').set('tx', '1.5')
+            animation.write(os.path.join(dirname, 'animation.xml'))
+            structure_path = os.path.join(dirname, 'structure.xml')
+            structure = etree.parse(structure_path)
+            structure.find('.//part[@key="-obj2-1-2"]').set('kept', 'True')
+            structure.find('.//part[@key="-obj4-3-1"]').set('kept', 'True')
+            structure.write(structure_path)
+
+            builder.save(dirname)
+            self.assertEqual(open(svg_path).read(), 'kept')
+            animation = etree.parse(os.path.join(dirname, 'animation.xml'))
+            self.assertEqual(animation.find('.//frame').get('tx'), '1.5')
+            animation.find('.//frame').set('tx', expected_tx)
+            self.assertEqual(etree.tostring(animation, pretty_print=True), expected['animation.xml'])
+            self.assertEqual(len(etree.parse(structure_path).xpath('//part[@kept]')), 2)
+            self.assertEqual(open(os.path.join(dirname, SvgBuilder.DEPENDENCIES)).read(), expected[SvgBuilder.DEPENDENCIES])
+
+            # a changed shape is written again, and its old file removed
+            root = etree.parse(samplename)
+            root.find('.//DefineShape[@objectID="1"]//Color').set('red', '0')
+            builder = SvgBuilder(StringIO(etree.tostring(root)))
+            with open(os.path.join(dirname, SvgBuilder.DEPENDENCIES)) as fp:
+                self.assertEqual(builder.parser.get_changed(json.load(fp)), set(['1', '4', '5']))
+            builder.save(dirname)
+            self.assertFalse(os.path.exists(svg_path))
+            # parts below sprites placing the shape are written again, the
+            # others spliced from the structure before
+            structure = etree.parse(structure_path)
+            self.assertEqual([e.get('key') for e in structure.xpath('//part[@kept]')], ['-obj2-1-2'])
+            structure.find('.//part[@key="-obj2-1-2"]').attrib.pop('kept')
+            self.assertEqual(etree.tostring(structure, pretty_print=True), etree.tostring(builder.get_structure(), pretty_print=True))
+            new_svg_path = os.path.join(dirname, '%s.svg' % builder.parser.shapes['1'].name)
+            self.assertEqual(open(new_svg_path).read(), etree.tostring(Parser.str_shape_as_svg(builder.parser.shapes['1']), pretty_print=True))
+
+            # other versions of the output are not used
+            with open(os.path.join(dirname, SvgBuilder.DEPENDENCIES)) as fp:
+                dependencies = json.load(fp)
+            dependencies['version'] = '0'
+            with open(os.path.join(dirname, SvgBuilder.DEPENDENCIES), 'w') as fp:
+                json.dump(dependencies, fp)
+            SvgBuilder(open(samplename,'r')).save(dirname)
+            self.assertEqual(dict((f, open(os.path.join(dirname, f)).read()) for f in expected), expected)
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_processes(self):
+        samplename = './lightning_core/sample/sample1.xml'
+        builder = SvgBuilder(open(samplename,'r'))
+        pooled = SvgBuilder(open(samplename,'r'), processes=2)
+
+        for k, v in builder.parser.shapes.iteritems():
+            self.assertEqual(v.rendered, None)
+            self.assertEqual(pooled.parser.shapes[k].rendered, Parser.ShapeMaker.dumps(*Parser.ShapeMaker.make_shape(v, [], '')))
+            self.assertEqual(etree.tostring(Parser.str_shape_as_svg(pooled.parser.shapes[k])),
+                             etree.tostring(Parser.str_shape_as_svg(v)))
+
+        self.assertEqual(etree.tostring(pooled.get_animation()), etree.tostring(builder.get_animation()))
+        self.assertEqual([a.key for a in pooled.get_animations()], [a.key for a in builder.get_animations()])
+
+    def test_processes_mcname(self):
+        root = etree.parse('./lightning_core/sample/sample1.xml')
+        root.find('.//PlaceObject2[@objectID="3"]').set('name', 'leg')
+        builder = SvgBuilder(StringIO(etree.tostring(root)))
+        pooled = SvgBuilder(StringIO(etree.tostring(root)), processes=2, mcname='leg')
+
+        # only the shapes and sprites under the named part are done on the pool
+        self.assertEqual(pooled.parser.shapes['1'].rendered, None)
+        self.assertNotEqual(pooled.parser.shapes['2'].rendered, None)
+        self.assertEqual([a.key for a in pooled.get_animations('leg')], [a.key for a in builder.get_animations('leg')])
+        self.assertEqual([a.key for a in pooled.get_animations()], [a.key for a in builder.get_animations()])
+
 class TestParser(unittest.TestCase):
 
     def setUp(self):
@@ -260,10 +374,44 @@ class TestParser(unittest.TestCase):
         self.assertEquals(widths[0], 1.0)
 
 
-    #TODO:implement
+    def test_parse_streaming(self):
+        filename = './lightning_core/sample/sample1.xml'
+        parser = Parser()
+        parser.parse(open(filename, 'r'))
+        streaming_parser = Parser()
+        streaming_parser.parse(open(filename, 'r'), streaming=True)
+
+        self.assertEqual(sorted(streaming_parser.shapes.keys()), sorted(parser.shapes.keys()))
+        self.assertEqual(sorted(streaming_parser.sprites.keys()), sorted(parser.sprites.keys()))
+        self.assertEqual(sorted(streaming_parser.places.keys()), sorted(parser.places.keys()))
+        self.assertEqual(streaming_parser.size[0].attrib, parser.size[0].attrib)
+        for k, v in parser.shapes.iteritems():
+            self.assertEqual(streaming_parser.shapes[k].edges[0].values, v.edges[0].values)
+        self.assertEqual(str(streaming_parser.tree), str(parser.tree))
+        self.assertEqual(etree.tostring(streaming_parser.str_animation()),
+                         etree.tostring(parser.str_animation()))
+
     def test_make_svg(self):
         parser = Parser()
         parser.parse_from_str(self.simplexml)
+        name, svgstr = parser.make_svg()
+        svg = etree.fromstring(svgstr)
+        self.assertEqual(len(svg.findall('.//{http://www.w3.org/2000/svg}path')), 1)
+        self.assertEqual(len(svg.findall('.//{http://www.w3.org/2000/svg}use')), 0)
+
+    def test_make_svg_duplicated_shapes(self):
+        parser = Parser()
+        parser.parse_from_str(duplicate_shape(self.simplexml))
+        self.assertEqual(parser.shapes['1'].name, parser.shapes['4'].name)
+
+        name, svgstr = parser.make_svg()
+        svg = etree.fromstring(svgstr)
+        ns = '{http://www.w3.org/2000/svg}'
+        self.assertEqual(len(svg.findall('.//%spath' % ns)), 1)
+        shape_id = 'shape' + parser.shapes['1'].name
+        self.assertEqual(svg.find('%sdefs/%sg' % (ns, ns)).get('id'), shape_id)
+        uses = svg.findall('.//%suse' % ns)
+        self.assertEqual([u.get('{http://www.w3.org/1999/xlink}href') for u in uses], ['#' + shape_id] * 2)
 
     def test_str_shape_as_svg(self):
         parser = Parser()
@@ -278,6 +426,48 @@ class TestParser(unittest.TestCase):
         for g in svg.iter('g'):
             self.assertEqual(g.tag, 'g')
 
+    def test_twips(self):
+        parser = Parser()
+        parser.parse_from_str(self.simplexml)
+        twips_parser = Parser(twips=True)
+        twips_parser.parse_from_str(self.simplexml)
+        shape, twips_shape = parser.shapes['1'], twips_parser.shapes['1']
+        self.assertNotEqual(shape.name, twips_shape.name)
+        self.assertEqual([round(v * 20) for v in shape.edges[0].coords], list(twips_shape.edges[0].coords))
+
+        svg = twips_parser.str_shape_as_svg(twips_shape)
+        self.assertEqual(svg.get('viewBox'), '0 0 535 182')
+        for path in svg.iter('{http://www.w3.org/2000/svg}path'):
+            self.assertFalse('.' in path.get('d'))
+
+        svg = etree.fromstring(twips_parser.make_svg()[1])
+        for value in svg.get('viewBox').split():
+            self.assertEqual(str(int(value)), value)
+
+    def test__get_styles_gradient_twips(self):
+        parser = Parser(twips=True)
+        xml = self._get_xml('LINEAR_GRADIENT_1', 'styles/StyleList')
+        lgrad = parser._get_styles_gradient(xml.xpath(".//LinearGradient")[0], 'hogefuga')
+        self.assertEqual(lgrad.get('x1'), '-16384')
+        self.assertEqual(lgrad.get('x2'), '16384')
+        self.assertEqual(lgrad.get('gradientTransform'), 'matrix(0.04 0.00 0.00 0.03 667 566)')
+
+    def test_str_shape_as_use(self):
+        parser = Parser()
+        parser.parse_from_str(self.simplexml)
+        svg = parser.str_shape_as_use(parser.shapes['1'], 'hoge')
+        self.assertEqual(svg.get('viewBox'), '0.000000 0.000000 26.750000 9.100000')
+        self.assertEqual(len(svg), 1)
+        self.assertEqual(svg[0].tag, 'use')
+        self.assertEqual(svg[0].get('{http://www.w3.org/1999/xlink}href'), '#hoge')
+
+        defs, symbol = parser.make_shape_symbol(parser.shapes['1'], 'hoge')
+        self.assertEqual(defs, [])
+        self.assertEqual(symbol.tag, 'symbol')
+        self.assertEqual(symbol.get('id'), 'hoge')
+        self.assertEqual(symbol.get('overflow'), 'visible')
+        self.assertEqual(symbol[0].get('id'), 'obj1shape')
+
     def test_add_tree(self):
         parser = Parser()
         tree = Tree()
@@ -329,6 +519,15 @@ class TestParser(unittest.TestCase):
         animations = parser._str_animation([], None)
         self.assertEqual(len(animations), 0)
 
+    def test_animation_from_element(self):
+        parser = Parser()
+        parser.parse(open('./lightning_core/sample/sample1.xml', 'r'))
+        expected = etree.tostring(parser.str_animation())
+        animations = [Parser.animation_from_element(e) for e in parser.str_animation().iter('animation')]
+        self.assertEqual(etree.tostring(parser.str_animation(animations)), expected)
+        self.assertEqual(parser.merge_animations(parser.get_sprite_animations(reuse={'3': {'-obj2-1': animations[0]}}))[0].frames,
+                         animations[0].frames)
+
     def test_default_str_animation(self):
         parser = Parser()
         all_symbols = ['test']
@@ -460,7 +659,7 @@ class TestParser(unittest.TestCase):
         for path in gtag.getchildren():
             self.assertEqual(path.get('clip-rule'), 'evenodd')
             self.assertEqual(path.get('fill'), '#66ccff')
-            self.assertEqual(path.get('d'), 'M240.0000 0.0000 l-240.0000 -0.0000 l-0.0000 240.0000 l240.0000 -0.0000 l-0.0000 -240.0000 ')
+            self.assertEqual(path.get('d'), 'M240 0 0 0l0 240 240 0 0-240')
 
     def test_make_shape_element_complex(self):
         parser = Parser()
@@ -489,8 +688,16 @@ class TestParser(unittest.TestCase):
         edges.append({'fr': None, 'ln': None, 'type': 'S', 'y': 144.8, 'x': 163.05, 'fl': 0})
         edges.append({'y': -1.05, 'x': 0.85, 'type': 'L'})
         edges.append({'y1': -2.1, 'x2': 0.85, 'x1': 1.2, 'type': 'C', 'y2': -0.3})
-        data = Parser.ShapeMaker._path_data(edges)
-        self.assertEquals(data, 'M61.4000 134.5000 l-0.3500 -0.4500 q-0.5000 -0.1000 -3.7000 -2.1500 M163.0500 144.8000 l0.8500 -1.0500 q1.2000 -2.1000 2.0500 -2.4000 ')
+        edge = Edge()
+        for e in edges:
+            edge.add(e)
+        data = Parser.ShapeMaker._path_data(edge, [(0, 3, False)]) + Parser.ShapeMaker._path_data(edge, [(3, 6, False)])
+        self.assertEquals(data, 'M61.4 134.5l-.35-.45q-.5-.1-3.7-2.15M163.05 144.8l.85-1.05q1.2-2.1 2.05-2.4')
+
+        data = PathData()
+        Parser.ShapeMaker._path_data(edge, [(0, 3, False)], data)
+        Parser.ShapeMaker._path_data(edge, [(3, 6, False)], data)
+        self.assertEquals(data.getvalue(), 'M61.4 134.5l-.35-.45q-.5-.1-3.7-2.15m105.7 12.9.85-1.05q1.2-2.1 2.05-2.4')
 
     def test__reverse(self):
         path1 = []
@@ -521,7 +728,12 @@ class TestParser(unittest.TestCase):
             elif p["type"] == "C":
                 pc.append(p)
 
-        result = Parser.ShapeMaker._reverse(path)
+        edge = Edge()
+        for p in path:
+            edge.add(p)
+        reversed_path = Parser.ShapeMaker._reverse([(0, 13, False), (13, 14, False)])
+        self.assertEqual(reversed_path, [(0, 13, True), (13, 14, True)])
+        result = [v for seg in reversed_path for v in edge.segment_values(*seg)]
         rs = []
         rl = []
         rc = []
@@ -554,13 +766,30 @@ class TestParser(unittest.TestCase):
             self.assertAlmostEqual(rc[len(rc)-1-i]["x1"], -pc[i]["x2"])
             self.assertAlmostEqual(rc[len(rc)-1-i]["y1"], -pc[i]["y2"])
 
+    def _subpaths(self, edge):
+        starts = [i for i in xrange(len(edge)) if edge.ops[i] == Edge.SETUP]
+        return [(start, end, False) for start, end in zip(starts, starts[1:] + [len(edge)])]
+
+    def _merged_values(self, edge, contours):
+        result = []
+        for contour in contours:
+            values = [edge.segment_values(*seg) for seg in contour]
+            merged = values[0][:1]
+            for v in values:
+                merged.extend([p for p in v if p['type'] != 'S'])
+            result.append(merged)
+        return result
+
     def test__merge_path(self):
         path = []
         path.append({'fr': None, 'ln': None, 'type': 'S', 'y': 267.6, 'x': 79.15, 'fl': 0})
         path.append({'y': 2.4, 'x': 2.1, 'type': 'L'})
         path.append({'y': -1.5, 'x': -0.4, 'type': 'L'})
         path.append({'y': -0.9, 'x': -1.7, 'type': 'L'})
-        result = Parser.ShapeMaker._merge_path(path)
+        edge = Edge()
+        for p in path:
+            edge.add(p)
+        result = self._merged_values(edge, Parser.ShapeMaker._merge_path(edge, edge.get_path(0, 'left')))
         self.assertEqual(result,[path])
         path2=[]
         path2.append({'fr': None, 'ln': None, 'type': 'S', 'y': 83.75, 'x': 164.75, 'fl': 0})
@@ -622,7 +851,10 @@ class TestParser(unittest.TestCase):
         path2.append({'y': -5.5, 'x': 6.15, 'type': 'L'})
         path2.append({'y': 3.45, 'x': -0.9, 'type': 'L'})
         path2.append({'y1': 4.1, 'x2': -0.15, 'x1': -0.95, 'type': 'C', 'y2': 3.1})
-        result2 = Parser.ShapeMaker._merge_path(path2)
+        edge2 = Edge()
+        for p in path2:
+            edge2.add(p)
+        result2 = self._merged_values(edge2, Parser.ShapeMaker._merge_path(edge2, self._subpaths(edge2)))
         self.assertEqual(result2,[[{'fr': None, 'ln': None, 'type': 'S', 'y': 70.4, 'x': 88.1, 'fl': None}, {'y1': 4.4, 'x2': 1.3, 'x1': -0.15, 'type': 'C', 'y2': 5.95}, {'y': -6.35, 'x': -0.5, 'type': 'L'}, {'y1': -3.3, 'x2': 2.35, 'x1': -0.4, 'type': 'C', 'y2': -8.35}, {'y': -7.65, 'x': 2.4, 'type': 'L'}, {'y': 4.0, 'x': -5.7, 'type': 'L'}, {'y1': 5.0, 'x2': -5.2, 'x1': -6.75, 'type': 'C', 'y2': 5.0}, {'y1': 2.7, 'x2': -1.6, 'x1': -2.85, 'type': 'C', 'y2': 2.7}, {'y1': 0.15, 'x2': -2.55, 'x1': -3.0, 'type': 'C', 'y2': -2.6}, {'y1': 6.85, 'x2': 0.55, 'x1': -1.7, 'type': 'C', 'y2': 8.25}, {'y1': 5.85, 'x2': 1.1, 'x1': 0.4, 'type': 'C', 'y2': 3.5}, {'y': 0.9, 'x': 0.3, 'type': 'L'}, {'y': -22.0, 'x': 9.35, 'type': 'L'}, {'y1': -3.9, 'x2': 6.55, 'x1': 1.95, 'type': 'C', 'y2': -6.25}, {'y': -5.5, 'x': 6.15, 'type': 'L'}, {'y': 3.45, 'x': -0.9, 'type': 'L'}, {'y1': 4.1, 'x2': -0.15, 'x1': -0.95, 'type': 'C', 'y2': 3.1}], [{'fr': None, 'ln': None, 'type': 'S', 'y': 83.75, 'x': 164.75, 'fl': 0}, {'y1': -4.3, 'x2': -3.15, 'x1': -0.3, 'type': 'C', 'y2': -8.35}, {'y1': -9.3, 'x2': -3.7, 'x1': -3.55, 'type': 'C', 'y2': -4.4}, {'y': -2.35, 'x': -2.25, 'type': 'L'}, {'y1': 12.05, 'x2': -1.75, 'x1': 2.7, 'type': 'C', 'y2': 4.3}, {'y1': 2.95, 'x2': -2.05, 'x1': -1.2, 'type': 'C', 'y2': 1.9}, {'y': -6.15, 'x': -3.75, 'type': 'L'}, {'y1': -5.45, 'x2': -5.6, 'x1': -3.55, 'type': 'C', 'y2': -6.15}, {'y': -5.1, 'x': -4.85, 'type': 'L'}, {'y': 9.65, 'x': 5.6, 'type': 'L'}, {'y1': 10.65, 'x2': 2.35, 'x1': 6.05, 'type': 'C', 'y2': 5.05}, {'y': 0.8, 'x': -1.85, 'type': 'L'}, {'y1': -4.9, 'x2': -2.65, 'x1': -2.85, 'type': 'C', 'y2': -2.9}, {'y': -7.65, 'x': -7.35, 'type': 'L'}, {'y': 6.9, 'x': 4.05, 'type': 'L'}, {'y1': 7.35, 'x2': 0.2, 'x1': 4.1, 'type': 'C', 'y2': 2.05}, {'y': 0.45, 'x': 0.05, 'type': 'L'}, {'y1': 1.25, 'x2': -8.9, 'x1': -5.75, 'type': 'C', 'y2': 0.05}, {'y1': -5.8, 'x2': -3.15, 'x1': -1.9, 'type': 'C', 'y2': -4.6}, {'y1': -6.35, 'x2': -7.7, 'x1': -4.3, 'type': 'C', 'y2': -9.65}, {'y1': 3.15, 'x2': 3.3, 'x1': 2.35, 'type': 'C', 'y2': 9.1}, {'y1': 8.65, 'x2': 0.95, 'x1': 3.2, 'type': 'C', 'y2': 5.25}, {'y1': -0.95, 'x2': -4.75, 'x1': -13.55, 'type': 'C', 'y2': -6.5}, {'y1': -2.3, 'x2': -1.1, 'x1': -1.7, 'type': 'C', 'y2': -3.7}, {'y': -6.05, 'x': -1.7, 'type': 'L'}, {'y': -0.65, 'x': 0.0, 'type': 'L'}, {'y': 4.1, 'x': -1.4, 'type': 'L'}, {'y1': 4.5, 'x2': -0.4, 'x1': -1.5, 'type': 'C', 'y2': 2.05}, {'y': 9.35, 'x': -1.95, 'type': 'L'}, {'y1': 4.0, 'x2': 1.15, 'x1': 1.0, 'type': 'C', 'y2': 2.6}, {'y1': 2.5, 'x2': 0.0, 'x1': 1.1, 'type': 'C', 'y2': -1.45}, {'y1': -1.85, 'x2': 0.7, 'x1': 0.0, 'type': 'C', 'y2': -8.4}, {'y': -8.05, 'x': 0.65, 'type': 'L'}, {'y': 21.0, 'x': 4.65, 'type': 'L'}, {'y': -1.1, 'x': 10.7, 'type': 'L'}, {'y1': -1.35, 'x2': 1.05, 'x1': 10.95, 'type': 'C', 'y2': -1.25}, {'y1': -1.2, 'x2': -1.75, 'x1': 1.0, 'type': 'C', 'y2': -6.95}, {'y': -5.15, 'x': -1.25, 'type': 'L'}, {'y': 13.3, 'x': 5.95, 'type': 'L'}, {'y': -1.65, 'x': 38.35, 'type': 'L'}, {'y': 0.4, 'x': 0.6, 'type': 'L'}, {'y1': -0.25, 'x2': -0.2, 'x1': 0.6, 'type': 'C', 'y2': -3.15}]])
 
         path3=[]
@@ -656,8 +888,26 @@ class TestParser(unittest.TestCase):
         path3.append({'y': 3.35, 'x': 2.45, 'type': 'L'})
         path3.append({'y': 3.45, 'x': 2.35, 'type': 'L'})
 
-        result3 = Parser.ShapeMaker._merge_path(path3)
-        self.assertEqual(result3,[[{'y': 134.49999999999991, 'x': 61.40000000000007, 'type': 'S'}, {'y': -0.45, 'x': -0.35, 'type': 'L'}, {'y1': -0.1, 'x2': -3.2, 'x1': -0.5, 'type': 'C', 'y2': -2.05}, {'y1': -2.0, 'x2': -0.6, 'x1': -3.1, 'type': 'C', 'y2': -0.05}, {'y1': -0.0, 'x2': 3.25, 'x1': -1.4, 'type': 'C', 'y2': 3.6}, {'y': 3.35, 'x': 2.45, 'type': 'L'}, {'y': 3.45, 'x': 2.35, 'type': 'L'}, {'y': -0.95, 'x': -0.05, 'type': 'L'}, {'y1': -2.4, 'x2': 0.35, 'x1': 0.1, 'type': 'C', 'y2': -1.1}, {'y': -1.3, 'x': 0.7, 'type': 'L'}], [{'fr': None, 'ln': None, 'type': 'S', 'y': 144.8, 'x': 163.05, 'fl': 0}, {'y': -1.05, 'x': 0.85, 'type': 'L'}, {'y1': -2.1, 'x2': 0.85, 'x1': 1.2, 'type': 'C', 'y2': -0.3}, {'y': -5.6, 'x': 14.3, 'type': 'L'}, {'y': -5.75, 'x': 14.5, 'type': 'L'}, {'y': -1.0, 'x': 2.0, 'type': 'L'}, {'y1': -0.45, 'x2': -1.2, 'x1': 0.55, 'type': 'C', 'y2': -0.5}, {'y1': -0.4, 'x2': -5.45, 'x1': -1.05, 'type': 'C', 'y2': 2.1}, {'y': 4.35, 'x': -11.1, 'type': 'L'}, {'y1': 1.1, 'x2': -4.55, 'x1': -3.15, 'type': 'C', 'y2': 2.05}, {'y1': 0.9, 'x2': -0.75, 'x1': -2.0, 'type': 'C', 'y2': -0.45}, {'y1': -0.4, 'x2': -1.8, 'x1': -0.65, 'type': 'C', 'y2': 0.4}, {'y': 0.5, 'x': -2.8, 'type': 'L'}, {'y': 0.9, 'x': 0.4, 'type': 'L'}, {'y1': 1.1, 'x2': -0.05, 'x1': 0.3, 'type': 'C', 'y2': 2.4}, {'y': 2.2, 'x': -0.4, 'type': 'L'}]])
+        edge3 = Edge()
+        for p in path3:
+            edge3.add(p)
+        result3 = self._merged_values(edge3, Parser.ShapeMaker._merge_path(edge3, self._subpaths(edge3)))
+        self.assertEqual(result3,[[{'fr': None, 'ln': None, 'type': 'S', 'y': 134.49999999999991, 'x': 61.40000000000007, 'fl': None}, {'y': -0.45, 'x': -0.35, 'type': 'L'}, {'y1': -0.1, 'x2': -3.2, 'x1': -0.5, 'type': 'C', 'y2': -2.05}, {'y1': -2.0, 'x2': -0.6, 'x1': -3.1, 'type': 'C', 'y2': -0.05}, {'y1': -0.0, 'x2': 3.25, 'x1': -1.4, 'type': 'C', 'y2': 3.6}, {'y': 3.35, 'x': 2.45, 'type': 'L'}, {'y': 3.45, 'x': 2.35, 'type': 'L'}, {'y': -0.95, 'x': -0.05, 'type': 'L'}, {'y1': -2.4, 'x2': 0.35, 'x1': 0.1, 'type': 'C', 'y2': -1.1}, {'y': -1.3, 'x': 0.7, 'type': 'L'}], [{'fr': None, 'ln': None, 'type': 'S', 'y': 144.8, 'x': 163.05, 'fl': 0}, {'y': -1.05, 'x': 0.85, 'type': 'L'}, {'y1': -2.1, 'x2': 0.85, 'x1': 1.2, 'type': 'C', 'y2': -0.3}, {'y': -5.6, 'x': 14.3, 'type': 'L'}, {'y': -5.75, 'x': 14.5, 'type': 'L'}, {'y': -1.0, 'x': 2.0, 'type': 'L'}, {'y1': -0.45, 'x2': -1.2, 'x1': 0.55, 'type': 'C', 'y2': -0.5}, {'y1': -0.4, 'x2': -5.45, 'x1': -1.05, 'type': 'C', 'y2': 2.1}, {'y': 4.35, 'x': -11.1, 'type': 'L'}, {'y1': 1.1, 'x2': -4.55, 'x1': -3.15, 'type': 'C', 'y2': 2.05}, {'y1': 0.9, 'x2': -0.75, 'x1': -2.0, 'type': 'C', 'y2': -0.45}, {'y1': -0.4, 'x2': -1.8, 'x1': -0.65, 'type': 'C', 'y2': 0.4}, {'y': 0.5, 'x': -2.8, 'type': 'L'}, {'y': 0.9, 'x': 0.4, 'type': 'L'}, {'y1': 1.1, 'x2': -0.05, 'x1': 0.3, 'type': 'C', 'y2': 2.4}, {'y': 2.2, 'x': -0.4, 'type': 'L'}]])
+
+    def test__merge_path_chain(self):
+        edge = Edge()
+        for x, y, dx, dy in [(1.0, 0.0, 0.0, 1.0),  # b -> c
+                             (0.0, 1.0, 0.0, -1.0), # d -> a
+                             (0.0, 0.0, 1.0, 0.0),  # a -> b
+                             (1.0, 1.0, -1.0, 0.0), # c -> d
+                             (5.0, 5.0, 1.0, 0.0),  # separate contour
+                             (0.0, 0.0, 0.0, 1.0)]: # a -> d, shares the start of a -> b
+            edge.add_setup(x, y, 0)
+            edge.add_line_to(dx, dy)
+        path = edge.get_path(0, 'left')
+        result = Parser.ShapeMaker._merge_path(edge, path)
+        self.assertEqual(result, [[path[5], path[1], path[2], path[0], path[3]],
+                                  [path[4]]])
 
 class TestPUtil(unittest.TestCase):
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import unittest
+from lightning_core.vg.shapecache import *
+from lightning_core.vg.parser import *
+from lxml import etree
+
+class TestShapeCache(unittest.TestCase):
+    def setUp(self):
+        self.xmlname = './lightning_core/sample/sample1.xml'
+        self.dirname = tempfile.mkdtemp()
+        self.cache = ShapeCache(self.dirname)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def _entries(self):
+        return [f for dirpath, dirnames, filenames in os.walk(self.dirname)
+                for f in filenames if f.endswith(ShapeCache.SUFFIX)]
+
+    def test_get_and_put(self):
+        self.assertEqual(self.cache.get('abcd'), None)
+        group = etree.Element('g')
+        group.set('id', 'obj1shape')
+        stop = etree.SubElement(etree.Element('linearGradient'), 'stop')
+        self.cache.put('abcd', [stop], group)
+
+        defs, cached = self.cache.get('abcd')
+        self.assertEqual(etree.tostring(cached), '<g id="obj1shape"/>')
+        self.assertEqual([etree.tostring(d) for d in defs], ['<stop/>'])
+        self.assertEqual(self._entries(), ['abcd.xml'])
+
+    def test_broken_entry(self):
+        self.cache.put('abcd', [], etree.Element('g'))
+        with open(os.path.join(self.dirname, 'ab', 'abcd.xml'), 'w') as fp:
+            fp.write('<entry><defs>')
+        self.assertEqual(self.cache.get('abcd'), None)
+        self.assertEqual(self._entries(), [])
+
+    def test_make_key(self):
+        shape = Shape()
+        shape.digest = ShapeCache.digest(etree.fromstring('<DefineShape objectID="1"/>'))
+        self.assertEqual(self.cache.make_key(shape, [], 'a'), self.cache.make_key(shape, [], 'b'))
+        self.assertNotEqual(self.cache.make_key(shape, [{'a': [256] * 8}], 'a'),
+                            self.cache.make_key(shape, [{'a': [256] * 8}], 'b'))
+        self.assertNotEqual(self.cache.make_key(shape, [], 'a'),
+                            self.cache.make_key(shape, [{'a': [256] * 8}], 'a'))
+
+        other = Shape()
+        other.digest = ShapeCache.digest(etree.fromstring('<DefineShape  objectID="1"></DefineShape>'))
+        self.assertEqual(self.cache.make_key(shape, [], ''), self.cache.make_key(other, [], ''))
+
+        other.twips = True
+        self.assertNotEqual(self.cache.make_key(shape, [], ''), self.cache.make_key(other, [], ''))
+
+    def test_evict(self):
+        group = etree.Element('g')
+        group.set('d', 'x' * 100)
+        for i, key in enumerate(['aa01', 'bb02', 'cc03']):
+            self.cache.put(key, [], group)
+            os.utime(self.cache._get_path(key), (1000 + i, 1000 + i))
+        self.cache.get('aa01')
+
+        self.cache.max_bytes = 2 * os.path.getsize(self.cache._get_path('aa01'))
+        self.cache.evict()
+        self.assertEqual(sorted(self._entries()), ['aa01.xml', 'cc03.xml'])
+
+    def test_parser(self):
+        parser = Parser()
+        parser.parse(open(self.xmlname, 'r'))
+        expected = [etree.tostring(Parser.str_shape_as_svg(v)) for k, v in sorted(parser.shapes.iteritems())]
+
+        for i in xrange(2):
+            parser = Parser(self.cache)
+            parser.parse(open(self.xmlname, 'r'))
+            result = [etree.tostring(Parser.str_shape_as_svg(v)) for k, v in sorted(parser.shapes.iteritems())]
+            self.assertEqual(result, expected)
+            self.assertEqual(len(self._entries()), len(parser.shapes))
+
+    def test_parser_ctf(self):
+        parser = Parser(self.cache)
+        parser.parse(open(self.xmlname, 'r'))
+        shape = parser.shapes.values()[0]
+        for i in xrange(2):
+            ctf = [{'-' + shape.symbol: [128, 128, 128, 256, 0, 0, 0, 0]}]
+            Parser.ShapeMaker.make_shape_element(shape, ctf, '')
+            self.assertEqual(ctf, [])
+
+if __name__ == '__main__':
+    unittest.main()
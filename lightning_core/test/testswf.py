@@ -144,7 +144,47 @@ class TestEdge(unittest.TestCase):
         edge.add({'type':'S', 'fl':0})
         path = edge.get_path(0, 'left')
         self.assertEqual(len(path), 1)
-        self.assertEqual(path[0], {'type':'S', 'fl':0})
+        self.assertEqual(path[0], (0, 1, False))
+        self.assertEqual(edge.segment_values(*path[0]), [{'type':'S', 'x':0.0, 'y':0.0, 'fl':0, 'fr':None, 'ln':None}])
+
+    def test_get_path_ranges(self):
+        edge = Edge()
+        edge.add_setup(0.0, 0.0, 0, None, None)
+        edge.add_line_to(1.0, 0.0)
+        edge.add_setup(1.0, 0.0, None, None, None)
+        edge.add_line_to(0.0, 1.0)
+        edge.add_setup(1.0, 1.0, 1, None, None)
+        edge.add_line_to(-1.0, 0.0)
+        self.assertEqual(edge.get_path(0, 'left'), [(0, 2, False), (2, 4, False)])
+        self.assertEqual(edge.get_path(1, 'left'), [(4, 6, False)])
+        self.assertEqual(edge.get_path(0, 'right'), [])
+
+    def test_build_index(self):
+        edge = Edge()
+        edge.add_setup(0.0, 0.0, 0, 1, None)
+        edge.add_line_to(1.0, 0.0)
+        edge.add_setup(1.0, 0.0, None, -1, 0)
+        index = edge.build_index()
+        self.assertEqual(index['left'], {0: [(0, 2, False), (2, 3, False)]})
+        self.assertEqual(index['right'], {1: [(0, 2, False)], -1: [(2, 3, False)]})
+        self.assertEqual(index['line'], {0: [(2, 3, False)]})
+
+        edge.add_line_to(0.0, 1.0)
+        self.assertEqual(edge.get_path(0, 'line'), [(2, 4, False)])
+
+    def test_begin_end(self):
+        edge = Edge()
+        edge.add_setup(1.0, 2.0)
+        edge.add_line_to(3.0, 0.0)
+        edge.add_curve_to(1.0, 1.0, 1.0, 1.0)
+        self.assertEqual(edge.begin(0, 3), (1.0, 2.0))
+        self.assertEqual(edge.end(0, 3), (6.0, 4.0))
+        self.assertEqual(edge.begin(0, 3, True), (6.0, 4.0))
+        self.assertEqual(edge.end(0, 3, True), (1.0, 2.0))
+        self.assertEqual(edge.segment_values(0, 3, True),
+                         [{'type':'S', 'x':6.0, 'y':4.0},
+                          {'type':'C', 'x1':-1.0, 'y1':-1.0, 'x2':-1.0, 'y2':-1.0},
+                          {'type':'L', 'x':-3.0, 'y':-0.0}])
         
 
 class TestShape(unittest.TestCase):
@@ -172,9 +212,33 @@ class TestShape(unittest.TestCase):
         self.assertEqual(len(shape.edges), 1)
 
     def test_generate_name(self):
-        shape = Shape()
-        shape.symbol = 'hoge'
-        self.assertEqual(shape.generate_name(), '31f30ddbcb1bf8446576f0e64aa4c88a9f055e3c')
+        def make_shape(symbol, x):
+            shape = Shape()
+            shape.symbol = symbol
+            shape.right = 10
+            edge = Edge()
+            edge.add_colors('s', [(0, 0, 0, 256), 'url(#%s_0)' % symbol])
+            edge.add({'type':'S', 'x':x, 'y':0.0, 'fr':0})
+            edge.add({'type':'L', 'x':1.0, 'y':1.0})
+            shape.append(edge)
+            gradient = etree.Element('linearGradient')
+            gradient.set('id', '%s_0' % symbol)
+            etree.SubElement(gradient, 'stop').set('offset', '0.0')
+            shape.defs.append(gradient)
+            return shape
+
+        shape = make_shape('hoge', 0.0)
+        self.assertEqual(len(shape.generate_name()), 40)
+        self.assertEqual(shape.generate_name(), make_shape('fuga', 0.0).generate_name())
+        self.assertNotEqual(shape.generate_name(), make_shape('hoge', 1.0).generate_name())
+
+        other = make_shape('fuga', 0.0)
+        other.defs[0][0].set('offset', '1.0')
+        self.assertNotEqual(shape.generate_name(), other.generate_name())
+
+        other = make_shape('fuga', 0.0)
+        other.bottom = 10
+        self.assertNotEqual(shape.generate_name(), other.generate_name())
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+import zlib
+from StringIO import StringIO
+from lightning_core.vg.swfreader import *
+from lightning_core.vg.parser import *
+from lxml import etree
+
+class TestBitReader(unittest.TestCase):
+    def test_bits(self):
+        r = BitReader('\xb4\x0f')
+        self.assertEqual(r.ubits(1), 1)
+        self.assertEqual(r.ubits(3), 3)
+        self.assertEqual(r.sbits(4), 4)
+        self.assertEqual(r.sbits(4), 0)
+        self.assertEqual(r.sbits(4), -1)
+
+    def test_align(self):
+        r = BitReader('\xff\x01\x02')
+        self.assertEqual(r.ubits(3), 7)
+        self.assertEqual(r.u16(), 0x0201)
+
+    def test_string(self):
+        r = BitReader('body\0rest')
+        self.assertEqual(r.string(), 'body')
+        self.assertEqual(r.pos, 5)
+
+    def test_end_of_data(self):
+        r = BitReader('\x01')
+        self.assertRaises(SwfFormatError, r.u16)
+
+class TestSwfReader(unittest.TestCase):
+    def setUp(self):
+        self.swfname = './lightning_core/sample/sample1.swf'
+        self.xmlname = './lightning_core/sample/sample1.xml'
+
+    def test_is_swf(self):
+        self.assertTrue(SwfReader.is_swf(self.swfname))
+        self.assertFalse(SwfReader.is_swf(self.xmlname))
+        f = open(self.xmlname, 'r')
+        self.assertFalse(SwfReader.is_swf(f))
+        self.assertEqual(f.tell(), 0)
+
+    def test_header(self):
+        reader = SwfReader(self.swfname)
+        self.assertEqual(reader.version, 4)
+        self.assertFalse(reader.compressed)
+        self.assertEqual(reader.frame_count, 1)
+        self.assertEqual(dict(reader.size.attrib), {'left': '0', 'right': '800', 'top': '0', 'bottom': '1200'})
+
+    def test_tags(self):
+        xml = etree.parse(self.xmlname)
+        expected = [e.tag for e in xml.xpath('//swf/Header/tags/*') if e.tag not in ('SetBackgroundColor', 'End')]
+        tags = [e.tag for e in SwfReader(self.swfname).tags()]
+        self.assertEqual(tags, expected)
+
+    def test_define_shape(self):
+        xml = etree.parse(self.xmlname)
+        expected = xml.xpath('//swf/Header/tags/DefineShape')[0]
+        shape = [e for e in SwfReader(self.swfname).tags() if e.tag == 'DefineShape'][0]
+        self.assertEqual(shape.get('objectID'), expected.get('objectID'))
+        self.assertEqual(shape.find('bounds/Rectangle').attrib, expected.find('bounds/Rectangle').attrib)
+        edges = shape.xpath('shapes/Shape/edges/*')
+        expected_edges = expected.xpath('shapes/Shape/edges/*')
+        self.assertEqual([(e.tag, dict(e.attrib)) for e in edges],
+                         [(e.tag, dict(e.attrib)) for e in expected_edges])
+
+    def test_compressed(self):
+        data = open(self.swfname, 'rb').read()
+        compressed = 'CWS' + data[3:8] + zlib.compress(data[8:])
+        reader = SwfReader(StringIO(compressed))
+        self.assertTrue(reader.compressed)
+        self.assertEqual(len(list(reader.tags())), len(list(SwfReader(self.swfname).tags())))
+
+    def test_not_swf(self):
+        self.assertRaises(SwfFormatError, SwfReader, StringIO('<swf/>'))
+
+    def test_parse_parity(self):
+        parser = Parser()
+        parser.parse(open(self.xmlname, 'r'))
+        swf_parser = Parser()
+        swf_parser.parse(self.swfname)
+
+        self.assertEqual(sorted(swf_parser.shapes.keys()), sorted(parser.shapes.keys()))
+        for k, v in parser.shapes.iteritems():
+            for e, swf_e in zip(v.edges, swf_parser.shapes[k].edges):
+                self.assertEqual(swf_e.values, e.values)
+                self.assertEqual(swf_e.colors, e.colors)
+        self.assertEqual(str(swf_parser.tree), str(parser.tree))
+        self.assertEqual(etree.tostring(swf_parser.str_animation()),
+                         etree.tostring(parser.str_animation()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,6 +50,41 @@ class TestLinearGrad(unittest.TestCase):
         self.assertEqual(lg[1].get('stop-opacity'), str(0.0/255))
         self.assertEqual(lg[1].get('offset'), str(0.0/255))
 
+class TestPathData(unittest.TestCase):
+    def test_number(self):
+        data = PathData()
+        self.assertEqual(data.number(240.0), '240')
+        self.assertEqual(data.number(0.5), '.5')
+        self.assertEqual(data.number(-0.35), '-.35')
+        self.assertEqual(data.number(-0.0), '0')
+        self.assertEqual(data.number(-0.00001), '0')
+        self.assertEqual(data.number(1.23456), '1.2346')
+        self.assertEqual(PathData(0).number(100.0), '100')
+
+    def test_separators(self):
+        data = PathData()
+        data.move_to(0.5, 0.5)
+        data.line_to(-0.25, 0.5)
+        self.assertEqual(data.getvalue(), 'M.5.5.25 1')
+
+    def test_relative_or_absolute(self):
+        data = PathData()
+        data.move_to(1000.5, 1000.5)
+        data.line_to(1.0, 1.0)
+        data.line_to(-1001.5, -1001.5)
+        data.curve_to(1.0, 0.0, 0.0, 1.0)
+        self.assertEqual(data.getvalue(), 'M1000.5 1000.5l1 1L0 0q1 0 1 1')
+
+    def test_repeated_commands(self):
+        data = PathData()
+        data.move_to(10.0, 10.0)
+        data.line_to(-20.0, 0.0)
+        data.line_to(0.0, -20.0)
+        data.move_to(100.0, 100.0)
+        data.line_to(10.0, 10.0)
+        self.assertEqual(data.getvalue(), 'M10 10l-20 0 0-20m110 110 10 10')
+        self.assertEqual(len(PathData()), 0)
+
 class TestTransform(unittest.TestCase):
 
     def setUp(self):
@@ -109,6 +144,25 @@ class TestTree(unittest.TestCase):
         tree.children.append(tree2)
         self.assertEqual(str(tree), 'key=hoge\n\tkey=fuga')
 
+    def test_find(self):
+        trees = []
+        for key in ('root', 'a', 'b', 'c'):
+            tree = Tree()
+            tree.key = key
+            trees.append(tree)
+        root, a, b, c = trees
+        for parent, child in ((root, a), (a, b), (root, c)):
+            child.parent = parent
+            parent.children.append(child)
+        b.name = 'hoge'
+        c.name = 'hoge'
+
+        self.assertEqual([t.key for t in root.iter()], ['root', 'a', 'b', 'c'])
+        self.assertTrue(root.find('hoge') is b)
+        self.assertEqual(root.find('fuga'), None)
+        self.assertEqual(b.get_ancestors(), [root, a])
+        self.assertEqual(root.get_ancestors(), [])
+
 
 class TestAnimation(unittest.TestCase):
     def test_constructor(self):
@@ -38,13 +38,14 @@ logging.basicConfig(level=logging.DEBUG,
 
 class CssElement(dict):
 
-    def __init__(self, title=''):
+    def __init__(self, title='', minify=False):
         super(CssElement, self).__init__()
+        self.minify = minify
 
         self.common_element = {
             'position' : ['position', 'absolute'],
             'transform': ['-webkit-transform', None],
-            'origin'   : ['-webkit-transform-origin', '0.0px 0.0px'],
+            'origin'   : ['-webkit-transform-origin', '0 0' if minify else '0.0px 0.0px'],
         }
         self.animation_element = {
             'name'     : ['-webkit-animation-name', None],
@@ -63,12 +64,22 @@ class CssElement(dict):
         self.sp = '\n' # splitter
 
     def __str__(self):
+        if self.minify:
+            return '%s{%s}' % (self.title, ';'.join(['%s:%s' % (k,v) for k,v in self.iteritems()]))
         content = self.sp.join(['%s: %s;' % (k,v) for k,v in self.iteritems()])
         return '%s {%s%s%s}%s' % (self.title, self.sp, content, self.sp, self.sp)
 
-    def add_anims_element(self, key, anim_length, has_anim_name):
+    def _write_seconds(self, seconds):
+        if self.minify:
+            return '%ss' % LUtil.shortest_number(seconds, 6)
+        return '%fs' % seconds
+
+    def add_anims_element(self, key, anim_length, has_anim_name, offset=0):
         self.animation_element['name'][1]      = key
-        self.animation_element['duration'][1]  = '%fs'%(float(anim_length)/12.0)
+        self.animation_element['duration'][1]  = self._write_seconds(float(anim_length)/12.0)
+        if offset:
+            # starts offset frames into the keyframes
+            self.animation_element['delay'] = ['-webkit-animation-delay', self._write_seconds(-float(offset)/12.0)]
         if not has_anim_name:
             del self.animation_element['name']
         self.update(self.animation_element.values())
@@ -76,7 +87,10 @@ class CssElement(dict):
 
     def add_shape_element(self, shape_key, shape_table):
         def calc_twips_to_pixel(twips):
-            return '%dpx' % int(round(float(twips)/20))
+            pixel = int(round(float(twips)/20))
+            if self.minify and pixel == 0:
+                return '0'
+            return '%dpx' % pixel
 
         shape  = shape_table[shape_key]
         self.shape_element['left'][1]   = calc_twips_to_pixel(shape.left)
@@ -103,6 +117,10 @@ class SvgShape(object):
         self.edges = []
         self.defs  =[]
 
+    @classmethod
+    def from_shape(cls, shape):
+        return cls((shape.symbol, shape.name, int(shape.left), int(shape.top), int(shape.width), int(shape.height)))
+
     def filename(self, dir_path='.'):
         return os.path.join(dir_path, '%s_%s.svg' % (self.obj, self.hash))
 
@@ -121,8 +139,38 @@ class SvgTransform(Transform):
         if 'visible' in attrib and attrib['visible'] == 'False':
             self.visible = False
 
+    @classmethod
+    def from_transform(cls, transform):
+        """same as reading the attributes written for transform by the parser"""
+        svg_transform = cls({})
+        svg_transform.set_items(dict([(k, float(getattr(transform, k))) for k in cls.MATRIX if getattr(transform, k) is not None]))
+        if transform.depth is not None:
+            svg_transform.depth = int(transform.depth)
+        if transform.ctf is not None:
+            svg_transform.ctf = ColorTransform(list(transform.ctf))
+        if transform.clipDepth is not None:
+            svg_transform.clipDepth = int(transform.clipDepth)
+        if transform.visible is False:
+            svg_transform.visible = False
+        return svg_transform
+
+    def get_key(self):
+        """what a keyframe of this transform is written from"""
+        # an invisible frame is written as a step even where its opacity is 0
+        return (self.sx, self.sy, self.wx, self.wy, self.tx, self.ty, self.get_opacity(), self.visible)
+
     def __eq__(self, other):
-        return [self.sx, self.sy, self.wx, self.wy, self.tx, self.ty, self.get_opacity()]==other
+        if isinstance(other, SvgTransform):
+            other = other.get_key()
+        elif not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return list(self.get_key()) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.get_key())
 
     def write_matrix(self):
         return self._shorten('matrix(%.6f,%.6f,%.6f,%.6f,%.6f,%.6f)' % self.get_matrix())
@@ -133,6 +181,12 @@ class SvgTransform(Transform):
     def write_webkit_transform(self):
         return self._shorten('-webkit-transform: %s;' % self.write_matrix3d())
 
+    def write_short_matrix(self, precision, translation_precision):
+        """2d matrix() with every number in its shortest form"""
+        values = [LUtil.shortest_number(v, precision) for v in (self.sx, self.wx, self.wy, self.sy)]
+        values += [LUtil.shortest_number(v, translation_precision) for v in (self.tx/20, self.ty/20)]
+        return 'matrix(%s)' % ','.join(values)
+
     def _shorten(self, str):
         return str.replace('.000000', '.0')
 
@@ -150,8 +204,69 @@ class SvgTransform(Transform):
     def write_visible(self):
         return self._shorten('opacity: %.6f;' % self.get_opacity())
 
+    # how far each of the values may be off in the swf, which rounds
+    # translations to twips and color transforms to 1/256
+    PRECISION = (0.0, 0.0, 0.0, 0.0, 0.05, 0.05, 1.0/256)
+
+    def get_values(self):
+        """the values of a keyframe in the units they are written in"""
+        return (self.sx, self.wx, self.wy, self.sy, self.tx/20, self.ty/20, self.get_opacity())
+
+class ClassNames(object):
+    """short names for the keys written as classes and keyframes.
+
+    a name is the key prefix, '_' and a base 36 number, so the names of
+    parts converted with different key prefixes never collide. lower case
+    only, as class names are not case sensitive in quirks mode.
+    """
+
+    def __init__(self, key_prefix=''):
+        self.key_prefix = key_prefix
+        self.names = {}
+
+    def get(self, key):
+        name = self.names.get(key)
+        if name is None:
+            name = '%s_%s' % (self.key_prefix, LUtil.to_base36(len(self.names)))
+            self.names[key] = name
+        return name
+
+    def dumps(self):
+        """json object of the keys by name"""
+        return json.dumps(dict((name, key) for key, name in self.names.iteritems()), sort_keys=True, indent=1)
+
+    def save(self, filepath):
+        with open(filepath, 'w') as f:
+            f.write(self.dumps())
+
 class AnimationManager(object):
-    def __init__(self, dir_path, basefilename):
+    # a keyframe_tolerance which drops no visible detail. it is the largest
+    # error, in the units of the css, of a keyframe dropped because the
+    # browser interpolates it from its neighbors, on top of the precision
+    # of its values in the swf (SvgTransform.PRECISION). keyframes are only
+    # dropped when a tolerance is given
+    KEYFRAME_TOLERANCE = 0.001
+
+    # the most keyframes one timing function is fitted over, which bounds
+    # the cost of each fit
+    MAX_EASED_KEYFRAMES = 64
+
+    # digits after the point of matrix components, translations in pixels
+    # and percents of keyframes in minified css
+    PRECISION = (4, 2, 4)
+
+    # declarations which do nothing on a div without an animation
+    ANIMATION_PROPERTIES = ('-webkit-animation-timing-function', '-webkit-animation-iteration-count')
+
+    def __init__(self, dir_path, basefilename, keyframe_tolerance=None, fit_easing=False, group_rules=False, class_names=None,
+                 minify=False, precision=PRECISION, share_keyframes=False):
+        self.class_names = class_names
+        self.share_keyframes = share_keyframes
+        self.minify = minify
+        self.precision = precision
+        self.keyframe_tolerance = keyframe_tolerance
+        self.fit_easing = fit_easing
+        self.group_rules = group_rules
         self.dir_path = dir_path
         self.shapes_filepath = self._get_path('shapes')
         self.animation_filepath = self._get_path('animation.xml')
@@ -163,6 +278,12 @@ class AnimationManager(object):
     def _get_path(self, filename):
         return os.path.join(self.dir_path, filename)
 
+    def get_name(self, key):
+        """what key is written as, its short name with class_names"""
+        if self.class_names is None:
+            return key
+        return self.class_names.get(key)
+
     def load_shapes(self):
         with open(self.shapes_filepath, 'r') as f:
             return self.get_shapes(f.readlines())
@@ -191,7 +312,105 @@ class AnimationManager(object):
         root = self._parse_xml(self.structure_filepath)
         return self.get_structure(root, shape_table, parser_shapes)
 
-    def get_structure(self, root, shape_table, anim_table, ctfsArray, parser_shapes, mcname=None, key_prefix=""):
+    def get_shapes_from_parser(self, shapes):
+        """get_shapes over the Shape objects of the parser"""
+        shape_table = {}
+        for shape in shapes.itervalues():
+            shape_table[shape.symbol] = SvgShape.from_shape(shape)
+        return shape_table
+
+    def get_animation_from_parser(self, animations):
+        """get_animation over the Animation objects of the parser"""
+        anim_table = {}
+        for animation in animations:
+            anim_table[animation.key[:-2]] = [SvgTransform.from_transform(frame) for frame in animation.frames]
+        return anim_table
+
+    def get_structure(self, root, shape_table, anim_table, ctfsArray, parser_shapes, mcname=None, key_prefix="", use_symbols=False):
+        # with mcname, only the named part, its ancestors for the color
+        # transforms and its descendants are visited
+        if mcname is None:
+            root_elem = root
+            ancestors = []
+            elems = root.xpath('//part')
+        else:
+            root_elem = root.xpath('//part[@name="%s"]'%mcname)[0]
+            ancestors = list(root_elem.iterancestors('part'))
+            ancestors.reverse()
+            elems = ancestors + list(root_elem.iter('part'))
+
+        def iter_parts():
+            for elem in elems:
+                if 'key' in elem.attrib:
+                    yield (elem,
+                           elem.attrib['key'],
+                           elem.attrib['depth'],
+                           'clipDepth' in elem.attrib,
+                           elem.attrib['name'] if 'name' in elem.attrib else None,
+                           json.loads(elem.attrib['ctf']),
+                           SvgTransform(elem.attrib),
+                           len(elem) == 0,
+                           elem not in ancestors)
+
+        structure_table, symbols = self._make_structure(iter_parts(), ctfsArray, parser_shapes, key_prefix, use_symbols)
+        return structure_table, self._make_structure_tree(root_elem, symbols)
+
+    def get_structure_from_tree(self, tree, shape_table, anim_table, ctfsArray, parser_shapes, mcname=None, key_prefix="", use_symbols=False):
+        """get_structure over the Tree of the parser"""
+        # with mcname, only the named tree, its ancestors for the color
+        # transforms and its descendants are visited
+        ancestors = []
+        if mcname is not None:
+            named = tree.find(mcname)
+            if named is None:
+                raise IndexError('no part named %s' % mcname)
+            ancestors = named.get_ancestors()
+            tree = named
+
+        def make_part(tree, parent, in_output):
+            elem = etree.SubElement(parent, 'part')
+            return (elem,
+                    tree.key,
+                    str(tree.depth),
+                    tree.clipDepth is not None,
+                    tree.name,
+                    list(tree.ctf),
+                    SvgTransform.from_transform(tree),
+                    len(tree.children) == 0,
+                    in_output)
+
+        def iter_parts(tree, parent):
+            part = make_part(tree, parent, True)
+            yield part
+            for c in tree.children:
+                for p in iter_parts(c, part[0]):
+                    yield p
+
+        root = etree.Element('structure')
+        top = []
+
+        def iter_all():
+            parent = root
+            for a in ancestors:
+                part = make_part(a, parent, False)
+                yield part
+                parent = part[0]
+            for part in iter_parts(tree, parent):
+                if len(top) == 0:
+                    top.append(part[0])
+                yield part
+
+        structure_table, symbols = self._make_structure(iter_all(), ctfsArray, parser_shapes, key_prefix, use_symbols)
+
+        if mcname is None:
+            root_elem = root
+        else:
+            root_elem = top[0]
+        return structure_table, self._make_structure_tree(root_elem, symbols)
+
+    def _make_structure(self, parts, ctfsArray, parser_shapes, key_prefix, use_symbols):
+        # turns parts into divs in document order, and puts svg of the
+        # shapes into the divs of leaf parts in the output
         def get_parent_key(elem):
             parent = elem.getparent()
             if parent is not None and parent.attrib.has_key('class'):
@@ -213,49 +432,66 @@ class AnimationManager(object):
 
 
         structure_table = {}
-        
-        if mcname is None:
-            root_elem = root
-        else:
-            r = root.xpath('//part[@name="%s"]'%mcname)
-            if r is None:
-                root_elem = root
-            else:
-                root_elem = r[0]
-        for elem in root.xpath('//part'):
-            if 'key' in elem.attrib:
-                key          = elem.attrib['key']
-                objId        = LUtil.objectID_from_key(key)
-                depth        = elem.attrib['depth']
-                hasClipDepth = 'clipDepth' in elem.attrib
-                name         = elem.attrib['name'] if 'name' in elem.attrib else None
-                ctf          = json.loads(elem.attrib['ctf'])
-
-                if len(ctf) > 1:
-                    ctfsArray.append({key:ctf})
-
-                key_depth = LUtil.make_key_string(objId, prefix=key_prefix, suffix=depth)
-
-                structure_table[key_depth] = SvgTransform(elem.attrib)
-
-                update_elem(elem, key_depth, name, hasClipDepth)
-
-                k = objId[3:]
-                if (len(elem) == 0) and (k in parser_shapes):
-                    shape_key  = LUtil.make_key_string(objId, prefix=key_prefix, suffix='shape')
-                    parent_key = get_parent_key(elem)
-
-                    childdiv = etree.Element('div')
-                    childdiv.set('class', shape_key)
-
-                    structure_table[shape_key] = SvgTransform(childdiv.attrib)
+        # svg of shapes drawn without color transforms by shape name
+        rendered = {}
+
+        # with use_symbols, those shapes are put once in a hidden svg
+        symbols = etree.Element('svg', nsmap=Parser.NAMESPACES)
+        symbols.set('width', '0')
+        symbols.set('height', '0')
+        symbols.set('style', 'position:absolute;')
+        symbol_defs = etree.SubElement(symbols, 'defs')
+
+        for elem, key, depth, hasClipDepth, name, ctf, transform, is_leaf, in_output in parts:
+            objId = LUtil.objectID_from_key(key)
+
+            if len(ctf) > 1:
+                ctfsArray.append({key:ctf})
+
+            key_depth = LUtil.make_key_string(objId, prefix=key_prefix, suffix=depth)
+
+            # ancestors of the output only pass on their color transforms
+            if in_output:
+                structure_table[key_depth] = transform
+
+            update_elem(elem, key_depth, name, hasClipDepth)
+
+            k = objId[3:]
+            if in_output and is_leaf and (k in parser_shapes):
+                shape_key  = LUtil.make_key_string(objId, prefix=key_prefix, suffix='shape')
+                parent_key = get_parent_key(elem)
+
+                childdiv = etree.Element('div')
+                childdiv.set('class', shape_key)
+
+                structure_table[shape_key] = SvgTransform(childdiv.attrib)
+
+                name = getattr(parser_shapes[k], 'name', None)
+                if len(ctfsArray) > 0 or name is None:
+                    svgelem = Parser.str_shape_as_svg(parser_shapes[k], ctfsArray, parent_key)
+                elif use_symbols:
+                    symbol_id = 'shape' + name
+                    if name not in rendered:
+                        defelems, symbol = Parser.make_shape_symbol(parser_shapes[k], symbol_id)
+                        symbol_defs.extend(defelems)
+                        symbols.append(symbol)
+                        rendered[name] = symbol
+                    svgelem = Parser.str_shape_as_use(parser_shapes[k], symbol_id)
+                elif name in rendered:
+                    svgelem = deepcopy(rendered[name])
+                else:
+                    svgelem = Parser.str_shape_as_svg(parser_shapes[k], ctfsArray, parent_key)
+                    rendered[name] = svgelem
+                childdiv.append(svgelem)
+                elem.append(childdiv)
 
-                    svgelem  = Parser.str_shape_as_svg(parser_shapes[k], ctfsArray, parent_key)
-                    childdiv.append(svgelem)
-                    elem.append(childdiv)
+        return structure_table, symbols
 
+    def _make_structure_tree(self, root_elem, symbols):
         structure_tree = deepcopy(root_elem)
-        return structure_table, structure_tree
+        if len(symbols) > 1:
+            structure_tree.insert(0, symbols)
+        return structure_tree
 
     def _parse_xml(self, filepath):
         with open(filepath, 'r') as f:
@@ -276,6 +512,182 @@ class AnimationManager(object):
         result.extend(list(anim_buffer))
         return result
 
+    def _remove_linear_keyframes(self, anim_elements, tolerance):
+        # keeps the ends of the longest runs which are straight lines
+        if len(anim_elements) < 3:
+            return list(anim_elements)
+
+        result = [anim_elements[0]]
+        start = 0
+        while start < len(anim_elements) - 1:
+            start = self._get_linear_end(anim_elements, start, tolerance)
+            result.append(anim_elements[start])
+        return result
+
+    def _get_linear_end(self, anim_elements, start, tolerance):
+        end = start + 1
+        while end < len(anim_elements) - 1:
+            for middle in xrange(start + 1, end + 1):
+                if not self._is_interpolated(anim_elements[start], anim_elements[middle], anim_elements[end + 1], tolerance):
+                    return end
+            end += 1
+        return end
+
+    def _fit_timing_functions(self, anim_elements, tolerance):
+        """drops keyframes which follow a straight line or an eased curve from
+        the keyframe before them. returns the keyframes kept, and the
+        cubic-bezier parameters of the eased ones by the percent they start
+        from"""
+        if len(anim_elements) < 3:
+            return list(anim_elements), {}
+
+        result = [anim_elements[0]]
+        timings = {}
+        start = 0
+        last = len(anim_elements) - 1
+        while start < last:
+            end = self._get_linear_end(anim_elements, start, tolerance)
+
+            # an eased run ends where the next tween starts, so longer runs
+            # are tried by doubling and then bisecting. runs which do not
+            # move one way from their start are not fitted at all
+            limit = min(start + self.MAX_EASED_KEYFRAMES - 1, last)
+            good, bad, timing = end, limit + 1, None
+            if good + 1 < bad and self._get_progress(anim_elements[start:start + 4], tolerance) is None:
+                bad = good + 1
+            while good + 1 < bad:
+                if bad > limit:
+                    candidate = min(start + max(2 * (good - start), 3), limit)
+                else:
+                    candidate = (good + bad) // 2
+                fit = self._fit_easing(anim_elements[start:candidate + 1], tolerance)
+                if fit is None:
+                    bad = candidate
+                else:
+                    good, timing = candidate, fit
+
+            if timing is not None:
+                timings[anim_elements[start][0]] = timing
+                end = good
+            result.append(anim_elements[end])
+            start = end
+        return result, timings
+
+    def _get_progress(self, anim_elements, tolerance):
+        # (time, progress) of the keyframes between the first and the last,
+        # or None when they do not move one way from one to the other
+        (p0, t0), (p1, t1) = anim_elements[0], anim_elements[-1]
+        if len(anim_elements) < 4 or any(t.visible != t0.visible for p, t in anim_elements):
+            return None
+        if any(t.wx != 0 or t.wy != 0 for p, t in anim_elements):
+            if len(set((t.sx, t.wx, t.wy, t.sy) for p, t in anim_elements)) > 1:
+                return None
+
+        v0, v1 = t0.get_values(), t1.get_values()
+        # the progress is read from the value which changes the most
+        limits = [tolerance + precision for precision in SvgTransform.PRECISION]
+        i = max(xrange(len(v0)), key=lambda i: abs(v1[i] - v0[i]) / limits[i])
+        if abs(v1[i] - v0[i]) <= limits[i]:
+            return None
+        points = [((p - p0) / (p1 - p0), (t.get_values()[i] - v0[i]) / (v1[i] - v0[i])) for p, t in anim_elements[1:-1]]
+        progress = [0.0] + [y for x, y in points] + [1.0]
+        eps = limits[i] / abs(v1[i] - v0[i])
+        if any(b < a - eps for a, b in zip(progress, progress[1:])):
+            return None
+        return points
+
+    def _fit_easing(self, anim_elements, tolerance):
+        # a cubic-bezier timing function from the first keyframe to the last,
+        # or None when the ones between them do not follow one within tolerance
+        points = self._get_progress(anim_elements, tolerance)
+        if points is None:
+            return None
+
+        (p0, t0), (p1, t1) = anim_elements[0], anim_elements[-1]
+        v0, v1 = t0.get_values(), t1.get_values()
+        limits = [tolerance + precision for precision in SvgTransform.PRECISION]
+        x1, y1, x2, y2 = self._fit_cubic_bezier(points)
+        for p, t in anim_elements[1:-1]:
+            y = self._cubic_bezier(x1, y1, x2, y2, (p - p0) / (p1 - p0))
+            if any(abs(a + (b - a) * y - v) > limit for a, b, v, limit in zip(v0, v1, t.get_values(), limits)):
+                return None
+        return (x1, y1, x2, y2)
+
+    def _fit_cubic_bezier(self, points, step=0.1, precision=0.001):
+        # searches x1, x2 on a grid, then on finer ones around the best, and
+        # takes y1, y2 from least squares, which are linear in them
+        def fit(x1, x2):
+            rows = []
+            for x, y in points:
+                s = self._solve_bezier(x1, x2, x)
+                rows.append((3 * (1 - s) * (1 - s) * s, 3 * (1 - s) * s * s, y - s * s * s))
+            aa = sum(a * a for a, b, r in rows)
+            ab = sum(a * b for a, b, r in rows)
+            bb = sum(b * b for a, b, r in rows)
+            ar = sum(a * r for a, b, r in rows)
+            br = sum(b * r for a, b, r in rows)
+            det = aa * bb - ab * ab
+            if abs(det) < 1e-12:
+                return None
+            y1 = round((ar * bb - br * ab) / det, 4)
+            y2 = round((aa * br - ab * ar) / det, 4)
+            error = max(abs(a * y1 + b * y2 - r) for a, b, r in rows)
+            return error, (x1, y1, x2, y2)
+
+        def search(x1s, x2s):
+            fits = [fit(x1, x2) for x1 in x1s for x2 in x2s]
+            return min([f for f in fits if f is not None] or [(None, (0.0, 0.0, 1.0, 1.0))])
+
+        grid = [i * step for i in xrange(int(round(1 / step)) + 1)]
+        error, (x1, y1, x2, y2) = search(grid, grid)
+        while step > precision:
+            step /= 4
+            around = [d * step for d in xrange(-2, 3)]
+            error, (x1, y1, x2, y2) = search([round(min(max(x1 + d, 0.0), 1.0), 4) for d in around],
+                                             [round(min(max(x2 + d, 0.0), 1.0), 4) for d in around])
+        return x1, y1, x2, y2
+
+    def _solve_bezier(self, x1, x2, x, eps=1e-7):
+        # the parameter of the curve at which its time is x, by newton's
+        # method as browsers do, falling back to bisection
+        s = x
+        for i in xrange(8):
+            error = 3 * (1 - s) * (1 - s) * s * x1 + 3 * (1 - s) * s * s * x2 + s * s * s - x
+            if abs(error) < eps and 0.0 <= s <= 1.0:
+                return s
+            slope = 3 * (1 - s) * (1 - s) * x1 + 6 * (1 - s) * s * (x2 - x1) + 3 * s * s * (1 - x2)
+            if abs(slope) < 1e-6:
+                break
+            s -= error / slope
+        low, high = 0.0, 1.0
+        s = x
+        while high - low > eps:
+            if 3 * (1 - s) * (1 - s) * s * x1 + 3 * (1 - s) * s * s * x2 + s * s * s < x:
+                low = s
+            else:
+                high = s
+            s = (low + high) / 2
+        return s
+
+    def _cubic_bezier(self, x1, y1, x2, y2, x):
+        s = self._solve_bezier(x1, x2, x)
+        return 3 * (1 - s) * (1 - s) * s * y1 + 3 * (1 - s) * s * s * y2 + s * s * s
+
+    def _is_interpolated(self, start, middle, end, tolerance):
+        (p0, t0), (p1, t1), (p2, t2) = start, middle, end
+        # an invisible keyframe reads as opacity 0 but is written as a step
+        # by _interpolate_keyframes, so nothing is interpolated across it
+        if not (t0.visible == t1.visible == t2.visible):
+            return False
+        # browsers interpolate rotations and skews after decomposing the
+        # matrices, which is linear only when those stay the same
+        if any(t.wx != 0 or t.wy != 0 for t in (t0, t1, t2)):
+            if not ((t0.sx, t0.wx, t0.wy, t0.sy) == (t1.sx, t1.wx, t1.wy, t1.sy) == (t2.sx, t2.wx, t2.wy, t2.sy)):
+                return False
+        r = (p1 - p0) / (p2 - p0)
+        return all(abs(v0 + (v2 - v0) * r - v1) <= tolerance + precision
+                   for v0, v1, v2, precision in zip(t0.get_values(), t1.get_values(), t2.get_values(), SvgTransform.PRECISION))
+
     def _interpolate_keyframes(self, anim_elements, eps=0.0001):
         result = []
         old_transform = None
@@ -293,35 +705,151 @@ class AnimationManager(object):
             result.append((100.0, result[0][1])) # 100% animation
         return result
 
-    def _make_keyframes(self, anim_table, key_prefix='', sp='\n'):
+    def get_shared_animations(self, anim_table):
+        """(name of the keyframes, frames into them to start at) by key.
+        with share_keyframes, keys whose frames are the same loop started at
+        another frame share the keyframes of the first of them"""
+        if not self.share_keyframes:
+            return dict((key, (key, 0)) for key in anim_table)
+        shared = {}
+        first_keys = {}
+        frame_ids = {}
+        for key in sorted(anim_table.keys()):
+            frames = [frame_ids.setdefault(frame, len(frame_ids)) for frame in anim_table[key]]
+            rotation = self._get_least_rotation(frames)
+            first_key, first_rotation = first_keys.setdefault(tuple(frames[rotation:] + frames[:rotation]), (key, rotation))
+            shared[key] = (first_key, (first_rotation - rotation) % len(frames) if frames else 0)
+        return shared
+
+    def get_animation_names(self, anim_table):
+        """names of the keyframes by key"""
+        return dict((key, name) for key, (name, offset) in self.get_shared_animations(anim_table).iteritems())
+
+    def _get_least_rotation(self, seq):
+        # start of the lexicographically least rotation, by booth's algorithm
+        seq = seq + seq
+        failure = [-1] * len(seq)
+        k = 0
+        for j in xrange(1, len(seq)):
+            i = failure[j - k - 1]
+            while i != -1 and seq[j] != seq[k + i + 1]:
+                if seq[j] < seq[k + i + 1]:
+                    k = j - i - 1
+                i = failure[i]
+            if seq[j] != seq[k + i + 1]:
+                if seq[j] < seq[k]:
+                    k = j
+                failure[j - k] = -1
+            else:
+                failure[j - k] = i + 1
+        return k
+
+    def _make_keyframes(self, anim_table, key_prefix='', sp='\n', shared=None):
+        if shared is None:
+            shared = self.get_shared_animations(anim_table)
         keyframes = []
         for key, value in anim_table.iteritems():
+            if shared[key][0] != key:
+                continue
             anim_length = len(value)
             anim_elements = [((float(i*100)/float(anim_length)), a) for i,a in enumerate(value)]
-            anim_list = ['%f%% { %s %s }' % (percent, a.write_webkit_transform(), a.write_visible()) for percent, a in self._interpolate_keyframes(self._remove_deplicated_keyframes(anim_elements))]
+            anim_elements = self._remove_deplicated_keyframes(anim_elements)
+            timings = {}
+            if self.keyframe_tolerance is not None:
+                if self.fit_easing:
+                    anim_elements, timings = self._fit_timing_functions(anim_elements, self.keyframe_tolerance)
+                else:
+                    anim_elements = self._remove_linear_keyframes(anim_elements, self.keyframe_tolerance)
+            if self.minify:
+                matrix_precision, translation_precision, percent_precision = self.precision
+                anim_list = ['%s%%{-webkit-transform:%s;opacity:%s%s}' % (LUtil.shortest_number(percent, percent_precision),
+                                                                          a.write_short_matrix(matrix_precision, translation_precision),
+                                                                          LUtil.shortest_number(a.get_opacity(), matrix_precision),
+                                                                          ';-webkit-animation-timing-function:cubic-bezier(%s)' % ','.join([LUtil.shortest_number(v, 4) for v in timings[percent]]) if percent in timings else '')
+                             for percent, a in self._interpolate_keyframes(anim_elements, 0.1 ** percent_precision)]
+                keyframes.append('@-webkit-keyframes %s{%s}' % (self.get_name(key), ''.join(anim_list)))
+                continue
+            anim_list = ['%f%% { %s %s%s }' % (percent, a.write_webkit_transform(), a.write_visible(),
+                                               ' -webkit-animation-timing-function: cubic-bezier(%.4f,%.4f,%.4f,%.4f);' % timings[percent] if percent in timings else '')
+                         for percent, a in self._interpolate_keyframes(anim_elements)]
             anim = sp.join(anim_list)
-            keyframes.append(sp.join(['@-webkit-keyframes %s {'%(key), anim, '}']))
+            keyframes.append(sp.join(['@-webkit-keyframes %s {'%(self.get_name(key)), anim, '}']))
+        if self.minify:
+            sp = ''
         return (sp+sp).join(keyframes)
 
-    def _make_transform(self, structure_table, shape_table, anim_table, key_prefix='', has_anim_name=True, sp='\n'):
+    def _make_transform(self, structure_table, shape_table, anim_table, key_prefix='', has_anim_name=True, sp='\n', shared=None, base_selector=None):
+        if shared is None:
+            shared = self.get_shared_animations(anim_table)
 
         result = []
         for key, structure in structure_table.iteritems():
-            elem = CssElement(title='.%s'%key)
+            elem = CssElement(title='.%s'%self.get_name(key), minify=self.minify)
             transform = ('-webkit-transform', structure.write_matrix())
 
             if key in anim_table:
                 anim_length = len(anim_table[key])
-                elem.add_anims_element(key, anim_length, has_anim_name)
+                name, offset = shared[key]
+                elem.add_anims_element(self.get_name(name), anim_length, has_anim_name, offset)
 
             shape_key = LUtil.objectID_from_key(key)
             if key.endswith('shape') and shape_key in shape_table:
                 elem.add_shape_element(shape_key, shape_table)
 
-            elem.add_origin_element(structure.write_matrix())
-            result.append(str(elem))
+            if self.minify:
+                elem.add_origin_element(structure.write_short_matrix(*self.precision[:2]))
+            else:
+                elem.add_origin_element(structure.write_matrix())
+            result.append(elem)
+
+        if self.group_rules:
+            result = self._group_rules(result, base_selector)
+        if self.minify:
+            sp = ''
+        return (sp+sp).join([str(elem) for elem in result])
+
+    def _group_rules(self, elems, base_selector=None):
+        """rules with the same declarations joined into one. with
+        base_selector, the declarations every div gets the same are moved
+        to a rule of it"""
+        # the base selector of an mcname, '.key div', is more specific than
+        # the '.key' of each rule, so it would override them. a declaration
+        # is only moved when every rule has it the same, and then removed
+        # from all of them, so no rule is left with a property of the base
+        result = []
+        if base_selector is not None:
+            animated = [elem for elem in elems if '-webkit-animation-duration' in elem]
+            base = CssElement(title=base_selector, minify=self.minify)
+            for name, value in set(item for elem in elems for item in elem.iteritems()):
+                targets = animated if name in self.ANIMATION_PROPERTIES else elems
+                if all(elem.get(name) == value for elem in targets):
+                    base[name] = value
+            if len(base) > 0:
+                for elem in elems:
+                    for name, value in base.iteritems():
+                        if elem.get(name) == value:
+                            del elem[name]
+                result.append(base)
+
+        groups = {}
+        for elem in elems:
+            if len(elem) == 0:
+                continue
+            declarations = frozenset(elem.iteritems())
+            group = groups.get(declarations)
+            if group is None:
+                groups[declarations] = elem
+                result.append(elem)
+            else:
+                group.title = '%s%s%s' % (group.title, ',' if self.minify else ', ', elem.title)
+        return result
 
-        return (sp+sp).join(result)
+    def get_base_selector(self, structure_tree):
+        """selector of every div written for structure_tree"""
+        if structure_tree.tag == 'structure':
+            return 'structure div'
+        name = self.get_name(structure_tree.get('class'))
+        return '.%s%s.%s div' % (name, ',' if self.minify else ', ', name)
 
     def write_html(self, structure_tree, cssfilepath):
         template = '''<?xml version="1.0" encoding="utf-8" ?>
@@ -341,12 +869,24 @@ class AnimationManager(object):
         return html
 
     def write_div(self, structure_tree):
+        if self.class_names is not None:
+            structure_tree = deepcopy(structure_tree)
+            for elem in structure_tree.iter('div'):
+                if 'class' in elem.attrib:
+                    elem.set('class', self.get_name(elem.get('class')))
         html = "%s" % (etree.tostring(structure_tree, pretty_print=True))
         return html
 
-    def write_css(self, structure_table, shape_table, anim_table, key_prefix='', has_anim_name=True, sp='\n\n'):
-        elem = CssElement(title='div')
-        css = sp.join([self._make_keyframes(anim_table, key_prefix), self._make_transform(structure_table, shape_table, anim_table, key_prefix, has_anim_name)])
+    def write_css(self, structure_table, shape_table, anim_table, key_prefix='', has_anim_name=True, sp='\n\n', structure_tree=None):
+        base_selector = None
+        if structure_tree is not None:
+            base_selector = self.get_base_selector(structure_tree)
+        shared = self.get_shared_animations(anim_table)
+        if self.minify:
+            sp = ''
+        css = sp.join([self._make_keyframes(anim_table, key_prefix, shared=shared), self._make_transform(structure_table, shape_table, anim_table, key_prefix, has_anim_name, shared=shared, base_selector=base_selector)])
+        if self.minify:
+            return 'svg{display:block}' + css
         return 'svg { display:block; }\n' + css
 
     def _write(self, filepath, content):
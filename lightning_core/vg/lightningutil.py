@@ -62,6 +62,30 @@ class LUtil(object):
     def make_key_string(objectID, prefix='', suffix='', splitter=KEY_SPLITTER):
         return splitter.join([prefix, objectID, suffix])
 
+    @staticmethod
+    def shortest_number(v, precision):
+        """v at precision digits after the point, without the zeros and
+        points which are not needed"""
+        s = '%.*f' % (precision, v)
+        if '.' in s:
+            s = s.rstrip('0').rstrip('.')
+        if s.startswith('0.'):
+            return s[1:]
+        if s.startswith('-0.'):
+            return '-' + s[2:]
+        if s == '-0':
+            return '0'
+        return s
+
+    @staticmethod
+    def to_base36(number):
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+        result = digits[number % 36]
+        while number >= 36:
+            number //= 36
+            result = digits[number % 36] + result
+        return result
+
     @staticmethod
     def objectID_from_key(key, splitter=KEY_SPLITTER):
         elem = key.split(splitter)
@@ -27,9 +27,15 @@ import os
 import os.path
 import re
 import copy
+import hashlib
+import multiprocessing
+from collections import deque
+import simplejson as json
 
 from lightningutil import LUtil
 from swf import *
+from swfreader import SwfReader
+from shapecache import ShapeCache, VERSION
 
 try:
     from lxml import etree
@@ -44,11 +50,62 @@ logging.basicConfig(level=logging.DEBUG,
                     format='%(asctime)s %(levelname)s %(message)s',
                     datefmt='%Y/%m/%d %H:%M:%S')
 
+# the parser read by the processes of a ParserPool
+_pool_parser = None
+
+def _render_shape(symbol):
+    shape = _pool_parser.shapes[symbol]
+    return Parser.ShapeMaker.dumps(*Parser.ShapeMaker.make_shape(shape, [], ''))
+
+def _sprite_animations(key):
+    return _pool_parser._sprite_animations(_pool_parser.sprites[key])
+
+class ParserPool(object):
+    """processes forked with a parsed model, for work which only reads it.
+
+    tasks name the shapes and sprites by key, and results come back in
+    the order of the keys.
+    """
+
+    def __init__(self, parser, processes):
+        global _pool_parser
+        _pool_parser = parser
+        self.pool = multiprocessing.Pool(processes)
+
+    def map(self, func, keys):
+        return self.pool.map(func, keys)
+
+    def close(self):
+        global _pool_parser
+        self.pool.close()
+        self.pool.join()
+        _pool_parser = None
+
 class SvgBuilder(object):
 
-    def __init__(self, xmlfile, key_prefix='', scale_factor=1.0):
-        self.parser = Parser()
-        self.parser.parse(xmlfile, key_prefix, scale_factor=scale_factor)
+    DEPENDENCIES = "dependencies.json"
+
+    def __init__(self, xmlfile, key_prefix='', scale_factor=1.0, streaming=False, cache_dir=None, processes=None, twips=False, mcname=None):
+        self.key_prefix = key_prefix
+        self.mcname = mcname
+        cache = None
+        if cache_dir is not None:
+            cache = ShapeCache(cache_dir)
+        self.parser = Parser(cache, twips)
+        self.parser.parse(xmlfile, key_prefix, scale_factor=scale_factor, streaming=streaming)
+
+        # with several processes, shapes are rendered and animations are
+        # extracted on a pool as soon as the model is built, only for the
+        # part named mcname when it is given
+        self.animations = None
+        if processes is not None and processes > 1:
+            ids = self._get_ids(mcname)
+            pool = ParserPool(self.parser, processes)
+            try:
+                self.parser.render_shapes(pool, ids)
+                self.animations = self.parser.get_animations(pool, ids)
+            finally:
+                pool.close()
 
     def get_shapes_as_dict(self):
         return self.parser.shapes
@@ -99,6 +156,25 @@ class SvgBuilder(object):
     def get_animation(self):
         return self.parser.str_animation()
 
+    def get_animations(self, mcname=None):
+        # with mcname, only sprites placed under the named part are animated
+        if self.animations is not None and mcname == self.mcname:
+            return self.animations
+        return self.parser.get_animations(ids=self._get_ids(mcname))
+
+    def _get_ids(self, mcname):
+        # ids of the definitions placed under the part named mcname, None
+        # for all of them
+        if mcname is None:
+            return None
+        named = self.parser.tree.find(mcname)
+        if named is None:
+            return None
+        return set(LUtil.objectID_from_key(t.key)[3:] for t in named.iter())
+
+    def get_tree(self):
+        return self.parser.tree
+
     def get_structure(self):
         structure = etree.Element("structure")
 
@@ -113,23 +189,54 @@ class SvgBuilder(object):
             fp.write(svgstr)
 
     def save(self, outdirname):
-
+        # when outdirname has the output of an earlier save, shapes and
+        # sprite animations whose definitions are unchanged are kept, and
+        # the parts of sprites whose subtree is unchanged are spliced from
+        # the earlier structure
         if not os.path.exists(outdirname):
             os.makedirs(outdirname)
 
-        self._save_svgs(outdirname)
-        self._save_shapes(outdirname)
-        self._save_structure(outdirname)
-        self._save_animation(outdirname)
+        previous = self._load_dependencies(outdirname)
+        changed = None
+        if previous is not None:
+            changed = self.parser.get_changed(previous)
+            logging.debug("%d definitions changed" % len(changed))
+
+        files = self._save_svgs(outdirname, previous)
+        if changed is None or len(changed) > 0 or not self._has_outputs(outdirname):
+            self._save_shapes(outdirname)
+            self._save_structure(outdirname, changed)
+        animation_keys = self._save_animation(outdirname, previous)
+        self._save_dependencies(outdirname, files, animation_keys)
+
+    def _has_outputs(self, outdirname):
+        return all(os.path.exists(os.path.join(outdirname, filename)) for filename in ("shapes.xml", "structure.xml"))
+
+    def _save_svgs(self, outdirname, previous=None):
+        # save shapes as svg files, identical shapes share one file
+        files = {}
+        old_files = {}
+        if previous is not None:
+            old_files = previous['files']
 
-    def _save_svgs(self, outdirname):
-        # save shapes as svg files
         for k, v in self.parser.shapes.iteritems():
+            if v.name in files:
+                continue
+            files[v.name] = v.symbol
             #svg_path = os.path.join(outdirname, "obj%s_%s.svg" % (k, v.name))
             svg_path = os.path.join(outdirname, "%s.svg" % v.name)
+            # the ids in the file come from the symbol which wrote it
+            if old_files.get(v.name) == v.symbol and os.path.exists(svg_path):
+                continue
             Parser.save_shape_as_svg(v, [], svg_path)
             logging.debug("Converted to %s" % svg_path)
 
+        for name in old_files:
+            svg_path = os.path.join(outdirname, "%s.svg" % name)
+            if name not in files and os.path.exists(svg_path):
+                os.remove(svg_path)
+        return files
+
     def _save_svg(self, outdirname):
 
         if not os.path.exists(outdirname):
@@ -149,18 +256,104 @@ class SvgBuilder(object):
         fp.close()
         logging.debug("Converted to %s" % shapes_path)
 
-    def _save_structure(self, outdirname):
+    def _save_structure(self, outdirname, changed=None):
+        # with changed, the parts of sprites which are not in it are taken
+        # from the structure written before
         structure_path = os.path.join(outdirname, "structure.xml")
+
+        reuse = {}
+        if changed is not None:
+            reuse = self._load_unchanged_parts(structure_path, changed)
+        structure = etree.Element("structure")
+        self.parser.add_tree(self.parser.tree, structure, reuse)
+
         with open(structure_path, "w") as fp:
-            fp.write(etree.tostring(self.get_structure(), pretty_print=True))
+            fp.write(etree.tostring(structure, pretty_print=True))
         logging.debug("Converted to " + structure_path)
 
-    def _save_animation(self, outdirname):
+    def _load_unchanged_parts(self, structure_path, changed):
+        try:
+            # without the indentation, so the spliced parts are indented again
+            root = etree.parse(structure_path, parser=etree.XMLParser(remove_blank_text=True))
+        except (IOError, etree.XMLSyntaxError):
+            return {}
+
+        reuse = {}
+        for e in root.iter("part"):
+            objectID = LUtil.objectID_from_key(e.get("key", ""))
+            if objectID.startswith("obj") and objectID[3:] not in changed:
+                reuse[e.get("key")] = e
+        return reuse
+
+    def _save_animation(self, outdirname, previous=None):
         animations_path = os.path.join(outdirname, "animation.xml")
+
+        reuse = {}
+        if previous is not None:
+            reuse = self._load_sprite_animations(animations_path, previous)
+        sprite_animations = self.parser.get_sprite_animations(reuse=reuse)
+        animations = self.parser.merge_animations(sprite_animations)
+
         with open(animations_path, "w") as fp:
-            fp.write(etree.tostring(self.get_animation(), pretty_print=True))
+            fp.write(etree.tostring(self.parser.str_animation(animations), pretty_print=True))
         logging.debug("Converted to " + animations_path)
 
+        # the key each animation is written with, None when an animation of
+        # another sprite took its place
+        written = set(id(a) for a in animations)
+        return dict((k, dict((symbol, a.key if id(a) in written else None) for symbol, a in result.iteritems()))
+                    for k, result in sprite_animations)
+
+    def _load_sprite_animations(self, animations_path, previous):
+        try:
+            root = etree.parse(animations_path, parser=etree.XMLParser(remove_blank_text=True))
+            elements = dict((e.get("key"), e) for e in root.iter("animation"))
+        except (IOError, etree.XMLSyntaxError):
+            return {}
+
+        reuse = {}
+        for k, v in self.parser.sprites.iteritems():
+            old = previous['sprites'].get(k)
+            if old is None or old['digest'] != v.get_digest() or 'animations' not in old:
+                continue
+            keys = old['animations']
+            if not all(key in elements for key in keys.itervalues()):
+                continue
+            # the elements are written again as they are
+            animations = {}
+            for symbol, key in keys.iteritems():
+                animation = Animation()
+                animation.key = key
+                animation.element = elements[key]
+                animations[symbol] = animation
+            reuse[k] = animations
+        return reuse
+
+    def _load_dependencies(self, outdirname):
+        # None unless outdirname has dependencies written with the same
+        # version and key prefix
+        try:
+            with open(os.path.join(outdirname, self.DEPENDENCIES)) as fp:
+                dependencies = json.load(fp)
+        except (IOError, ValueError):
+            return None
+        if dependencies.get('version') != VERSION or dependencies.get('key_prefix') != self.key_prefix:
+            return None
+        return dependencies
+
+    def _save_dependencies(self, outdirname, files, animation_keys):
+        dependencies = self.parser.get_dependencies()
+        dependencies['version'] = VERSION
+        dependencies['key_prefix'] = self.key_prefix
+        dependencies['files'] = files
+        for k, keys in animation_keys.iteritems():
+            dependencies['sprites'][k]['animations'] = keys
+
+        dependencies_path = os.path.join(outdirname, self.DEPENDENCIES)
+        with open(dependencies_path, "w") as fp:
+            json.dump(dependencies, fp, sort_keys=True)
+        logging.debug("Converted to " + dependencies_path)
+
 class Parser(object):
 
     NAMESPACES = {None: "http://www.w3.org/2000/svg",
@@ -171,10 +364,13 @@ class Parser(object):
     MATRIX_KEY = ('sx', 'wx', 'wy', 'sy', 'tx', 'ty')
     PLACE_KEY  = ('ctf', 'depth', 'clipDepth')
 
-    def __init__(self):
+    def __init__(self, cache=None, twips=False):
         self.shapes = {}
         self.sprites = {}
         self.places = {}
+        self.cache = cache
+        # shapes are drawn in integer twips, scaled to pixels by their viewBox
+        self.twips = twips
 
         self.tree = None
         logging.debug('log test: parser initialized')
@@ -221,7 +417,7 @@ class Parser(object):
             lineWidth = lineElm.get('width')
             if len(colorElms) > 0:
                 c = PUtil.convert_color_as_tuple(colorElms[0])
-                w = PUtil.get_pixel_vals(lineWidth)
+                w = self._get_coords(lineWidth)
                 colors.append(c)
                 widths.append(w)
         return colors, widths
@@ -237,10 +433,15 @@ class Parser(object):
             stops.append(stop)
 
         gtf = e.find('matrix/Transform')
-        linearGrad = LinearGradient(objectId, gtf, stops)
+        linearGrad = LinearGradient(objectId, gtf, stops, self.twips)
 
         return linearGrad
 
+    def _get_coords(self, *twips):
+        if self.twips:
+            return PUtil.get_twip_vals(*twips)
+        return PUtil.get_pixel_vals(*twips)
+
     def _proc_define_shape(self, e):
 
         objectID = e.get("objectID")
@@ -249,6 +450,11 @@ class Parser(object):
 
         shape = Shape()
         shape.symbol = "obj" + objectID
+        shape.twips = self.twips
+
+        if self.cache is not None:
+            shape.cache = self.cache
+            shape.digest = ShapeCache.digest(e)
 
         # width and height
         rect = e.xpath("./bounds/Rectangle")[0]
@@ -296,7 +502,7 @@ class Parser(object):
             for m in methods:
 
                 if m.tag == "ShapeSetup":
-                    x, y = PUtil.get_pixel_vals(m.get('x'), m.get('y'))
+                    x, y = self._get_coords(m.get('x'), m.get('y'))
 
                     fillStyle0 = m.get("fillStyle0")
                     fillStyle1 = m.get("fillStyle1")
@@ -321,13 +527,9 @@ class Parser(object):
                             cy = y
 
                         if not set([x, y]) == set([None]):
-                            edge.add({'type': 'S',
-                                      'x': x, 'y': y,
-                                      'fl': fillLeft, 'fr': fillRight, 'ln': lineCenter})
+                            edge.add_setup(x, y, fillLeft, fillRight, lineCenter)
                         else:
-                            edge.add({'type': 'S',
-                                      'x': cx, 'y': cy,
-                                      'fl': fillLeft, 'fr': fillRight, 'ln': lineCenter})
+                            edge.add_setup(cx, cy, fillLeft, fillRight, lineCenter)
                     # lineStyles
                     if len(nextLineElms) > 0:
                         colors, widths = self._get_styles_lines(nextLineElms)
@@ -338,24 +540,22 @@ class Parser(object):
 
 
                 if m.tag == "LineTo" and edge is not None:
-                    x, y = PUtil.get_pixel_vals(m.get('x'), m.get('y'))
+                    x, y = self._get_coords(m.get('x'), m.get('y'))
 
                     if x is not None and y is not None:
                         cx += x
                         cy += y
-                        edge.add({'type': 'L',
-                                  'x': x, 'y': y})
+                        edge.add_line_to(x, y)
 
                 if m.tag == "CurveTo" and edge is not None:
-                    x1, y1, x2, y2 = PUtil.get_pixel_vals(m.get("x1"), m.get("y1"), m.get("x2"), m.get("y2")) 
+                    x1, y1, x2, y2 = self._get_coords(m.get("x1"), m.get("y1"), m.get("x2"), m.get("y2"))
                     if not set([x1, x2, y1, y2]) == set([None]):
                         cx += x1 + x2
                         cy += y1 + y2
-                        edge.add({'type': 'C',
-                                  'x1': x1,
-                                  'y1': y1,
-                                  'x2': x2,
-                                  'y2': y2})
+                        edge.add_curve_to(x1, y1, x2, y2)
+
+        for edge in shape.edges:
+            edge.build_index()
 
         self.shapes[objectID] = shape
 
@@ -460,31 +660,82 @@ class Parser(object):
         tree = etree.fromstring(filestr)
         self.__parse(tree)
 
-    def parse(self, xmlfile, key_prefix='', scale_factor=1.0):
-        tree = etree.parse(xmlfile, parser=etree.XMLParser())
-        self.__parse(tree, key_prefix, scale_factor)
-        if xmlfile is not None:
+    def parse(self, xmlfile, key_prefix='', scale_factor=1.0, streaming=False):
+        if SwfReader.is_swf(xmlfile):
+            self.parse_swf(xmlfile, key_prefix, scale_factor)
+        elif streaming:
+            self.__iterparse(xmlfile, key_prefix, scale_factor)
+        else:
+            tree = etree.parse(xmlfile, parser=etree.XMLParser())
+            self.__parse(tree, key_prefix, scale_factor)
+        if hasattr(xmlfile, 'close'):
             xmlfile.close()
 
+    def parse_swf(self, swffile, key_prefix='', scale_factor=1.0):
+        reader = SwfReader(swffile)
+        self.size = [reader.size]
+
+        for e in reader.tags():
+            self._proc_tag(e, key_prefix)
+
+        self._finish_parse(scale_factor)
+
+    DEFINE_SHAPE_RE = re.compile('DefineShape[2-5]?')
+
+    def _proc_tag(self, e, key_prefix=''):
+        if self.DEFINE_SHAPE_RE.match(e.tag) is not None:
+            self._proc_define_shape(e)
+
+        if e.tag == 'DefineSprite':
+            self._proc_define_sprite(e, key_prefix)
+
+        if e.tag == "PlaceObject2":
+            self._proc_place_object(e)
+
+    def _finish_parse(self, scale_factor=1.0):
+        for k, v in self.shapes.iteritems():
+            v.name = v.generate_name()
+
+        self._build_tree(scale_factor)
+
     def __parse(self, tree, key_prefix='', scale_factor=1.0):
         self.size = tree.xpath("//swf/Header/size/Rectangle")
 
         elms = tree.xpath("//swf/Header/tags/*")
 
-        defineRe = re.compile('DefineShape[2-5]?')
         for e in elms:
-            if defineRe.match(e.tag) is not None:
-                self._proc_define_shape(e)
+            self._proc_tag(e, key_prefix)
 
-            if e.tag == 'DefineSprite':
-                self._proc_define_sprite(e, key_prefix)
+        self._finish_parse(scale_factor)
 
-            if e.tag == "PlaceObject2":
-                self._proc_place_object(e)
-        for k, v in self.shapes.iteritems():
-            v.name = v.generate_name()
+    def __iterparse(self, xmlfile, key_prefix='', scale_factor=1.0):
+        # hand every top level tag to _proc_tag as soon as it is complete,
+        # then drop it with its preceding siblings so that memory usage
+        # depends on the largest definition, not on the document size.
+        self.size = []
 
-        self._build_tree(scale_factor)
+        for event, e in etree.iterparse(xmlfile, events=('end',)):
+            parent = e.getparent()
+            if parent is None:
+                continue
+
+            if parent.tag == 'tags' and self._is_header_child(parent):
+                self._proc_tag(e, key_prefix)
+                e.clear()
+                while e.getprevious() is not None:
+                    del parent[0]
+
+            elif e.tag == 'Rectangle' and parent.tag == 'size' and self._is_header_child(parent):
+                self.size = [copy.deepcopy(e)]
+
+        self._finish_parse(scale_factor)
+
+    def _is_header_child(self, e):
+        header = e.getparent()
+        if header is None or header.tag != 'Header':
+            return False
+        swf = header.getparent()
+        return swf is not None and swf.tag == 'swf'
 
     def make_svg(self):
 
@@ -510,7 +761,7 @@ class Parser(object):
 
             for tr in trees:
                 if len(tr.children) == 0:
-                    shape = self._search_shape(tr.key)
+                    shape = self._search_shape(LUtil.objectID_from_key(tr.key))
 
                     l = shape.left
                     t = shape.top
@@ -594,12 +845,20 @@ class Parser(object):
 
             return left, top, right - left, bottom - top
 
+        # shapes drawn without color transforms are rendered once by name.
+        # a shape placed more than once is moved into defs and used
+        shared = {}
+
         def build_element(tree, element, ctf):
             part = etree.Element("g")
 
             part.set("id", tree.key)
 
-            transformVal = "matrix(%.2f %.2f %.2f %.2f %.4f %.4f)" % tree.get_matrix()
+            if self.twips:
+                transformVal = "matrix(%.2f %.2f %.2f %.2f %s %s)" % (tree.sx, tree.wx, tree.wy, tree.sy,
+                                                                     LUtil.shortest_number(tree.tx, 0), LUtil.shortest_number(tree.ty, 0))
+            else:
+                transformVal = "matrix(%.2f %.2f %.2f %.2f %.4f %.4f)" % tree.get_matrix()
 
             if tree.clipDepth is not None:
                 part.set("style", "display:none")
@@ -615,10 +874,29 @@ class Parser(object):
                 for c in tree.children:
                     build_element(c, part, ctf)
             else:
-                shape = self._search_shape(tree.key)
-                if shape is not None:
+                shape = self._search_shape(LUtil.objectID_from_key(tree.key))
+                if shape is None:
+                    pass
+                elif len(ctf) > 0:
+                    shape_group = Parser.ShapeMaker.make_shape_element(shape, ctf, tree.parent.key)
+                    part.append(shape_group)
+                elif shape.name in shared:
+                    shared[shape.name].append(part)
+                else:
                     shape_group = Parser.ShapeMaker.make_shape_element(shape, ctf, tree.parent.key)
                     part.append(shape_group)
+                    shared[shape.name] = [part]
+
+        def use_shared(defs):
+            for name, parts in sorted(shared.iteritems()):
+                if len(parts) < 2:
+                    continue
+                shape_group = parts[0][0]
+                shape_group.set("id", "shape" + name)
+                defs.append(shape_group)
+                for part in parts:
+                    use = etree.SubElement(part, "use")
+                    use.set(Parser.XLINK + "href", "#shape" + name)
 
         abs_left, abs_top, abs_width, abs_height = get_rect_all()
         left, top, width,  height = get_rect_all(False)
@@ -626,20 +904,26 @@ class Parser(object):
         svg = etree.Element("svg", nsmap=Parser.NAMESPACES)
         svg.set("version", "1.1")
 
-        svg.set("viewBox",
-                "%.4f %.4f %.4f %.4f" % tuple(PUtil.get_pixel_vals(abs_left, abs_top, abs_width, abs_height)))
+        if self.twips:
+            svg.set("viewBox", "%d %d %d %d" % (abs_left, abs_top, abs_width, abs_height))
+        else:
+            svg.set("viewBox",
+                    "%.4f %.4f %.4f %.4f" % tuple(PUtil.get_pixel_vals(abs_left, abs_top, abs_width, abs_height)))
         defs = etree.Element("defs")
 
         dummy_shape = Shape()
         dummy_shape.symbol = ""
+        dummy_shape.twips = self.twips
         for key, shape in self.shapes.iteritems():
             for defelem in shape.defs:
                 defs.append(defelem)
             dummy_shape.edges.extend(shape.edges)
+            dummy_shape.defs.extend(shape.defs)
 
         svg.append(defs)
 
         build_element(self.tree, svg, [])
+        use_shared(defs)
 
         name = dummy_shape.generate_name()
 
@@ -654,18 +938,44 @@ class Parser(object):
         fp.close()
 
     @classmethod
-    def str_shape_as_svg(cls, shape, ctf=[], parent_key=''):
+    def _make_shape_svg(cls, shape):
         svg = etree.Element("svg", nsmap=Parser.NAMESPACES)
         svg.set("version", "1.1")
-        svg.set("viewBox",
-                "%4f %4f %4f %4f" % tuple(PUtil.get_pixel_vals(shape.left, shape.top, shape.width, shape.height)))
+        if shape.twips:
+            svg.set("viewBox", "%d %d %d %d" % (shape.left, shape.top, shape.width, shape.height))
+        else:
+            svg.set("viewBox",
+                    "%4f %4f %4f %4f" % tuple(PUtil.get_pixel_vals(shape.left, shape.top, shape.width, shape.height)))
+        return svg
+
+    @classmethod
+    def str_shape_as_use(cls, shape, symbol_id):
+        svg = cls._make_shape_svg(shape)
+        use = etree.SubElement(svg, "use")
+        use.set(Parser.XLINK + "href", "#" + symbol_id)
+        return svg
+
+    @classmethod
+    def make_shape_symbol(cls, shape, symbol_id):
+        # the symbol draws the shape without color transforms in the
+        # coordinates of the svg made by str_shape_as_use
+        defelems, group = cls.ShapeMaker.make_shape(shape, [], '')
+        symbol = etree.Element("symbol")
+        symbol.set("id", symbol_id)
+        symbol.set("overflow", "visible")
+        symbol.append(group)
+        return defelems, symbol
+
+    @classmethod
+    def str_shape_as_svg(cls, shape, ctf=[], parent_key=''):
+        svg = cls._make_shape_svg(shape)
+        defelems, group = cls.ShapeMaker.make_shape(shape, ctf, parent_key)
+
         defs = etree.Element("defs")
-        for defelem in shape.defs:
+        for defelem in defelems:
             defs.append(defelem)
         svg.append(defs)
 
-        group = cls.ShapeMaker.make_shape_element(shape, ctf, parent_key)
-
         svg.append(group)
         return svg
 
@@ -714,7 +1024,10 @@ class Parser(object):
 
         self.tree = root
 
-    def add_tree(self, tree, element):
+    def add_tree(self, tree, element, reuse={}):
+        """adds the parts of tree to element. a part in reuse, by key, whose
+        descendants have the keys of those of tree gives its descendants
+        instead of them"""
         part = etree.Element("part")
 
         part.set("key", tree.key)
@@ -735,8 +1048,13 @@ class Parser(object):
 
         element.append(part)
 
+        old = reuse.get(tree.key)
+        if old is not None and [t.key for t in tree.iter()] == [e.get("key") for e in old.iter("part")]:
+            part.extend(copy.deepcopy(c) for c in old)
+            return
+
         for c in tree.children:
-            self.add_tree(c, part)
+            self.add_tree(c, part, reuse)
 
     def _set_vals(self, e, **keyvalue):
         [e.set(k, str(v)) for k,v in keyvalue.iteritems() if v is not None]
@@ -758,26 +1076,105 @@ class Parser(object):
 
         return keys
         
-    def str_animation(self):
-        # build animation
-        animations = {}
+    def render_shapes(self, pool, ids=None):
+        """renders the shapes without color transforms on pool, or those of
+        them in ids"""
+        keys = sorted(k for k in self.shapes.iterkeys() if ids is None or k in ids)
+        for k, data in zip(keys, pool.map(_render_shape, keys)):
+            self.shapes[k].rendered = data
+
+    def get_sprite_animations(self, pool=None, reuse={}, ids=None):
+        """(sprite key, animations by symbol) for the animated sprites,
+        or for those of them in ids.
+
+        animations of the sprites in reuse are taken from it. with a pool,
+        the others are each done in a process of the pool, and come back
+        in the same order as without it.
+        """
+        keys = [k for k, v in self.sprites.iteritems() if len(v.frames) > 1 and (ids is None or k in ids)]
+        todo = [k for k in keys if k not in reuse]
+        if pool is None:
+            results = [self._sprite_animations(self.sprites[k]) for k in todo]
+        else:
+            results = pool.map(_sprite_animations, todo)
+        done = dict(zip(todo, results))
 
-        for k, v in self.sprites.iteritems():
+        return [(k, reuse[k] if k in reuse else done[k]) for k in keys]
 
-            if len(v.frames) > 1:
+    def merge_animations(self, sprite_animations):
+        """animations of get_sprite_animations, with the keys of the parts they move"""
+        animations = {}
+        for k, result in sprite_animations:
+            animations.update(result)
 
-                all_symbols = []
+        tree_keys = self._make_keys_from_tree(self.tree)
 
-                for f in v.frames:
-                    for p in f.places:
-                        for s in p['symbols']:
-                            if s not in all_symbols:
-                                all_symbols.append(s)
+        result = []
+        for key, animation in animations.iteritems():
 
-                animations.update(self._str_animation(all_symbols, v))
+            animation.key = key
+
+            for k in tree_keys:
+                if k[:-2] == key:
+                    animation.key = k
+                    break
 
+            result.append(animation)
+        return result
+
+    def get_animations(self, pool=None, ids=None):
+        """animations of the sprites, with the keys of the parts they move"""
+        return self.merge_animations(self.get_sprite_animations(pool, ids=ids))
+
+    def get_root_digest(self):
+        """content hash of the objects placed at the top and the scale"""
+        m = hashlib.sha1()
+        m.update(repr((self.tree.sx, self.tree.sy)))
+        for k, v in sorted(self.places.iteritems()):
+            m.update(repr((k, sorted(v.items().iteritems()))))
+        return m.hexdigest()
+
+    def get_dependencies(self):
+        """content hashes of the definitions and the ids each sprite places"""
+        shapes = dict((k, v.name) for k, v in self.shapes.iteritems())
+        sprites = dict((k, {'digest': v.get_digest(), 'places': v.get_placed_ids()})
+                       for k, v in self.sprites.iteritems())
+        return {'root': self.get_root_digest(), 'shapes': shapes, 'sprites': sprites}
+
+    def get_changed(self, dependencies):
+        """ids of the definitions which differ from dependencies, with the
+        sprites which place them directly or not. 'root' when the objects
+        placed at the top differ"""
+        current = self.get_dependencies()
+        changed = set()
+        if dependencies.get('root') != current['root']:
+            changed.add('root')
+        for k, name in current['shapes'].iteritems():
+            if dependencies['shapes'].get(k) != name:
+                changed.add(k)
+        for k, sprite in current['sprites'].iteritems():
+            previous = dependencies['sprites'].get(k)
+            if previous is None or previous['digest'] != sprite['digest']:
+                changed.add(k)
+
+        # a sprite changes with what it places
+        placed_by = {}
+        for k, sprite in current['sprites'].iteritems():
+            for placed in sprite['places']:
+                placed_by.setdefault(placed, []).append(k)
+        stack = list(changed)
+        while len(stack) > 0:
+            for k in placed_by.get(stack.pop(), []):
+                if k not in changed:
+                    changed.add(k)
+                    stack.append(k)
+        return changed
 
+    def str_animation(self, animations=None):
         # save animation file
+        if animations is None:
+            animations = self.get_animations()
+
         animation_set_element = etree.Element("animation_set")
 
         animation_sequence_element = etree.Element("animation_sequence")
@@ -785,22 +1182,17 @@ class Parser(object):
 
         animation_sequence_element.set("index", "1")
 
-        tree_keys = self._make_keys_from_tree(self.tree)
-        
-        for key, animation in animations.iteritems():
+        for animation in animations:
 
-            animation_element = etree.Element("animation")
-
-            animation_key = key
-            
-            elms = key.split('-')
+            if animation.element is not None:
+                animation_element = copy.deepcopy(animation.element)
+                animation_element.set("key", animation.key)
+                animation_sequence_element.append(animation_element)
+                continue
 
-            for k in tree_keys:
-                if k[:-2] == key:
-                    animation_key = k
-                    break
+            animation_element = etree.Element("animation")
 
-            animation_element.set("key", animation_key)
+            animation_element.set("key", animation.key)
 
             for f in animation.frames:
                 frame_element = etree.Element("frame")
@@ -822,6 +1214,31 @@ class Parser(object):
             animation_sequence_element.append(animation_element)
         return animation_set_element
 
+    @classmethod
+    def animation_from_element(cls, e):
+        """an animation element of str_animation read back"""
+        animation = Animation()
+        animation.key = e.get('key')
+        for f in e.findall('frame'):
+            animation.appendFrame(int(f.get('index')),
+                                  float(f.get('sx')), float(f.get('sy')),
+                                  float(f.get('wx')), float(f.get('wy')),
+                                  float(f.get('tx')), float(f.get('ty')),
+                                  json.loads(f.get('ctf')),
+                                  f.get('visible') == 'True')
+        return animation
+
+    def _sprite_animations(self, v):
+        all_symbols = []
+
+        for f in v.frames:
+            for p in f.places:
+                for s in p['symbols']:
+                    if s not in all_symbols:
+                        all_symbols.append(s)
+
+        return self._str_animation(all_symbols, v)
+
     def _str_animation(self, all_symbols, v):
         animations = {}
         for key in all_symbols:
@@ -900,6 +1317,45 @@ class Parser(object):
 
         @classmethod
         def make_shape_element(cls, shape, ctf, parent_key):
+            return cls.make_shape(shape, ctf, parent_key)[1]
+
+        @classmethod
+        def make_shape(cls, shape, ctf, parent_key):
+            # returns the gradient defs and the group of the shape, which
+            # are taken from render_shapes or looked up in the cache of
+            # the shape when it has one
+            rendered = getattr(shape, 'rendered', None)
+            if rendered is not None and len(ctf) == 0:
+                return cls.loads(rendered)
+
+            cache = getattr(shape, 'cache', None)
+            if cache is None:
+                return shape.defs, cls._make_group(shape, ctf, parent_key)
+
+            key = cache.make_key(shape, ctf, parent_key)
+            entry = cache.get(key)
+            if entry is None:
+                group = cls._make_group(shape, ctf, parent_key)
+                cache.put(key, shape.defs, group)
+                return shape.defs, group
+
+            if len(ctf) > 0:
+                ctf.pop(0)
+            return entry
+
+        @classmethod
+        def dumps(cls, defs, group):
+            """serializes what make_shape returns"""
+            return '<entry><defs>%s</defs>%s</entry>' % (''.join(etree.tostring(d, with_tail=False) for d in defs),
+                                                          etree.tostring(group, with_tail=False))
+
+        @classmethod
+        def loads(cls, data):
+            defs, group = etree.fromstring(data)
+            return list(defs), group
+
+        @classmethod
+        def _make_group(cls, shape, ctf, parent_key):
 
             group = etree.Element("g")
             group.set("id", shape.symbol + "shape")
@@ -918,16 +1374,15 @@ class Parser(object):
                             allpath.extend(path)
                             pathElm.set("stroke-width", str(e.lineWidths[i]))
                             pathElm.set("stroke", LUtil.rgb_to_hex(lineColor['l']))
-                    merged_allpath_list = cls._merge_path(allpath)
+                    merged_allpath_list = cls._merge_path(e, allpath)
 
-                    all_data = ""
+                    data = PathData(0 if shape.twips else 4)
 
                     for merged_allpath in merged_allpath_list:
-                        data = cls._path_data(merged_allpath)
-                        all_data += data
+                        cls._path_data(e, merged_allpath, data)
 
-                    if len(all_data) > 0:
-                        pathElm.set("d", all_data)
+                    if len(data) > 0:
+                        pathElm.set("d", data.getvalue())
                         group.append(pathElm)
 
                 # solid colors
@@ -944,7 +1399,7 @@ class Parser(object):
                     if len(path) > 0:
                         allpath.extend(path)
 
-                    merged_allpath_list = cls._merge_path(allpath)
+                    merged_allpath_list = cls._merge_path(e, allpath)
 
                     pathElm = Path()
                     clr = color['s']
@@ -966,14 +1421,13 @@ class Parser(object):
                     else:
                         pathElm.set("fill", clr)
 
-                    all_data = ""
+                    data = PathData(0 if shape.twips else 4)
 
                     for merged_allpath in merged_allpath_list:
-                        data = cls._path_data(merged_allpath)
-                        all_data += data
+                        cls._path_data(e, merged_allpath, data)
 
-                    if len(all_data) > 0:
-                        pathElm.set("d", all_data)
+                    if len(data) > 0:
+                        pathElm.set("d", data.getvalue())
                         group.append(pathElm)
 
             if len(ctf) > 0:
@@ -987,169 +1441,103 @@ class Parser(object):
             if path is None:
                 return []
 
-            cx = 0
-            cy = 0
-
-            devided_list = []
-            devided = None
-
-            for p in path:
-                if p['type'] == 'S':
-                    if devided is not None:
-                        devided_list.append(devided)
-
-                    devided = []
-
-                devided.append(p)
-
-            if devided is not None:
-                devided_list.append(devided)
-
-            result = []
-
-            for devided in devided_list:
-                for p in devided:
-
-                    if p['type'] == 'S':
-                        cx = p['x']
-                        cy = p['y']
-                    elif p['type'] == 'L':
-                        cx += p['x']
-                        cy += p['y']
-                    elif p['type'] == 'C':
-                        cx += p['x1'] + p['x2']
-                        cy += p['y1'] + p['y2']
-
-                result.append({'type': 'S', 'x': cx, 'y': cy})
-
-                for p in devided[::-1]:
-                    if p['type'] == 'L':
-                        result.append({'type': 'L',
-                                       'x': -p['x'], 'y': -p['y']})
-                        cx -= p['x']
-                        cy -= p['y']
-                    elif p['type'] == 'C':
-                        result.append({'type': 'C',
-                                       'x1': -p['x2'],
-                                       'y1': -p['y2'],
-                                       'x2': -p['x1'],
-                                       'y2': -p['y1']})
-
-                        cx -= p['x1'] + p['x2']
-                        cy -= p['y1'] + p['y2']
-
-            return result
+            return [(start, end, not reverse) for start, end, reverse in path]
 
         @classmethod
-        def _path_data(cls, edges):
-            data = ""
-
-            for edge in edges:
+        def _path_data(cls, edge, path, data=None):
+            # path is a list of (start, end, reverse) record ranges which
+            # are drawn as one contour from the beginning of the first one.
+            # the contour is appended to data, a PathData, when it is given
+            if data is None:
+                data = PathData()
+                cls._path_data(edge, path, data)
+                return data.getvalue()
+
+            if len(path) == 0:
+                return data
+
+            ops = edge.ops
+            c = edge.coords
+            stride = edge.STRIDE
+
+            data.move_to(*edge.begin(*path[0]))
+
+            for start, end, reverse in path:
+                if reverse:
+                    indices = xrange(end - 1, start, -1)
+                else:
+                    indices = xrange(start + 1, end)
 
-                if edge['type'] == 'S':
-                    data += "M%.4f %.4f " % (edge['x'], edge['y'])
+                for i in indices:
+                    j = i * stride
+                    op = ops[i]
 
-                if edge['type'] == 'L':
-                    data += "l%.4f %.4f " % (edge['x'], edge['y'])
+                    if op == edge.LINE:
+                        if reverse:
+                            data.line_to(-c[j], -c[j+1])
+                        else:
+                            data.line_to(c[j], c[j+1])
 
-                if edge['type'] == 'C':
-                    data += "q%.4f %.4f %.4f %.4f " % (edge['x1'], edge['y1'],
-                                              edge['x1'] + edge['x2'],
-                                              edge['y1'] + edge['y2'])
+                    elif op == edge.CURVE:
+                        if reverse:
+                            data.curve_to(-c[j+2], -c[j+3], -c[j], -c[j+1])
+                        else:
+                            data.curve_to(c[j], c[j+1], c[j+2], c[j+3])
 
             return data
 
         @classmethod
-        def _merge_path(cls, path):
-
-            def search_merge_path(sa, anchors, paths):
-                for ta, path in zip(anchors, paths):
-                    if(round(sa['end'][0],3) == round(ta['begin'][0],3) and
-                       round(sa['end'][1],3) == round(ta['begin'][1],3)):
-                        return ta, path
-                return None, None
-
-
-            devided_list = []
-            devided = None
-
-            for p in path:
-                if p['type'] == 'S':
-                    if devided is not None:
-                        devided_list.append(devided)
+        def _merge_path(cls, edge, path):
+            # chains sub-paths whose start point matches the end point of
+            # the previous one. sub-paths are looked up by their start point
+            # rounded to 3 decimals, and a start point shared by several of
+            # them resolves to the earliest one, as a linear search would.
 
-                    devided = []
+            def anchor_key(point):
+                return round(point[0], 3), round(point[1], 3)
 
-                devided.append(p)
-
-            if devided is not None:
-                devided_list.append(devided)
-
-            anchors = []
-
-            for devided in devided_list:
-                begin = (devided[0]['x'], devided[0]['y'])
-
-                ex = 0.0
-                ey = 0.0
-
-                for p in devided:
-                    if p['type'] == 'S':
-                        ex = p['x']
-                        ey = p['y']
-                    elif p['type'] == 'L':
-                        ex += p['x']
-                        ey += p['y']
-                    elif p['type'] == 'C':
-                        ex += p['x1'] + p['x2']
-                        ey += p['y1'] + p['y2']
-
-                end = (ex, ey)
+            count = len(path)
+            if count <= 0:
+                return []
 
-                anchors.append({'begin': begin, 'end': end})
+            ends = [anchor_key(edge.end(*devided)) for devided in path]
 
-            if len(devided_list) <= 0:
-                return []
+            begins = {}
+            for i in xrange(count - 1):
+                key = anchor_key(edge.begin(*path[i]))
+                if key in begins:
+                    begins[key].append(i)
+                else:
+                    begins[key] = deque([i])
 
-            results = []
-            result = [devided_list.pop()]
-            results.append(result)
+            merged = [False] * count
+            first = 0
 
-            result_anchors = [anchors.pop()]
+            current = count - 1
+            merged[current] = True
 
-            while len(devided_list) > 0:
-                next_anchor, next_path = search_merge_path(result_anchors[-1],
-                                                           anchors, devided_list)
+            result = [path[current]]
+            results = [result]
 
-                if next_path is not None:
-                    result.append(next_path)
-                    result_anchors.append(next_anchor)
+            for n in xrange(count - 1):
+                candidates = begins.get(ends[current])
+                while candidates and merged[candidates[0]]:
+                    candidates.popleft()
 
-                    devided_list.remove(next_path)
-                    anchors.remove(next_anchor)
+                if candidates:
+                    current = candidates.popleft()
                 else:
+                    while merged[first]:
+                        first += 1
+                    current = first
+
                     result = []
                     results.append(result)
 
-                    result.append(devided_list[0])
-                    result_anchors.append(anchors[0])
-
-                    devided_list.remove(devided_list[0])
-                    anchors.remove(anchors[0])
-
-            merged_list = []
-
-            for result in results:
-                merged = []
-                merged.append(result[0][0])
-                merged_list.append(merged)
+                merged[current] = True
+                result.append(path[current])
 
-                for r in result:
-                    for p in r:
-                        if p['type'] != 'S':
-                            merged.append(p)
-
-            return merged_list
+            return results
 
 
 
@@ -1161,6 +1549,12 @@ class PUtil(object):
             return float(twips[0])/20
         return [float(t)/20 if t is not None else None for t in twips]
 
+    @staticmethod
+    def get_twip_vals(*twips):
+        if len(twips) == 1:
+            return int(twips[0])
+        return [int(t) if t is not None else None for t in twips]
+
     @staticmethod
     def convert_color_as_tuple(elm):
         alpha = elm.get('alpha')
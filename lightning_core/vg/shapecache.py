@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import os
+import os.path
+import errno
+import hashlib
+import tempfile
+from lxml import etree
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# part of every key, and of the dependencies written by SvgBuilder.save.
+# bump it with every change to the svg ShapeMaker renders, such as the
+# path encoding or the twips coordinates, so that entries written by an
+# earlier build are not served
+VERSION = '1.1.0'
+
+class ShapeCache(object):
+    """rendered shapes kept in a directory.
+
+    an entry holds the svg group of a shape and its gradient defs, and is
+    keyed by the canonical DefineShape element of the shape, the color
+    transforms it is rendered with and VERSION. entries are written
+    atomically, so several processes can share a directory. the least
+    recently used entries are removed when the directory grows over
+    max_bytes.
+    """
+
+    SUFFIX = '.xml'
+    LOCK = 'lock'
+
+    def __init__(self, path, max_bytes=64*1024*1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._written = 0
+        if not os.path.exists(path):
+            try:
+                os.makedirs(path)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    @staticmethod
+    def digest(e):
+        """content hash of a definition element"""
+        return hashlib.sha1(etree.tostring(e, method='c14n')).hexdigest()
+
+    def make_key(self, shape, ctf, parent_key):
+        m = hashlib.sha1()
+        m.update(VERSION)
+        m.update('\0')
+        m.update(shape.digest)
+        if shape.twips:
+            m.update('\0twips')
+        if len(ctf) > 0:
+            # the parent key only matters when colors are transformed
+            m.update('\0')
+            m.update(repr(ctf))
+            m.update('\0')
+            m.update(parent_key)
+        return m.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key + self.SUFFIX)
+
+    def get(self, key):
+        """returns the defs and the group stored for key, or None"""
+        filepath = self._get_path(key)
+        try:
+            with open(filepath, 'rb') as fp:
+                entry = etree.fromstring(fp.read())
+            os.utime(filepath, None)
+        except (IOError, OSError):
+            return None
+        except etree.XMLSyntaxError:
+            self._remove(filepath)
+            return None
+
+        if len(entry) != 2:
+            self._remove(filepath)
+            return None
+        defs, group = entry
+        return list(defs), group
+
+    def put(self, key, defs, group):
+        data = '<entry><defs>%s</defs>%s</entry>' % (''.join(etree.tostring(d, with_tail=False) for d in defs),
+                                                      etree.tostring(group, with_tail=False))
+
+        filepath = self._get_path(key)
+        dirname = os.path.dirname(filepath)
+        try:
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, temppath = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.rename(temppath, filepath)
+        except OSError:
+            # another process has just written the same entry
+            self._remove(temppath)
+
+        self._written += len(data)
+        if self._written >= self.max_bytes / 8:
+            self.evict()
+
+    def evict(self):
+        """removes the least recently used entries until the total size
+        fits in max_bytes"""
+        self._written = 0
+        with _Lock(os.path.join(self.path, self.LOCK)) as locked:
+            if not locked:
+                # someone else is evicting
+                return
+
+            entries = []
+            total = 0
+            for dirpath, dirnames, filenames in os.walk(self.path):
+                for filename in filenames:
+                    if not filename.endswith(self.SUFFIX):
+                        continue
+                    filepath = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(filepath)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, filepath))
+                    total += st.st_size
+
+            entries.sort()
+            for mtime, size, filepath in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(filepath)
+                total -= size
+
+    def _remove(self, filepath):
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+class _Lock(object):
+    """non-blocking exclusive lock on a file, always taken without fcntl"""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.fp = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        self.fp = open(self.filepath, 'a')
+        try:
+            fcntl.flock(self.fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self.fp.close()
+            self.fp = None
+            return False
+        return True
+
+    def __exit__(self, *args):
+        if self.fp is not None:
+            fcntl.flock(self.fp.fileno(), fcntl.LOCK_UN)
+            self.fp.close()
+            self.fp = None
+        return False
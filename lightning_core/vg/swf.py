@@ -21,6 +21,8 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import hashlib
+from array import array
+from lxml import etree
 from vg import Transform, Rect
 from lightningutil import LUtil
 
@@ -103,6 +105,7 @@ class Sprite(object):
     def __init__(self):
         self.symbol = ""
         self.frames = []
+        self.digest = None
 
     def addFrame(self, frame):
         self.frames.append(frame)
@@ -121,15 +124,163 @@ class Sprite(object):
     def __len__(self):
         return len(self.frames)
 
+    def get_digest(self):
+        """content hash of the frames, computed on first use"""
+        if self.digest is None:
+            m = hashlib.sha1()
+            for f in self.frames:
+                m.update('\0%d' % len(f))
+                for p in f.places:
+                    m.update(repr(sorted(p.items().iteritems())))
+            self.digest = m.hexdigest()
+        return self.digest
+
+    def get_placed_ids(self):
+        """objectIDs of the definitions placed in the frames"""
+        ids = set()
+        for f in self.frames:
+            for p in f.places:
+                for s in p['symbols']:
+                    ids.add(LUtil.objectID_from_key(s)[3:])
+        return sorted(ids)
+
 class Edge(object):
 
+    # record types
+    SETUP = 0
+    LINE  = 1
+    CURVE = 2
+
+    TYPES = ('S', 'L', 'C')
+
+    # coordinates per record, (x, y) for SETUP and LINE, (x1, y1, x2, y2) for CURVE
+    STRIDE = 4
+
+    # style index of a SETUP record which keeps the current style
+    KEEP = -2
+
     def __init__(self):
         self.colors = []
-        self.values = []
         self.lineWidths = []
 
+        self.ops = array('b')
+        self.coords = array('d')
+        self.fill_left = array('i')
+        self.fill_right = array('i')
+        self.line_style = array('i')
+
+        self._index = None
+
+    def __len__(self):
+        return len(self.ops)
+
     def add(self, val):
-        self.values.append(val)
+        t = val['type']
+        if t == 'S':
+            self.add_setup(val.get('x', 0.0), val.get('y', 0.0),
+                           val.get('fl'), val.get('fr'), val.get('ln'))
+        elif t == 'L':
+            self.add_line_to(val['x'], val['y'])
+        elif t == 'C':
+            self.add_curve_to(val['x1'], val['y1'], val['x2'], val['y2'])
+
+    def add_setup(self, x, y, fl=None, fr=None, ln=None):
+        self._add_record(self.SETUP, x, y, 0.0, 0.0)
+        self.fill_left[-1] = self._style_index(fl)
+        self.fill_right[-1] = self._style_index(fr)
+        self.line_style[-1] = self._style_index(ln)
+
+    def add_line_to(self, x, y):
+        self._add_record(self.LINE, x, y, 0.0, 0.0)
+
+    def add_curve_to(self, x1, y1, x2, y2):
+        self._add_record(self.CURVE, x1, y1, x2, y2)
+
+    def _add_record(self, op, a, b, c, d):
+        self.ops.append(op)
+        self.coords.extend((a, b, c, d))
+        self.fill_left.append(self.KEEP)
+        self.fill_right.append(self.KEEP)
+        self.line_style.append(self.KEEP)
+        self._index = None
+
+    def _style_index(self, index):
+        if index is None:
+            return self.KEEP
+        return index
+
+    def _style_value(self, index):
+        if index == self.KEEP:
+            return None
+        return index
+
+    def record(self, i, reverse=False):
+        j = i * self.STRIDE
+        c = self.coords
+        op = self.ops[i]
+        if op == self.SETUP:
+            return {'type': 'S', 'x': c[j], 'y': c[j+1],
+                    'fl': self._style_value(self.fill_left[i]),
+                    'fr': self._style_value(self.fill_right[i]),
+                    'ln': self._style_value(self.line_style[i])}
+        elif op == self.LINE:
+            if reverse:
+                return {'type': 'L', 'x': -c[j], 'y': -c[j+1]}
+            return {'type': 'L', 'x': c[j], 'y': c[j+1]}
+        else:
+            if reverse:
+                return {'type': 'C', 'x1': -c[j+2], 'y1': -c[j+3], 'x2': -c[j], 'y2': -c[j+1]}
+            return {'type': 'C', 'x1': c[j], 'y1': c[j+1], 'x2': c[j+2], 'y2': c[j+3]}
+
+    def _get_values(self):
+        return [self.record(i) for i in xrange(len(self.ops))]
+    values = property(_get_values)
+
+    def segment_values(self, start, end, reverse=False):
+        """records of a sub-path as dicts, mainly for debugging"""
+        if not reverse:
+            return [self.record(i) for i in xrange(start, end)]
+        x, y = self.begin(start, end, reverse)
+        return [{'type': 'S', 'x': x, 'y': y}] + [self.record(i, True) for i in xrange(end - 1, start, -1)]
+
+    def begin(self, start, end, reverse=False):
+        if reverse:
+            return self._forward_end(start, end)
+        j = start * self.STRIDE
+        return self.coords[j], self.coords[j+1]
+
+    def end(self, start, end, reverse=False):
+        x, y = self._forward_end(start, end)
+        if not reverse:
+            return x, y
+
+        ops = self.ops
+        c = self.coords
+        for i in xrange(end - 1, start, -1):
+            j = i * self.STRIDE
+            if ops[i] == self.LINE:
+                x += -c[j]
+                y += -c[j+1]
+            elif ops[i] == self.CURVE:
+                x += -c[j+2] + -c[j]
+                y += -c[j+3] + -c[j+1]
+        return x, y
+
+    def _forward_end(self, start, end):
+        ops = self.ops
+        c = self.coords
+        j = start * self.STRIDE
+        x = c[j]
+        y = c[j+1]
+        for i in xrange(start + 1, end):
+            j = i * self.STRIDE
+            if ops[i] == self.LINE:
+                x += c[j]
+                y += c[j+1]
+            elif ops[i] == self.CURVE:
+                x += c[j] + c[j+2]
+                y += c[j+1] + c[j+3]
+        return x, y
 
     def add_colors(self, category, colors):
         self.colors = self.colors + map(lambda ar: {category:ar},colors)
@@ -143,32 +294,41 @@ class Edge(object):
             if c.keys()[0] == category:
                 result.append(c)
         return result
-                
 
-    def get_path(self, index, style):
-        result = []
+    def build_index(self):
+        """maps every style index to its sub-paths in one pass over the records"""
+        index = {'left': {}, 'right': {}, 'line': {}}
+        columns = (('left', self.fill_left), ('right', self.fill_right), ('line', self.line_style))
+        current = {'left': None, 'right': None, 'line': None}
 
-        contain = False
+        ops = self.ops
+        start = None
 
-        if style == 'left':
-            key = 'fl'
-        elif style == 'right':
-            key = 'fr'
-        elif style == 'line':
-            key = 'ln'
+        for i in xrange(len(ops) + 1):
+            if i < len(ops) and ops[i] != self.SETUP:
+                continue
 
-        for v in self.values:
-            if v['type'] == 'S':
-                if v[key] is not None:
-                    if v[key] == index:
-                        contain = True
-                    else:
-                        contain = False
+            if start is not None:
+                for style, styles in columns:
+                    if current[style] is not None:
+                        index[style].setdefault(current[style], []).append((start, i, False))
 
-            if contain:
-                    result.append(v)
+            if i == len(ops):
+                break
 
-        return result
+            for style, styles in columns:
+                if styles[i] != self.KEEP:
+                    current[style] = styles[i]
+            start = i
+
+        self._index = index
+        return index
+
+    def get_path(self, index, style):
+        """sub-paths drawn with the style as (start, end, reverse) record ranges"""
+        if self._index is None:
+            self.build_index()
+        return self._index[style].get(index, [])
 
 
 class Shape(Rect):
@@ -178,6 +338,11 @@ class Shape(Rect):
         self.name = ""
         self.edges = []
         self.defs = []
+        self.digest = None
+        self.cache = None
+        self.rendered = None
+        # coordinates in twips instead of pixels
+        self.twips = False
         # self.offsetX = 0
         # self.offsetY = 0
         # self.color = (0, 0, 0)
@@ -188,11 +353,32 @@ class Shape(Rect):
         self.edges.append(edge)
 
     def generate_name(self):
+        """content hash of the bounds, edges and styles.
+
+        the symbol and the gradient ids made from it are left out, so
+        shapes which are drawn the same get the same name.
+        """
+        gradients = dict(('url(#%s)' % d.get('id'), d) for d in self.defs)
+
         m = hashlib.sha1()
-        m.update(self.symbol)
-        # dump = [json.dumps(e) for p in self.edges for e in p.values]
-        # m.update(''.join(str(i) for i in dump))
+        m.update(repr((self.left, self.top, self.right, self.bottom)))
+        if self.twips:
+            m.update('\0twips')
+        for edge in self.edges:
+            m.update('\0%d' % len(edge))
+            for a in (edge.ops, edge.coords, edge.fill_left, edge.fill_right, edge.line_style):
+                m.update(a.tostring())
+            for c in edge.colors:
+                category, color = c.items()[0]
+                if color in gradients:
+                    color = self._gradient_content(gradients[color])
+                m.update(repr((category, color)))
+            m.update(repr(edge.lineWidths))
         return m.hexdigest()
 
+    def _gradient_content(self, gradient):
+        attrib = sorted((k, v) for k, v in gradient.attrib.iteritems() if k != 'id')
+        return repr(attrib) + ''.join(etree.tostring(stop, with_tail=False) for stop in gradient)
+
 
 
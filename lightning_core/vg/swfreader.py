@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2011 Geisha Tokyo Entertainment, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN
+# AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import with_statement
+import struct
+import zlib
+from lxml import etree
+
+# reads the swf tag stream directly, without going through swfmill.
+# every tag the parser is interested in is decoded into a small element
+# shaped like swfmill's output for that tag only, so Parser can feed it
+# to the same _proc_* methods it uses for swfmill xml.
+
+class SwfFormatError(Exception):
+    pass
+
+class BitReader(object):
+
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+        self.bitbuf = 0
+        self.bitcount = 0
+
+    def align(self):
+        self.bitbuf = 0
+        self.bitcount = 0
+
+    def _unpack(self, fmt, size):
+        self.align()
+        if self.pos + size > len(self.data):
+            raise SwfFormatError('unexpected end of data')
+        v = struct.unpack_from(fmt, self.data, self.pos)[0]
+        self.pos += size
+        return v
+
+    def u8(self):
+        return self._unpack('<B', 1)
+
+    def u16(self):
+        return self._unpack('<H', 2)
+
+    def s16(self):
+        return self._unpack('<h', 2)
+
+    def u32(self):
+        return self._unpack('<I', 4)
+
+    def string(self):
+        self.align()
+        end = self.data.find('\0', self.pos)
+        if end < 0:
+            raise SwfFormatError('unterminated string')
+        s = self.data[self.pos:end]
+        self.pos = end + 1
+        return s
+
+    def ubits(self, n):
+        while self.bitcount < n:
+            if self.pos >= len(self.data):
+                raise SwfFormatError('unexpected end of data')
+            self.bitbuf = (self.bitbuf << 8) | ord(self.data[self.pos])
+            self.pos += 1
+            self.bitcount += 8
+        self.bitcount -= n
+        v = (self.bitbuf >> self.bitcount) & ((1 << n) - 1)
+        self.bitbuf &= (1 << self.bitcount) - 1
+        return v
+
+    def sbits(self, n):
+        if n == 0:
+            return 0
+        v = self.ubits(n)
+        if v & (1 << (n - 1)):
+            v -= 1 << n
+        return v
+
+    def fbits(self, n):
+        return self.sbits(n) / 65536.0
+
+class SwfReader(object):
+
+    SIGNATURES = ('FWS', 'CWS', 'ZWS')
+
+    TAG_NAMES = {0 : 'End',
+                 1 : 'ShowFrame',
+                 2 : 'DefineShape',
+                 12: 'DoAction',
+                 22: 'DefineShape2',
+                 26: 'PlaceObject2',
+                 28: 'RemoveObject2',
+                 32: 'DefineShape3',
+                 39: 'DefineSprite',
+                 83: 'DefineShape4'}
+
+    def __init__(self, swffile):
+        if isinstance(swffile, basestring):
+            with open(swffile, 'rb') as f:
+                data = f.read()
+        else:
+            data = swffile.read()
+        self._read_header(data)
+
+    @classmethod
+    def is_swf(cls, src):
+        if isinstance(src, basestring):
+            with open(src, 'rb') as f:
+                return f.read(3) in cls.SIGNATURES
+        try:
+            pos = src.tell()
+            signature = src.read(3)
+            src.seek(pos)
+        except (AttributeError, IOError):
+            return False
+        return signature in cls.SIGNATURES
+
+    def _read_header(self, data):
+        signature = data[:3]
+        if signature not in self.SIGNATURES:
+            raise SwfFormatError('not a swf file')
+        if signature == 'ZWS':
+            raise SwfFormatError('lzma compressed swf is not supported')
+
+        self.version = ord(data[3])
+        self.compressed = signature == 'CWS'
+        if self.compressed:
+            data = data[:8] + zlib.decompress(data[8:])
+        self.data = data
+
+        r = BitReader(data, 8)
+        self.size = self._rect(r)
+        self.frame_rate = r.u16() / 256.0
+        self.frame_count = r.u16()
+        self.tags_pos = r.pos
+
+    def tags(self):
+        return self._tags(self.data, self.tags_pos, len(self.data))
+
+    def _tags(self, data, pos, end):
+        while pos + 2 <= end:
+            code_and_length = struct.unpack_from('<H', data, pos)[0]
+            pos += 2
+            code = code_and_length >> 6
+            length = code_and_length & 0x3f
+            if length == 0x3f:
+                length = struct.unpack_from('<I', data, pos)[0]
+                pos += 4
+            body = BitReader(data[pos:pos + length])
+            pos += length
+
+            e = self._tag(code, body)
+            if e is not None:
+                yield e
+            if code == 0:
+                break
+
+    def _tag(self, code, r):
+        name = self.TAG_NAMES.get(code)
+        if name is None or name == 'End':
+            return None
+        if name.startswith('DefineShape'):
+            return self._define_shape(name, r)
+        if name == 'DefineSprite':
+            return self._define_sprite(r)
+        if name == 'PlaceObject2':
+            return self._place_object2(r)
+        e = etree.Element(name)
+        if name == 'RemoveObject2':
+            e.set('depth', str(r.u16()))
+        return e
+
+    # tags
+    def _define_shape(self, name, r):
+        e = etree.Element(name)
+        e.set('objectID', str(r.u16()))
+        self._rect(r, etree.SubElement(e, 'bounds'))
+
+        level = int(name[-1]) if name[-1].isdigit() else 1
+        if level >= 4:
+            self._rect(r, etree.SubElement(e, 'strokeBounds'))
+            r.u8() # reserved and stroke flags
+
+        styles = etree.SubElement(e, 'styles')
+        self._style_list(r, level, styles)
+        num_fill_bits = r.ubits(4)
+        num_line_bits = r.ubits(4)
+
+        edges = etree.SubElement(etree.SubElement(etree.SubElement(e, 'shapes'), 'Shape'), 'edges')
+        self._shape_records(r, level, num_fill_bits, num_line_bits, edges)
+        return e
+
+    def _define_sprite(self, r):
+        e = etree.Element('DefineSprite')
+        e.set('objectID', str(r.u16()))
+        e.set('frames', str(r.u16()))
+        tags = etree.SubElement(e, 'tags')
+        for t in self._tags(r.data, r.pos, len(r.data)):
+            tags.append(t)
+        return e
+
+    def _place_object2(self, r):
+        e = etree.Element('PlaceObject2')
+        flags = r.u8()
+        e.set('replace', str(flags & 0x01))
+        e.set('depth', str(r.u16()))
+        if flags & 0x02:
+            e.set('objectID', str(r.u16()))
+        if flags & 0x04:
+            self._matrix(r, etree.SubElement(e, 'transform'))
+        if flags & 0x08:
+            self._cxform_with_alpha(r, etree.SubElement(e, 'colorTransform'))
+        if flags & 0x10:
+            e.set('morph', str(r.u16()))
+        if flags & 0x20:
+            e.set('name', r.string().decode('utf-8', 'replace'))
+        if flags & 0x40:
+            e.set('clipDepth', str(r.u16()))
+        return e
+
+    # shape records
+    def _shape_records(self, r, level, num_fill_bits, num_line_bits, edges):
+        while True:
+            if r.ubits(1) == 0:
+                flags = r.ubits(5)
+                setup = etree.SubElement(edges, 'ShapeSetup')
+                if flags == 0:
+                    break
+                if flags & 0x01:
+                    nbits = r.ubits(5)
+                    setup.set('x', str(r.sbits(nbits)))
+                    setup.set('y', str(r.sbits(nbits)))
+                if flags & 0x02:
+                    setup.set('fillStyle0', str(r.ubits(num_fill_bits)))
+                if flags & 0x04:
+                    setup.set('fillStyle1', str(r.ubits(num_fill_bits)))
+                if flags & 0x08:
+                    setup.set('lineStyle', str(r.ubits(num_line_bits)))
+                if flags & 0x10:
+                    self._style_list(r, level, etree.SubElement(setup, 'styles'))
+                    num_fill_bits = r.ubits(4)
+                    num_line_bits = r.ubits(4)
+            elif r.ubits(1) == 1:
+                nbits = r.ubits(4) + 2
+                if r.ubits(1) == 1:
+                    x = r.sbits(nbits)
+                    y = r.sbits(nbits)
+                elif r.ubits(1) == 1:
+                    x = 0
+                    y = r.sbits(nbits)
+                else:
+                    x = r.sbits(nbits)
+                    y = 0
+                line = etree.SubElement(edges, 'LineTo')
+                line.set('x', str(x))
+                line.set('y', str(y))
+            else:
+                nbits = r.ubits(4) + 2
+                curve = etree.SubElement(edges, 'CurveTo')
+                for k in ('x1', 'y1', 'x2', 'y2'):
+                    curve.set(k, str(r.sbits(nbits)))
+
+    def _style_list(self, r, level, styles):
+        style_list = etree.SubElement(styles, 'StyleList')
+
+        fill_styles = etree.SubElement(style_list, 'fillStyles')
+        for i in xrange(self._style_count(r, level)):
+            self._fill_style(r, level, fill_styles)
+
+        line_styles = etree.SubElement(style_list, 'lineStyles')
+        for i in xrange(self._style_count(r, level)):
+            self._line_style(r, level, line_styles)
+
+    def _style_count(self, r, level):
+        count = r.u8()
+        if count == 0xff and level >= 2:
+            count = r.u16()
+        return count
+
+    def _fill_style(self, r, level, parent):
+        fill_type = r.u8()
+        if fill_type == 0x00:
+            self._color(r, level >= 3, etree.SubElement(etree.SubElement(parent, 'Solid'), 'color'))
+        elif fill_type in (0x10, 0x12, 0x13):
+            names = {0x10: 'LinearGradient', 0x12: 'RadialGradient', 0x13: 'ShiftedRadialGradient'}
+            e = etree.SubElement(parent, names[fill_type])
+            self._matrix(r, etree.SubElement(e, 'matrix'))
+            self._gradient(r, level, e)
+            if fill_type == 0x13:
+                e.set('shift', repr(r.s16() / 256.0))
+        elif fill_type in (0x40, 0x41, 0x42, 0x43):
+            names = {0x40: 'TiledBitmap', 0x41: 'ClippedBitmap',
+                     0x42: 'TiledBitmap', 0x43: 'ClippedBitmap'}
+            e = etree.SubElement(parent, names[fill_type])
+            e.set('objectID', str(r.u16()))
+            self._matrix(r, etree.SubElement(e, 'matrix'))
+        else:
+            raise SwfFormatError('unknown fill style type 0x%02x' % fill_type)
+
+    def _gradient(self, r, level, e):
+        flags = r.u8()
+        if level >= 4:
+            e.set('spreadMode', str(flags >> 6))
+            e.set('interpolationMode', str((flags >> 4) & 0x03))
+        colors = etree.SubElement(e, 'gradientColors')
+        for i in xrange(flags & 0x0f):
+            item = etree.SubElement(colors, 'GradientItem')
+            item.set('position', str(r.u8()))
+            self._color(r, level >= 3, etree.SubElement(item, 'color'))
+
+    def _line_style(self, r, level, parent):
+        e = etree.SubElement(parent, 'LineStyle')
+        e.set('width', str(r.u16()))
+        if level < 4:
+            self._color(r, level >= 3, etree.SubElement(e, 'color'))
+            return
+
+        r.ubits(2) # start cap style
+        join_style = r.ubits(2)
+        has_fill = r.ubits(1)
+        r.ubits(11) # scaling, hinting, no close and end cap style
+        if join_style == 2:
+            e.set('miterLimitFactor', repr(r.u16() / 256.0))
+        if has_fill:
+            self._fill_style(r, level, etree.SubElement(e, 'fillStyles'))
+        else:
+            self._color(r, True, etree.SubElement(e, 'color'))
+
+    # basic types
+    def _rect(self, r, parent=None):
+        e = etree.Element('Rectangle')
+        nbits = r.ubits(5)
+        for k in ('left', 'right', 'top', 'bottom'):
+            e.set(k, str(r.sbits(nbits)))
+        r.align()
+        if parent is not None:
+            parent.append(e)
+        return e
+
+    def _color(self, r, has_alpha, parent):
+        e = etree.SubElement(parent, 'Color')
+        e.set('red', str(r.u8()))
+        e.set('green', str(r.u8()))
+        e.set('blue', str(r.u8()))
+        if has_alpha:
+            e.set('alpha', str(r.u8()))
+        return e
+
+    def _matrix(self, r, parent):
+        e = etree.SubElement(parent, 'Transform')
+        if r.ubits(1) == 1:
+            nbits = r.ubits(5)
+            e.set('scaleX', repr(r.fbits(nbits)))
+            e.set('scaleY', repr(r.fbits(nbits)))
+        if r.ubits(1) == 1:
+            nbits = r.ubits(5)
+            e.set('skewX', repr(r.fbits(nbits)))
+            e.set('skewY', repr(r.fbits(nbits)))
+        nbits = r.ubits(5)
+        e.set('transX', str(r.sbits(nbits)))
+        e.set('transY', str(r.sbits(nbits)))
+        r.align()
+        return e
+
+    def _cxform_with_alpha(self, r, parent):
+        e = etree.SubElement(parent, 'ColorTransform2')
+        has_offset = r.ubits(1)
+        has_factor = r.ubits(1)
+        nbits = r.ubits(4)
+        colors = ('Red', 'Green', 'Blue', 'Alpha')
+        if has_factor:
+            for c in colors:
+                e.set('factor' + c, str(r.sbits(nbits)))
+        if has_offset:
+            for c in colors:
+                e.set('offset' + c, str(r.sbits(nbits)))
+        r.align()
+        return e
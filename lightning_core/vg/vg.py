@@ -108,22 +108,115 @@ class Path(etree.ElementBase):
             self.set('stroke-opacity','undefined')
             self.set('fill', 'none')
 
+class PathData(object):
+    """d attribute of a path.
+
+    numbers are written in their shortest form at the given precision,
+    separators and repeated command letters are left out, and every
+    segment is written in whichever of its relative and absolute forms
+    is shorter.
+    """
+
+    # command repeated by coordinates following a command
+    IMPLICIT = {'M': 'L', 'm': 'l'}
+
+    def __init__(self, precision=4):
+        self.precision = precision
+        self.buf = []
+        self.command = None
+        self.last = ''
+        self.x = 0.0
+        self.y = 0.0
+
+    def __len__(self):
+        return len(self.buf)
+
+    def getvalue(self):
+        return ''.join(self.buf)
+
+    def number(self, v):
+        return LUtil.shortest_number(v, self.precision)
+
+    def move_to(self, x, y):
+        if len(self.buf) == 0:
+            absolute = self._encode('M', [self.number(x), self.number(y)])
+            self._write('M', absolute)
+        else:
+            self._write_shorter('m', [x - self.x, y - self.y], 'M', [x, y])
+        self.x = x
+        self.y = y
+
+    def line_to(self, dx, dy):
+        x = self.x + dx
+        y = self.y + dy
+        self._write_shorter('l', [dx, dy], 'L', [x, y])
+        self.x = x
+        self.y = y
+
+    def curve_to(self, x1, y1, x2, y2):
+        # control point and anchor are relative to the previous point as in swf
+        cx = self.x + x1
+        cy = self.y + y1
+        x = cx + x2
+        y = cy + y2
+        self._write_shorter('q', [x1, y1, x1 + x2, y1 + y2], 'Q', [cx, cy, x, y])
+        self.x = x
+        self.y = y
+
+    def _write_shorter(self, relative_command, relative, absolute_command, absolute):
+        relative = self._encode(relative_command, [self.number(v) for v in relative])
+        absolute = self._encode(absolute_command, [self.number(v) for v in absolute])
+        if len(absolute[0]) < len(relative[0]):
+            self._write(absolute_command, absolute)
+        else:
+            self._write(relative_command, relative)
+
+    def _encode(self, command, values):
+        if command == self.command:
+            parts = [self._separator(self.last, values[0]), values[0]]
+        else:
+            parts = [command, values[0]]
+        for prev, v in zip(values, values[1:]):
+            parts.append(self._separator(prev, v))
+            parts.append(v)
+        return ''.join(parts), values[-1]
+
+    def _separator(self, prev, v):
+        if v[0] == '-' or (v[0] == '.' and '.' in prev):
+            return ''
+        return ' '
+
+    def _write(self, command, encoded):
+        data, last = encoded
+        self.buf.append(data)
+        self.command = self.IMPLICIT.get(command, command)
+        self.last = last
+
 class LinearGradient(etree.ElementBase):
-    def __init__(self, objectId, gtf, stops, attrib=None, nsmap=None,  **_extra):
+    def __init__(self, objectId, gtf, stops, twips=False, attrib=None, nsmap=None,  **_extra):
         super(LinearGradient, self).__init__(attrib=None, nsmap=None, **_extra)
         self.tag = 'linearGradient'
         self.set('gradientUnits', 'userSpaceOnUse')
-        # why 16384/20, see swf specification
-        self.set('x1', '-819')
-        self.set('x2',  '819')
         self.set('id', objectId)
-        self.set('gradientTransform', 'matrix(%.2f %.2f %.2f %.2f %.4f %.4f)' % self._make_gradient(gtf))
+        if twips:
+            # see swf specification
+            self.set('x1', '-16384')
+            self.set('x2',  '16384')
+            self.set('gradientTransform', 'matrix(%.2f %.2f %.2f %.2f %s %s)' % self._make_gradient(gtf, twips))
+        else:
+            # why 16384/20, see swf specification
+            self.set('x1', '-819')
+            self.set('x2',  '819')
+            self.set('gradientTransform', 'matrix(%.2f %.2f %.2f %.2f %.4f %.4f)' % self._make_gradient(gtf))
         for stop in stops:
             self.append(stop)
 
-    def _make_gradient(self, gtf):
+    def _make_gradient(self, gtf, twips=False):
         transform = Transform()
         transform.set_items(dict(zip(transform.MATRIX, LUtil.get_transform_matrix(gtf))))
+        if twips:
+            return (transform.sx, transform.wx, transform.wy, transform.sy,
+                    LUtil.shortest_number(transform.tx, 0), LUtil.shortest_number(transform.ty, 0))
         return transform.get_matrix()
 
 
@@ -168,6 +261,31 @@ class Tree(Transform):
         self.children = []
         self.parent = None
 
+    def iter(self):
+        """this tree and its descendants in pre-order"""
+        stack = [self]
+        while len(stack) > 0:
+            tree = stack.pop()
+            yield tree
+            stack.extend(reversed(tree.children))
+
+    def find(self, name):
+        """the first tree named name in pre-order, or None"""
+        for tree in self.iter():
+            if tree.name == name:
+                return tree
+        return None
+
+    def get_ancestors(self):
+        """trees from the root down to the parent of this one"""
+        ancestors = []
+        tree = self.parent
+        while tree is not None:
+            ancestors.append(tree)
+            tree = tree.parent
+        ancestors.reverse()
+        return ancestors
+
     def __str__(self):
 
         result = "key=%s" % self.key
@@ -199,6 +317,8 @@ class Animation(object):
 
         self.key = None
         self.frames = []
+        # element of an earlier str_animation written instead of the frames
+        self.element = None
 
     def appendFrame(self, index, sx, sy, wx, wy, tx, ty, ctf, visible=True):
         frame = AnimFrame()